@@ -5,7 +5,7 @@
 CREATE TABLE IF NOT EXISTS posts (
     id SERIAL PRIMARY KEY,
     user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-    parent_id INTEGER REFERENCES posts(id) ON DELETE CASCADE,
+    parent_id INTEGER CHECK (parent_id IS NULL OR parent_id = -1 OR parent_id > 0),  -- -1 for profile posts (see migrations.py)
     title TEXT NOT NULL,
     summary TEXT NOT NULL,
     body TEXT NOT NULL,
@@ -14,6 +14,8 @@ CREATE TABLE IF NOT EXISTS posts (
     timezone VARCHAR(50) NOT NULL,
     location_tag TEXT,
     ai_generated BOOLEAN NOT NULL DEFAULT FALSE,
+    template_name TEXT DEFAULT 'post',  -- See create_templates.py
+    child_count INTEGER NOT NULL DEFAULT 0,  -- Maintained by the post write paths
     embedding vector(768)  -- Using 768 dimensions for sentence-transformers
 );
 
@@ -22,6 +24,12 @@ CREATE INDEX IF NOT EXISTS idx_posts_user_id ON posts(user_id);
 CREATE INDEX IF NOT EXISTS idx_posts_parent_id ON posts(parent_id);
 CREATE INDEX IF NOT EXISTS idx_posts_created_at ON posts(created_at DESC);
 
+-- Keyset pagination for feeds: (created_at, id) cursors, newest first
+CREATE INDEX IF NOT EXISTS idx_posts_created_at_id ON posts(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_posts_parent_created_at_id ON posts(parent_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_posts_template_created_at_id ON posts(template_name, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_posts_user_created_at_id ON posts(user_id, created_at DESC, id DESC);
+
 -- Create vector similarity search index (HNSW for better performance)
 CREATE INDEX IF NOT EXISTS idx_posts_embedding ON posts
 USING hnsw (embedding vector_cosine_ops);
@@ -31,6 +39,7 @@ COMMENT ON TABLE posts IS 'User posts with vector embeddings for semantic search
 COMMENT ON COLUMN posts.id IS 'Unique post identifier';
 COMMENT ON COLUMN posts.user_id IS 'ID of user who created this post';
 COMMENT ON COLUMN posts.parent_id IS 'ID of parent post (NULL for root posts)';
+COMMENT ON COLUMN posts.child_count IS 'Number of posts whose parent_id is this post (denormalized)';
 COMMENT ON COLUMN posts.title IS 'Post title';
 COMMENT ON COLUMN posts.summary IS 'One-line post summary';
 COMMENT ON COLUMN posts.body IS 'Post body text (up to ~300 words)';
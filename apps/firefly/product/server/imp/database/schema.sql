@@ -8,18 +8,40 @@ CREATE EXTENSION IF NOT EXISTS vector;
 CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
     email VARCHAR(255) UNIQUE NOT NULL,
+    name TEXT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    device_ids TEXT[] DEFAULT ARRAY[]::TEXT[]
+    device_ids TEXT[] DEFAULT ARRAY[]::TEXT[],
+    apns_device_token TEXT,
+    invited_by INTEGER,  -- Inviter's users.id (ancestor_chain comes from migrations.py)
+    invited_at TIMESTAMP,
+    profile_complete BOOLEAN DEFAULT FALSE,
+    profile_completed_at TIMESTAMP
 );
 
 -- Create index on email for faster lookups
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 
+-- Post templates (see create_templates.py)
+CREATE TABLE IF NOT EXISTS templates (
+    name TEXT PRIMARY KEY,
+    placeholder_title TEXT NOT NULL,
+    placeholder_summary TEXT NOT NULL,
+    placeholder_body TEXT NOT NULL,
+    plural_name TEXT
+);
+
+INSERT INTO templates (name, placeholder_title, placeholder_summary, placeholder_body, plural_name)
+VALUES
+    ('post', 'Title', 'Summary', 'Body', 'posts'),
+    ('profile', 'name', 'mission', 'personal statement', 'profiles'),
+    ('query', 'query title', 'query', 'query details', 'queries')
+ON CONFLICT (name) DO NOTHING;
+
 -- Posts table with hierarchical structure and embeddings
 CREATE TABLE IF NOT EXISTS posts (
     id SERIAL PRIMARY KEY,
     user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-    parent_id INTEGER REFERENCES posts(id) ON DELETE CASCADE,
+    parent_id INTEGER CHECK (parent_id IS NULL OR parent_id = -1 OR parent_id > 0),  -- -1 for profile posts (see migrations.py)
     title TEXT NOT NULL,
     summary TEXT NOT NULL,
     body TEXT NOT NULL,
@@ -28,6 +50,8 @@ CREATE TABLE IF NOT EXISTS posts (
     timezone VARCHAR(50) NOT NULL,
     location_tag TEXT,
     ai_generated BOOLEAN NOT NULL DEFAULT FALSE,
+    template_name TEXT DEFAULT 'post',  -- See create_templates.py
+    child_count INTEGER NOT NULL DEFAULT 0,  -- Maintained by the post write paths
     embedding vector(768)  -- Using 768 dimensions for sentence-transformers
 );
 
@@ -36,6 +60,12 @@ CREATE INDEX IF NOT EXISTS idx_posts_user_id ON posts(user_id);
 CREATE INDEX IF NOT EXISTS idx_posts_parent_id ON posts(parent_id);
 CREATE INDEX IF NOT EXISTS idx_posts_created_at ON posts(created_at DESC);
 
+-- Keyset pagination for feeds: (created_at, id) cursors, newest first
+CREATE INDEX IF NOT EXISTS idx_posts_created_at_id ON posts(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_posts_parent_created_at_id ON posts(parent_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_posts_template_created_at_id ON posts(template_name, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_posts_user_created_at_id ON posts(user_id, created_at DESC, id DESC);
+
 -- Create vector similarity search index (HNSW for better performance)
 CREATE INDEX IF NOT EXISTS idx_posts_embedding ON posts
 USING hnsw (embedding vector_cosine_ops);
@@ -1,4 +1,4 @@
-from flask import Flask, render_template_string, jsonify, request, send_from_directory
+from flask import Flask, render_template_string, jsonify, request, send_from_directory, Response, stream_with_context
 import os
 import signal
 import random
@@ -8,7 +8,6 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from werkzeug.utils import secure_filename
 import uuid
-from db import db
 import sys
 import numpy as np
 import torch
@@ -16,10 +15,18 @@ import embeddings
 import logging
 import json
 import hashlib
-from anthropic import Anthropic
 import config  # Load .env file
+if os.getenv('DB_BACKEND', 'postgres') == 'sqlite':
+    from db_sqlite import db
+else:
+    from db import db
 import threading
 from apns_client import push_service
+from llm_breaker import llm_breaker, CircuitOpenError
+import llm_backend
+import event_stream
+from match_scheduler import MatchScheduler
+from feed_cursor import decode_cursor, next_cursor
 
 # Configure logging
 logging.basicConfig(
@@ -37,6 +44,21 @@ app = Flask(__name__)
 # LLM model for search re-ranking
 LLM_MODEL = "claude-3-5-haiku-20241022"
 
+# Upper bound on a single LLM call (the circuit breaker handles sustained slowness)
+LLM_TIMEOUT_SECONDS = config.get_float_config('LLM_TIMEOUT_SECONDS', 30.0)
+
+# Incremental re-matching of edited posts:
+# - if every fragment vector moved by less than this cosine drift, keep existing scores
+# - otherwise only re-evaluate queries whose RAG score crossed the candidate boundary
+MATCH_DRIFT_THRESHOLD = config.get_float_config('MATCH_DRIFT_THRESHOLD', 0.02)
+MATCH_CANDIDATE_THRESHOLD = config.get_float_config('MATCH_CANDIDATE_THRESHOLD', 0.4)
+
+# LLM backend (live API, synthetic stand-in, or record/replay - see llm_backend.py)
+llm = llm_backend.create_backend(LLM_MODEL, timeout=LLM_TIMEOUT_SECONDS)
+
+# Stand-in backends cache under their own key so they never pollute live results
+LLM_CACHE_MODEL = LLM_MODEL if llm.name in ('anthropic', 'record') else f"{LLM_MODEL}:{llm.name}"
+
 # Configure upload folder
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
@@ -256,6 +278,30 @@ def notify_new_user(new_user):
     logger.info(f"[PUSH] Sent new user notifications to {sent_count}/{len(recipients)} users")
 
 
+# Conditional GET helpers (ETag / Last-Modified)
+
+def make_etag(*parts):
+    """Opaque ETag value from a version stamp (plus anything else the payload depends on)"""
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:32]
+
+def etag_matches(etag):
+    """True if the client's If-None-Match already has this version"""
+    return request.if_none_match.contains_weak(etag)
+
+def not_modified(etag, last_modified=None):
+    """Empty 304 carrying the current validators"""
+    response = Response(status=304)
+    return with_validators(response, etag, last_modified)
+
+def with_validators(response, etag, last_modified=None):
+    """Attach ETag / Last-Modified; no-cache makes clients revalidate on every read"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 @app.route('/')
 def index():
     """Serve the main page with the noob logo"""
@@ -399,6 +445,27 @@ def health():
         health_status['status'] = 'degraded'
         logger.error(f"Health check database error: {e}")
 
+    # LLM circuit breaker state (open means search is running RAG-only)
+    health_status['llm_breaker'] = llm_breaker.status()
+    health_status['llm_backend'] = llm.name
+
+    # Background matching queue (pending, running, coalesced jobs)
+    health_status['match_scheduler'] = match_scheduler.stats()
+
+    # In-memory query badge state (hits are polls answered without Postgres)
+    health_status['badge_cache'] = db.badge_cache.stats()
+    health_status['watermarks'] = db.watermarks.stats()
+    health_status['event_stream'] = db.events.stats()
+    health_status['people_directory'] = db.directory.stats()
+    health_status['invite_tree'] = db.invite_tree.stats()
+    health_status['row_cache'] = db.rows.stats()
+    health_status['db_pool'] = db.pool_stats()
+    health_status['prepared_statements'] = db.statements.stats()
+    health_status['write_behind'] = {
+        'query_views': db.query_views.stats(),
+        'last_activity': db.activity.stats()
+    }
+
     status_code = 200 if health_status.get('database') == 'ok' else 503
     return jsonify(health_status), status_code
 
@@ -514,6 +581,25 @@ def allowed_file(filename):
     """Check if uploaded file has an allowed extension"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def save_upload(file):
+    """Save an uploaded image under a unique name; returns its /uploads URL, or None if there is none"""
+    if not file or not file.filename or not allowed_file(file.filename):
+        return None
+    ext = file.filename.rsplit('.', 1)[1].lower()
+    filename = f"{uuid.uuid4().hex}.{ext}"
+    file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+    logger.info(f"Uploaded image: {filename}")
+    return f"/uploads/{filename}"
+
+def discard_upload(image_url):
+    """Remove an image saved by save_upload when the request that carried it fails"""
+    if not image_url:
+        return
+    try:
+        os.remove(os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(image_url)))
+    except OSError as e:
+        logger.warning(f"Could not remove unused upload {image_url}: {e}")
+
 @app.route('/uploads/<filename>')
 def serve_upload(filename):
     """Serve uploaded files"""
@@ -554,57 +640,61 @@ def create_post():
                 'message': 'email, title, summary, and body are required'
             }), 400
 
-        # Look up user by email
-        user = db.get_user_by_email(email)
-        if not user:
-            return jsonify({
-                'status': 'error',
-                'message': f'User not found: {email}'
-            }), 404
-
-        user_id = user['id']
+        # Write the upload to disk before taking a connection, so no transaction
+        # stays open during file I/O; it is removed again if the post isn't created
+        image_url = save_upload(request.files.get('image'))
 
-        # If parent_id not provided, default to user's profile post
-        if parent_id is None:
-            profile = db.get_user_profile(user_id)
-            if profile:
-                parent_id = profile['id']
-                logger.info(f"[CREATE_POST] No parent_id provided, defaulting to user's profile post: {parent_id}")
-
-        # Handle image upload if present
-        image_url = None
-        if 'image' in request.files:
-            file = request.files['image']
-            if file and file.filename and allowed_file(file.filename):
-                # Generate unique filename
-                ext = file.filename.rsplit('.', 1)[1].lower()
-                filename = f"{uuid.uuid4().hex}.{ext}"
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                image_url = f"/uploads/{filename}"
-                logger.info(f"Uploaded image: {filename}")
+        # Lookups, insert and read-back share one connection and commit once;
+        # embeddings and matching run after the commit, without holding it
+        stored = False
+        try:
+            with db.unit_of_work():
+                # Look up user by email
+                user = db.get_user_by_email(email)
+                if not user:
+                    return jsonify({
+                        'status': 'error',
+                        'message': f'User not found: {email}'
+                    }), 404
+
+                user_id = user['id']
+
+                # If parent_id not provided, default to user's profile post
+                if parent_id is None:
+                    profile = db.get_user_profile(user_id)
+                    if profile:
+                        parent_id = profile['id']
+                        logger.info(f"[CREATE_POST] No parent_id provided, defaulting to user's profile post: {parent_id}")
+
+                # Create post in database
+                logger.info(f"[CREATE_POST] Creating post: email={email}, user_id={user_id}, parent_id={parent_id}, title={title[:30]}..., template_name={template_name}")
+                post_id = db.create_post(
+                    user_id=user_id,
+                    title=title,
+                    summary=summary,
+                    body=body,
+                    timezone=timezone,
+                    parent_id=parent_id,
+                    image_url=image_url,
+                    location_tag=location_tag,
+                    ai_generated=ai_generated,
+                    template_name=template_name
+                )
 
-        # Create post in database
-        logger.info(f"[CREATE_POST] Creating post: email={email}, user_id={user_id}, parent_id={parent_id}, title={title[:30]}..., template_name={template_name}")
-        post_id = db.create_post(
-            user_id=user_id,
-            title=title,
-            summary=summary,
-            body=body,
-            timezone=timezone,
-            parent_id=parent_id,
-            image_url=image_url,
-            location_tag=location_tag,
-            ai_generated=ai_generated,
-            template_name=template_name
-        )
+                if not post_id:
+                    logger.info(f"[CREATE_POST] ERROR: db.create_post returned None/False")
+                    return jsonify({
+                        'status': 'error',
+                        'message': 'Failed to create post'
+                    }), 500
 
-        if not post_id:
-            logger.info(f"[CREATE_POST] ERROR: db.create_post returned None/False")
-            return jsonify({
-                'status': 'error',
-                'message': 'Failed to create post'
-            }), 500
+                # Fetch the created post to return it
+                post = db.get_post_by_id(post_id)
+            stored = True
+        finally:
+            # Also on an exception inside the unit (lookup, write or commit)
+            if not stored:
+                discard_upload(image_url)
 
         logger.info(f"[CREATE_POST] Created post {post_id} by user {email} (ID: {user_id}), parent_id: {parent_id}")
 
@@ -626,8 +716,6 @@ def create_post():
             except Exception as e:
                 logger.error(f"[CREATE_POST] Failed to populate initial query results: {e}")
 
-        # Fetch the created post to return it
-        post = db.get_post_by_id(post_id)
         if not post:
             return jsonify({
                 'status': 'error',
@@ -696,64 +784,72 @@ def update_post():
                 'message': 'post_id must be a valid integer'
             }), 400
 
-        # Look up user by email
-        user = db.get_user_by_email(email)
-        if not user:
-            return jsonify({
-                'status': 'error',
-                'message': f'User not found: {email}'
-            }), 404
-
-        user_id = user['id']
-
-        # Get existing post to verify ownership
-        existing_post = db.get_post_by_id(post_id)
-        if not existing_post:
-            return jsonify({
-                'status': 'error',
-                'message': 'Post not found'
-            }), 404
-
-        if existing_post['user_id'] != user_id:
-            return jsonify({
-                'status': 'error',
-                'message': 'You can only edit your own posts'
-            }), 403
-
-        # Handle image upload if present
-        image_url = existing_post['image_url']  # Keep existing image by default
-        if 'image' in request.files:
-            file = request.files['image']
-            if file and file.filename and allowed_file(file.filename):
-                # Generate unique filename
-                ext = file.filename.rsplit('.', 1)[1].lower()
-                filename = f"{uuid.uuid4().hex}.{ext}"
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                image_url = f"/uploads/{filename}"
-                logger.info(f"Uploaded new image: {filename}")
+        # Write any new upload to disk before taking a connection; it is removed
+        # again if the update is refused or fails
+        new_image_url = save_upload(request.files.get('image'))
 
+        # Ownership check, update and read-back share one connection and commit once
+        stored = False
+        try:
+            with db.unit_of_work():
+                # Look up user by email
+                user = db.get_user_by_email(email)
+                if not user:
+                    return jsonify({
+                        'status': 'error',
+                        'message': f'User not found: {email}'
+                    }), 404
+
+                user_id = user['id']
+
+                # Get existing post to verify ownership
+                existing_post = db.get_post_by_id(post_id)
+                if not existing_post:
+                    return jsonify({
+                        'status': 'error',
+                        'message': 'Post not found'
+                    }), 404
+
+                if existing_post['user_id'] != user_id:
+                    return jsonify({
+                        'status': 'error',
+                        'message': 'You can only edit your own posts'
+                    }), 403
+
+                # Keep the existing image unless a new one was uploaded
                 # TODO: Delete old image file if it exists
+                image_url = new_image_url or existing_post['image_url']
+
+                # Update post in database
+                success = db.update_post(
+                    post_id=post_id,
+                    title=title,
+                    summary=summary,
+                    body=body,
+                    image_url=image_url,
+                    clip_offset_x=clip_offset_x,
+                    clip_offset_y=clip_offset_y
+                )
 
-        # Update post in database
-        success = db.update_post(
-            post_id=post_id,
-            title=title,
-            summary=summary,
-            body=body,
-            image_url=image_url,
-            clip_offset_x=clip_offset_x,
-            clip_offset_y=clip_offset_y
-        )
+                if not success:
+                    return jsonify({
+                        'status': 'error',
+                        'message': 'Failed to update post'
+                    }), 500
 
-        if not success:
-            return jsonify({
-                'status': 'error',
-                'message': 'Failed to update post'
-            }), 500
+                # Fetch the updated post to return it
+                post = db.get_post_by_id(post_id)
+            stored = True
+        finally:
+            # Also on an exception inside the unit (lookup, write or commit)
+            if not stored:
+                discard_upload(new_image_url)
 
         logger.info(f"Updated post {post_id} by user {email} (ID: {user_id})")
 
+        # Keep the previous fragment vectors so re-matching can be incremental
+        previous_embeddings = embeddings.load_embeddings(post_id)
+
         # Regenerate embeddings
         try:
             embeddings.generate_embeddings(post_id, title, summary, body)
@@ -770,11 +866,9 @@ def update_post():
             except Exception as e:
                 logger.error(f"[UPDATE_POST] Failed to regenerate query results: {e}")
         else:
-            # Regular post - re-check against all queries (non-blocking)
-            background_match_post(post_id)
+            # Regular post - re-check changed matches only (non-blocking)
+            background_match_post(post_id, previous_embeddings=previous_embeddings)
 
-        # Fetch the updated post to return it
-        post = db.get_post_by_id(post_id)
         if not post:
             return jsonify({
                 'status': 'error',
@@ -793,16 +887,28 @@ def update_post():
             'message': f'Server error: {str(e)}'
         }), 500
 
+def parse_feed_cursor():
+    """Keyset position from the ?cursor= parameter (None for the first page); raises ValueError"""
+    cursor = request.args.get('cursor', '').strip()
+    return decode_cursor(cursor) if cursor else None
+
 @app.route('/api/posts/recent', methods=['GET'])
 def get_recent_posts():
-    """Get recent posts"""
+    """Get recent posts, newest first
+    Query params: limit (default 50), cursor (next_cursor from the previous page)"""
     try:
         limit = request.args.get('limit', 50, type=int)
-        posts = db.get_recent_posts(limit=limit)
+        try:
+            before = parse_feed_cursor()
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+
+        posts = db.get_recent_posts(limit=limit, before=before)
 
         return jsonify({
             'status': 'success',
-            'posts': posts
+            'posts': posts,
+            'next_cursor': next_cursor(posts, limit)
         })
     except Exception as e:
         logger.error(f"Error getting recent posts: {e}", exc_info=True)
@@ -813,7 +919,8 @@ def get_recent_posts():
 
 @app.route('/api/users/recent', methods=['GET'])
 def get_recent_users():
-    """Get users ordered by proximity to current user, then by activity"""
+    """Get users ordered by proximity to current user, then by activity
+    Optional paging: limit, offset (default: everyone)"""
     try:
         # Get current user ID from email parameter for proximity sorting
         email = request.args.get('email', '').strip().lower()
@@ -823,7 +930,10 @@ def get_recent_users():
             if current_user:
                 current_user_id = current_user['id']
 
-        users = db.get_recent_users(current_user_id=current_user_id)
+        limit = request.args.get('limit', None, type=int)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+
+        users = db.get_recent_users(current_user_id=current_user_id, limit=limit, offset=offset)
 
         return jsonify({
             'status': 'success',
@@ -845,30 +955,22 @@ def get_new_users_since():
         if not since:
             return jsonify({'has_new': False, 'count': 0})
 
-        conn = db.get_connection()
-        try:
-            with conn.cursor() as cur:
-                # Check for users whose profile was completed after the timestamp
-                cur.execute("""
-                    SELECT COUNT(*) FROM users
-                    WHERE profile_complete = TRUE
-                    AND profile_completed_at > %s
-                """, (since,))
-                count = cur.fetchone()[0]
+        # Users whose profile was completed after the timestamp (watermark short-circuits "none")
+        count = db.count_new_users_since(since)
 
-                return jsonify({
-                    'has_new': count > 0,
-                    'count': count
-                })
-        finally:
-            db.return_connection(conn)
+        return jsonify({
+            'has_new': count > 0,
+            'count': count
+        })
     except Exception as e:
         logger.error(f"Error checking new users: {e}", exc_info=True)
         return jsonify({'has_new': False, 'count': 0})
 
 @app.route('/api/posts/recent-tagged', methods=['GET'])
 def get_recent_tagged_posts():
-    """Get recent posts filtered by template tags and user"""
+    """Get recent posts filtered by template tags and user
+    Query params: tags, by_user, user_email, limit, after (ISO8601),
+    cursor (next_cursor from the previous page; not for profiles, which are ordered by proximity)"""
     try:
         tags_param = request.args.get('tags', '')
         by_user = request.args.get('by_user', 'any')
@@ -878,26 +980,39 @@ def get_recent_tagged_posts():
 
         # Parse tags
         tags = [tag.strip() for tag in tags_param.split(',') if tag.strip()] if tags_param else []
+        is_profile_listing = 'profile' in tags
 
-        # Get current user ID if needed
-        user_id = None
-        current_user_id = None
-        if user_email:
-            user = db.get_user_by_email(user_email)
-            if user:
-                current_user_id = user['id']
-                if by_user == 'current':
-                    user_id = user['id']
-            logger.info(f"[RECENT-TAGGED] email={user_email}, current_user_id={current_user_id}, by_user={by_user}")
-
-        # Fetch posts (pass current_user_email for profile filtering, current_user_id for proximity)
-        logger.info(f"[RECENT-TAGGED] Fetching: tags={tags}, user_id={user_id}, limit={limit}, user_email={user_email}, after={after}")
-        posts = db.get_recent_tagged_posts(tags=tags, user_id=user_id, limit=limit, current_user_email=user_email, after=after if after else None, current_user_id=current_user_id)
+        try:
+            before = parse_feed_cursor()
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        if before is not None and is_profile_listing:
+            return jsonify({
+                'status': 'error',
+                'message': 'cursor is not supported for profile listings (ordered by proximity)'
+            }), 400
+
+        with db.unit_of_work(snapshot=True):
+            # Get current user ID if needed
+            user_id = None
+            current_user_id = None
+            if user_email:
+                user = db.get_user_by_email(user_email)
+                if user:
+                    current_user_id = user['id']
+                    if by_user == 'current':
+                        user_id = user['id']
+                logger.info(f"[RECENT-TAGGED] email={user_email}, current_user_id={current_user_id}, by_user={by_user}")
+
+            # Fetch posts (pass current_user_email for profile filtering, current_user_id for proximity)
+            logger.info(f"[RECENT-TAGGED] Fetching: tags={tags}, user_id={user_id}, limit={limit}, user_email={user_email}, after={after}")
+            posts = db.get_recent_tagged_posts(tags=tags, user_id=user_id, limit=limit, current_user_email=user_email, after=after if after else None, current_user_id=current_user_id, before=before)
         logger.info(f"[RECENT-TAGGED] Found {len(posts)} posts")
 
         return jsonify({
             'status': 'success',
-            'posts': posts
+            'posts': posts,
+            'next_cursor': None if is_profile_listing else next_cursor(posts, limit)
         })
     except Exception as e:
         logger.error(f"Error getting recent tagged posts: {e}", exc_info=True)
@@ -908,19 +1023,30 @@ def get_recent_tagged_posts():
 
 @app.route('/api/posts/<int:post_id>', methods=['GET'])
 def get_post(post_id):
-    """Get a specific post by ID"""
+    """Get a specific post by ID (supports If-None-Match)"""
     try:
-        post = db.get_post_by_id(post_id)
+        # Version and body come from one snapshot, so the ETag describes the body sent
+        with db.unit_of_work(snapshot=True):
+            version = db.get_post_version(post_id)
+            if version is not None:
+                etag = make_etag('post', post_id, version['digest'])
+                if etag_matches(etag):
+                    return not_modified(etag, version['last_modified'])
+
+            post = db.get_post_by_id(post_id)
         if not post:
             return jsonify({
                 'status': 'error',
                 'message': 'Post not found'
             }), 404
 
-        return jsonify({
+        response = jsonify({
             'status': 'success',
             'post': post
         })
+        if version is not None:
+            with_validators(response, etag, version['last_modified'])
+        return response
     except Exception as e:
         logger.error(f"Error getting post: {e}", exc_info=True)
         return jsonify({
@@ -928,6 +1054,51 @@ def get_post(post_id):
             'message': f'Server error: {str(e)}'
         }), 500
 
+# Upper bound on posts hydrated by one /api/posts/batch request
+MAX_BATCH_POSTS = 200
+
+@app.route('/api/posts/batch', methods=['POST'])
+def get_posts_batch():
+    """Get many posts in one request
+    Request body: {"ids": [1, 2, 3]}
+    Response: {"status": "success", "posts": [...]} (same order as ids, missing posts skipped)"""
+    try:
+        data = request.get_json() or {}
+        ids = data.get('ids', [])
+
+        if not isinstance(ids, list):
+            return jsonify({
+                'status': 'error',
+                'message': 'ids must be a list'
+            }), 400
+
+        try:
+            post_ids = [int(post_id) for post_id in ids]
+        except (TypeError, ValueError):
+            return jsonify({
+                'status': 'error',
+                'message': 'ids must be integers'
+            }), 400
+
+        if len(post_ids) > MAX_BATCH_POSTS:
+            return jsonify({
+                'status': 'error',
+                'message': f'At most {MAX_BATCH_POSTS} ids per request'
+            }), 400
+
+        posts = db.get_posts_by_ids(post_ids)
+
+        return jsonify({
+            'status': 'success',
+            'posts': posts
+        })
+    except Exception as e:
+        logger.error(f"Error getting posts batch: {e}", exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': f'Server error: {str(e)}'
+        }), 500
+
 @app.route('/api/posts/reparent', methods=['POST'])
 def reparent_post():
     """Set the parent of a post"""
@@ -966,16 +1137,35 @@ def reparent_post():
 
 @app.route('/api/posts/<int:post_id>/children', methods=['GET'])
 def get_post_children(post_id):
-    """Get all child posts of a specific post"""
+    """Get child posts of a specific post, newest first (supports If-None-Match)
+    Query params: limit (default: all children), cursor (next_cursor from the previous page)"""
     try:
-        children = db.get_child_posts(post_id)
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor', '').strip()
+        try:
+            before = parse_feed_cursor()
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
 
-        return jsonify({
+        with db.unit_of_work(snapshot=True):
+            version = db.get_children_version(post_id)
+            if version is not None:
+                etag = make_etag('children', post_id, version['digest'], limit, cursor)
+                if etag_matches(etag):
+                    return not_modified(etag, version['last_modified'])
+
+            children = db.get_child_posts(post_id, limit=limit, before=before)
+
+        response = jsonify({
             'status': 'success',
             'post_id': post_id,
             'children': children,
-            'count': len(children)
+            'count': len(children),
+            'next_cursor': next_cursor(children, limit)
         })
+        if version is not None:
+            with_validators(response, etag, version['last_modified'])
+        return response
     except Exception as e:
         logger.error(f"Error getting child posts: {e}", exc_info=True)
         return jsonify({
@@ -1134,16 +1324,7 @@ def create_profile():
             }), 500
 
         # Mark user's profile as complete with timestamp (for notifications)
-        conn = db.get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "UPDATE users SET profile_complete = TRUE, profile_completed_at = NOW() WHERE id = %s",
-                    (user_id,)
-                )
-                conn.commit()
-        finally:
-            db.return_connection(conn)
+        db.mark_profile_complete(user_id)
 
         logger.info(f"Created profile {post_id} for user {email} (ID: {user_id})")
 
@@ -1281,7 +1462,7 @@ def update_profile():
 
 @app.route('/api/templates/<template_name>', methods=['GET'])
 def get_template(template_name):
-    """Get template information including plural name"""
+    """Get template information including plural name (supports If-None-Match)"""
     conn = db.get_connection()
     try:
         with conn.cursor() as cur:
@@ -1306,10 +1487,15 @@ def get_template(template_name):
                 'plural_name': row[4]
             }
 
-            return jsonify({
+            # Templates are tiny, so the version is the row itself
+            etag = make_etag('template', template)
+            if etag_matches(etag):
+                return not_modified(etag)
+
+            return with_validators(jsonify({
                 'status': 'success',
                 'template': template
-            })
+            }), etag)
 
     except Exception as e:
         logger.error(f"Error fetching template: {e}", exc_info=True)
@@ -1377,32 +1563,13 @@ def poll_notifications():
             flags = db.get_has_new_matches_bulk(user_email, query_ids)
             result['query_badges'] = {str(k): v for k, v in flags.items()}
 
-        conn = db.get_connection()
-        try:
-            with conn.cursor() as cur:
-                # 2. Check for new users (if timestamp provided)
-                if last_viewed_users:
-                    cur.execute("""
-                        SELECT COUNT(*) FROM users
-                        WHERE profile_complete = TRUE
-                        AND profile_completed_at > %s
-                    """, (last_viewed_users,))
-                    count = cur.fetchone()[0]
-                    result['has_new_users'] = count > 0
-
-                # 3. Check for new posts by other users (if timestamp and email provided)
-                if last_viewed_posts and user_email:
-                    cur.execute("""
-                        SELECT COUNT(*) FROM posts p
-                        JOIN users u ON p.user_id = u.id
-                        WHERE p.template_name = 'post'
-                        AND p.created_at > %s
-                        AND u.email != %s
-                    """, (last_viewed_posts, user_email))
-                    count = cur.fetchone()[0]
-                    result['has_new_posts'] = count > 0
-        finally:
-            db.return_connection(conn)
+        # 2. Check for new users (if timestamp provided) - in-memory watermark, DB fallback
+        if last_viewed_users:
+            result['has_new_users'] = db.has_new_users_since(last_viewed_users)
+
+        # 3. Check for new posts by other users (if timestamp and email provided)
+        if last_viewed_posts and user_email:
+            result['has_new_posts'] = db.has_new_posts_since(last_viewed_posts, user_email)
 
         return jsonify(result), 200
     except Exception as e:
@@ -1410,6 +1577,72 @@ def poll_notifications():
         return jsonify({'query_badges': {}, 'has_new_users': False, 'has_new_posts': False}), 200
 
 
+@app.route('/api/notifications/stream', methods=['GET'])
+def stream_notifications():
+    """Server-sent events for notification badges (push alternative to /api/notifications/poll)
+    Query params: user_email, query_ids (comma-separated, optional - the user's own queries if omitted;
+                  queries the user doesn't own are ignored),
+                  last_event_id (optional, same as the Last-Event-ID header)
+    Events:
+        query_badge {"query_id": 1, "has_new": true}   - match stored, or this user viewed the query
+        new_posts   {"post_id": 5, "created_at": ...}  - another user created a post
+        new_users   {"user_id": 7, "profile_completed_at": ...}
+        resync      {"reason": ...}                    - events were missed; poll once, then keep streaming
+    A ": heartbeat" comment is sent when idle."""
+    user_email = request.args.get('user_email', '').strip()
+    query_ids_param = request.args.get('query_ids', '')
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
+    if not user_email:
+        return jsonify({'error': 'user_email is required'}), 400
+
+    try:
+        requested = {int(q) for q in query_ids_param.split(',') if q.strip()} if query_ids_param else None
+    except ValueError:
+        return jsonify({'error': 'query_ids must be comma-separated integers'}), 400
+
+    user = db.get_user_by_email(user_email)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    # Badges only for the user's own queries, looked up once (reconnect to pick up new ones)
+    query_ids = set(db.get_query_ids_by_user(user['id']))
+    if requested is not None:
+        query_ids &= requested
+
+    def accept(event):
+        """Translate a broker event into what this user should see (None to skip)"""
+        data = event.data
+        if event.type == event_stream.QUERY_MATCH:
+            if data['query_id'] in query_ids:
+                return 'query_badge', {'query_id': data['query_id'], 'has_new': True}
+        elif event.type == event_stream.QUERY_VIEWED:
+            # Viewed on another device - clear the badge everywhere for this user
+            if data['user_email'] == user_email and data['query_id'] in query_ids:
+                return 'query_badge', {'query_id': data['query_id'], 'has_new': False}
+        elif event.type == event_stream.NEW_POST:
+            if data['author_email'] != user_email:
+                return 'new_posts', {'post_id': data['post_id'], 'created_at': data['created_at']}
+        elif event.type == event_stream.NEW_USER:
+            return 'new_users', {'user_id': data['user_id'], 'profile_completed_at': data['profile_completed_at']}
+        return None
+
+    def generate():
+        # Subscribe on first iteration, so a response that is never consumed holds no subscription
+        subscription = db.events.subscribe(last_event_id)
+        logger.info(f"[STREAM] {user_email} subscribed (resume from {last_event_id or 'now'})")
+        yield from db.events.stream(subscription, accept)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Don't let a proxy buffer the stream
+        }
+    )
+
+
 @app.route('/api/queries/badges', methods=['POST'])
 def get_query_badges():
     """Get has_new_matches flags for multiple queries for a user
@@ -1440,17 +1673,38 @@ def get_query_badges():
 
 @app.route('/api/search', methods=['GET'])
 def search_posts():
-    """Get cached search results for a query (instant, with auto-populate fallback)"""
+    """Get cached search results for a query (instant, with auto-populate fallback)
+    Query params:
+        query_id - saved query post to read cached results for, or
+        q        - free-text search (optional: limit=20, rerank=false); hydrated by default
+        hydrate  - return full posts instead of {id, relevance_score}"""
     try:
         query_id = request.args.get('query_id', '').strip()
+        text = request.args.get('q', '').strip()
         user_email = request.args.get('user_email', '').strip()
 
+        if text and not query_id:
+            return search_free_text(text)
+
+        hydrate = request.args.get('hydrate', 'false').lower() == 'true'
+
         if not query_id:
-            return jsonify({'error': 'Query parameter query_id is required'}), 400
+            return jsonify({'error': 'Query parameter query_id or q is required'}), 400
 
         query_id = int(query_id)
         logger.info(f"[SEARCH] Getting cached results for query {query_id}")
 
+        # Cheap version check first: unchanged results answer 304 without reading them
+        version = db.get_query_results_version(query_id)
+        etag = None
+        if version is not None and version['count'] > 0:
+            etag = make_etag('search', query_id, hydrate, version['digest'])
+            if etag_matches(etag):
+                if user_email:
+                    db.record_query_view(user_email, query_id)
+                logger.info(f"[SEARCH] Results for query {query_id} not modified")
+                return not_modified(etag, version['last_modified'])
+
         # Read cached results
         results = db.get_query_results(query_id)
 
@@ -1466,25 +1720,147 @@ def search_posts():
         if user_email:
             db.record_query_view(user_email, query_id)
 
-        # Return IDs and scores (client fetches full posts)
-        response = [{
-            'id': post_id,
-            'relevance_score': score / 100  # Normalize to 0-1 range
-        } for post_id, score, _ in results]
+        if hydrate:
+            # Return full posts (one query) with scores attached
+            scores = {post_id: score / 100 for post_id, score, _ in results}  # Normalize to 0-1 range
+            response = db.get_posts_by_ids([post_id for post_id, _, _ in results])
+            for post in response:
+                post['relevance_score'] = scores[post['id']]
+        else:
+            # Return IDs and scores (client fetches full posts)
+            response = [{
+                'id': post_id,
+                'relevance_score': score / 100  # Normalize to 0-1 range
+            } for post_id, score, _ in results]
 
         logger.info(f"[SEARCH] Returning {len(response)} cached results")
-        return jsonify(response)
+        response = jsonify(response)
+        if etag is not None:
+            with_validators(response, etag, version['last_modified'])
+        return response
 
     except Exception as e:
         logger.error(f"[SEARCH] Error: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
 
-def populate_initial_query_results(query_id):
+# Free-text search results, keyed by (normalized text, limit, rerank)
+TEXT_SEARCH_TTL_SECONDS = config.get_float_config('TEXT_SEARCH_TTL_SECONDS', 60.0)
+TEXT_SEARCH_MAX_LIMIT = 50
+_text_search_cache = {}
+_text_search_cache_lock = threading.Lock()
+
+
+def search_free_text(text):
+    """Handle /api/search?q=... (see search_posts)"""
+    limit = min(max(request.args.get('limit', 20, type=int), 1), TEXT_SEARCH_MAX_LIMIT)
+    rerank = request.args.get('rerank', 'false').lower() == 'true'
+    hydrate = request.args.get('hydrate', 'true').lower() == 'true'
+
+    results = search_text(text, limit, rerank)
+
+    if hydrate:
+        scores = dict(results)
+        response = db.get_posts_by_ids([post_id for post_id, _ in results])
+        for post in response:
+            post['relevance_score'] = scores[post['id']]
+    else:
+        response = [{'id': post_id, 'relevance_score': score} for post_id, score in results]
+
+    logger.info(f"[SEARCH] Text search '{text[:50]}' returning {len(response)} results")
+    return jsonify(response)
+
+
+def search_text(text, limit=20, rerank=False):
+    """
+    Semantic search for free text: embed (cached), fragment similarity against all posts,
+    optional LLM rerank. Results are cached for TEXT_SEARCH_TTL_SECONDS.
+
+    Returns:
+        List of (post_id, relevance_score 0-1), best first
+    """
+    import time
+    key = (embeddings.normalize_query(text), limit, rerank)
+    now = time.time()
+
+    with _text_search_cache_lock:
+        cached = _text_search_cache.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+    query_embeddings = embeddings.embed_text(text)
+
+    # Same fragment pipeline as saved queries: MAX similarity over fragment pairs per post
+    all_embeddings, index = load_all_embeddings()
+    similarity_matrix = compute_similarity_gpu_matrix(query_embeddings, all_embeddings)
+    fragment_max = similarity_matrix.max(axis=0)
+
+    post_scores = {}
+    for i, (post_id, frag_idx) in enumerate(index):
+        score = float(fragment_max[i])
+        if score > post_scores.get(post_id, -1.0):
+            post_scores[post_id] = score
+
+    # Over-fetch so dropping query posts still leaves `limit` results
+    ranked = sorted(post_scores.items(), key=lambda x: x[1], reverse=True)[:limit * 2]
+    posts = {post['id']: post for post in db.get_posts_by_ids([post_id for post_id, _ in ranked])}
+    candidates = [
+        (post_id, score) for post_id, score in ranked
+        if post_id in posts and posts[post_id].get('template_name') != 'query'
+    ][:limit]
+
+    results = candidates
+    cacheable = True
+    if rerank and candidates:
+        candidate_posts = [{
+            'id': post_id,
+            'title': posts[post_id].get('title', ''),
+            'summary': posts[post_id].get('summary', ''),
+            'body': posts[post_id].get('body', ''),
+            'rag_score': score
+        } for post_id, score in candidates]
+        try:
+            llm_results = llm_rerank_posts({'title': text, 'summary': '', 'body': ''}, candidate_posts)
+            known = set(posts)
+            results = sorted(
+                ((item['id'], item['score'] / 100) for item in llm_results if item['id'] in known),
+                key=lambda x: x[1], reverse=True
+            )
+        except Exception as e:
+            # Breaker open or LLM failure: serve the RAG ranking
+            logger.warning(f"[SEARCH] Text search rerank failed: {e}, using RAG scores")
+            cacheable = False  # Retry the LLM on the next request
+
+    if not cacheable:
+        return results
+
+    with _text_search_cache_lock:
+        # Drop expired entries before adding, so the cache stays bounded by recent traffic
+        for stale in [k for k, (expires, _) in _text_search_cache.items() if expires <= now]:
+            del _text_search_cache[stale]
+        _text_search_cache[key] = (now + TEXT_SEARCH_TTL_SECONDS, results)
+
+    return results
+
+
+def populate_initial_query_results(query_id, replace=False):
     """
     When a new query is created, search all existing posts and cache results.
     This is the one-time "slow" operation (may take several seconds).
+
+    replace=True (re-scoring) swaps the query's stored results for the new ones in one
+    transaction, once they are computed; if anything fails first, the old results stay.
     """
+    def store(rows):
+        if not replace:
+            return db.insert_query_results_bulk(rows)
+        with db.unit_of_work():
+            db.clear_query_results(query_id)
+            stored = db.insert_query_results_bulk(rows)
+            if rows and not stored:
+                raise RuntimeError(f"storing re-scored results for query {query_id} failed")
+            return stored
+
     try:
         logger.info(f"[SEARCH] Populating initial results for new query {query_id}")
 
@@ -1556,58 +1932,87 @@ def populate_initial_query_results(query_id):
             llm_results = llm_rerank_posts(query_post, candidate_posts)
 
             # Store results (llm_results format: [{'id': post_id, 'score': int}, ...])
-            matches_added = False
-            for item in llm_results:
-                if item['score'] >= 40:
-                    db.insert_query_result(query_id, item['id'], item['score'])
-                    matches_added = True
+            rows = [(query_id, item['id'], item['score']) for item in llm_results if item['score'] >= 40]
+            stored = store(rows)
 
-            if matches_added:
-                db.update_last_match_added(query_id)
-
-            logger.info(f"[SEARCH] Stored {len([item for item in llm_results if item['score'] >= 40])} LLM-scored results")
+            logger.info(f"[SEARCH] Stored {stored} LLM-scored results")
 
         except Exception as e:
-            # LLM failed, use RAG scores
+            # LLM failed (or breaker open), use RAG scores
             logger.warning(f"[SEARCH] LLM re-ranking failed: {e}, using RAG scores")
 
-            if candidate_posts:
-                for post in candidate_posts:
-                    db.insert_query_result(query_id, post['id'], post['rag_score'] * 100)
-                db.update_last_match_added(query_id)
+            # Re-score with the LLM once the breaker closes again
+            if isinstance(e, CircuitOpenError) or not llm_breaker.is_closed():
+                llm_breaker.mark_for_rescore('query', query_id)
+
+            rows = [(query_id, post['id'], post['rag_score'] * 100) for post in candidate_posts]
+            stored = store(rows)
 
-            logger.info(f"[SEARCH] Stored {len(candidate_posts)} RAG-scored results")
+            logger.info(f"[SEARCH] Stored {stored} RAG-scored results")
 
     except Exception as e:
         logger.error(f"[SEARCH] Error populating initial query results: {e}", exc_info=True)
 
 
-def background_match_post(post_id):
+def merge_match_requests(older, newer):
     """
-    Run check_post_against_queries in a background thread.
-    This prevents blocking the HTTP response.
+    Combine two coalesced match requests for the same post.
+    Stored results still reflect the oldest baseline, so keep the older previous_embeddings;
+    if either request needs a full match (no baseline), the merged request does too.
     """
-    def run():
-        try:
-            check_post_against_queries(post_id)
-        except Exception as e:
-            logger.error(f"[BACKGROUND] Error in background matching for post {post_id}: {e}", exc_info=True)
+    if older.get('previous_embeddings') is None or newer.get('previous_embeddings') is None:
+        return {'previous_embeddings': None}
+    return {'previous_embeddings': older['previous_embeddings']}
 
-    thread = threading.Thread(target=run, daemon=True)
-    thread.start()
-    logger.info(f"[BACKGROUND] Started background matching thread for post {post_id}")
+
+# Background matching runs on a bounded pool, debounced and coalesced per post
+match_scheduler = MatchScheduler(
+    lambda post_id, **kwargs: check_post_against_queries(post_id, **kwargs),
+    max_workers=int(config.get_float_config('MATCH_WORKERS', 2)),
+    debounce_seconds=config.get_float_config('MATCH_DEBOUNCE_SECONDS', 2.0),
+    merge_fn=merge_match_requests
+)
 
 
-def check_post_against_queries(new_post_id):
+def background_match_post(post_id, previous_embeddings=None):
+    """
+    Schedule check_post_against_queries on the background match pool.
+    This prevents blocking the HTTP response; rapid successive edits coalesce into one run.
+    Pass previous_embeddings when the post was edited to re-match incrementally.
+    """
+    match_scheduler.submit(post_id, previous_embeddings=previous_embeddings)
+    logger.info(f"[BACKGROUND] Scheduled background matching for post {post_id}")
+
+
+def check_post_against_queries(new_post_id, previous_embeddings=None, replace=False):
     """
     Check a newly created post against all queries and cache matches.
     Runs in background after post creation.
+    If previous_embeddings is given (post was edited), re-match incrementally instead.
+    Errors are logged and re-raised, so match_scheduler counts the run as failed.
+
+    replace=True (re-scoring) swaps the post's stored matches for the new ones in one
+    transaction, once every batch is scored; if anything fails first, the old matches stay.
     """
+    if previous_embeddings is not None:
+        rematch_edited_post(new_post_id, previous_embeddings)
+        return
+
+    replacement_rows = []
+
+    def store(rows):
+        if not replace:
+            return db.insert_query_results_bulk(rows)
+        replacement_rows.extend(rows)
+        return len(rows)
+
     try:
         logger.info(f"[SEARCH] Checking post {new_post_id} against all queries")
 
-        # 0. Clear any existing results for this post (in case it's being re-evaluated)
-        db.clear_post_from_results(new_post_id)
+        # 0. Clear any existing results for this post (in case it's being re-evaluated);
+        #    a re-score keeps them until its own results are ready
+        if not replace:
+            db.clear_post_from_results(new_post_id)
 
         # 1. Get all queries
         queries = db.get_posts_by_template('query')
@@ -1625,25 +2030,7 @@ def check_post_against_queries(new_post_id):
         new_post_embeddings = new_post_embeddings.astype(np.float32) / 127.0
 
         # 3. Compute similarity against each query
-        query_scores = []
-
-        for query in queries:
-            query_id = query[0]  # id is first column
-
-            # Load query embeddings
-            query_embeddings = embeddings.load_embeddings(query_id)
-            if query_embeddings is None:
-                continue
-
-            query_embeddings = query_embeddings.astype(np.float32) / 127.0
-
-            # Compute similarity matrix
-            similarity_matrix = compute_similarity_gpu_matrix(query_embeddings, new_post_embeddings)
-
-            # Use MAX aggregation
-            max_similarity = np.max(similarity_matrix)
-
-            query_scores.append((query_id, query, max_similarity))
+        query_scores = compute_query_rag_scores(queries, new_post_embeddings)
 
         # 4. Sort by RAG score
         query_scores.sort(key=lambda x: x[2], reverse=True)
@@ -1665,30 +2052,174 @@ def check_post_against_queries(new_post_id):
                 # Call LLM to evaluate post against batch of queries
                 batch_scores = llm_evaluate_post_against_queries(batch, new_post)
 
-                # Store matches if relevant (score >= 40)
-                matches_stored = 0
+                # Store matches if relevant (score >= 40), one transaction per batch
+                rows = []
                 for query_id, llm_score in batch_scores:
                     if llm_score >= 40:
-                        db.insert_query_result(query_id, new_post_id, llm_score)
-                        db.update_last_match_added(query_id)
-                        matches_stored += 1
-                        logger.info(f"[SEARCH]   Query {query_id}: score {llm_score} - MATCH stored")
+                        rows.append((query_id, new_post_id, llm_score))
+                        logger.info(f"[SEARCH]   Query {query_id}: score {llm_score} - MATCH")
                     else:
                         logger.debug(f"[SEARCH]   Query {query_id}: score {llm_score} - below threshold")
 
+                matches_stored = store(rows)
                 logger.info(f"[SEARCH] Batch {batch_num}: stored {matches_stored}/{len(batch)} matches")
 
             except Exception as e:
-                # LLM failed, fall back to RAG scores
+                # LLM failed (or breaker open), fall back to RAG scores
                 logger.warning(f"[SEARCH] LLM batch evaluation failed: {e}, using RAG scores")
 
-                for query_id, query, rag_score in batch:
-                    if rag_score >= 0.4:  # Equivalent to 40/100
-                        db.insert_query_result(query_id, new_post_id, rag_score * 100)
-                        db.update_last_match_added(query_id)
+                # Re-score with the LLM once the breaker closes again
+                if isinstance(e, CircuitOpenError) or not llm_breaker.is_closed():
+                    llm_breaker.mark_for_rescore('post', new_post_id)
+
+                rows = [
+                    (query_id, new_post_id, rag_score * 100)
+                    for query_id, query, rag_score in batch
+                    if rag_score >= 0.4  # Equivalent to 40/100
+                ]
+                store(rows)
+
+        if replace:
+            with db.unit_of_work():
+                db.clear_post_from_results(new_post_id)
+                stored = db.insert_query_results_bulk(replacement_rows)
+                if replacement_rows and not stored:
+                    raise RuntimeError(f"storing re-scored matches for post {new_post_id} failed")
 
     except Exception as e:
         logger.error(f"[SEARCH] Error checking post against queries: {e}", exc_info=True)
+        raise
+
+
+def compute_query_rag_scores(queries, post_embeddings):
+    """
+    RAG score of a post against each query (MAX over fragment-pair similarities).
+
+    Args:
+        queries: Query rows from db.get_posts_by_template('query')
+        post_embeddings: Float32 fragment vectors of the post
+
+    Returns:
+        List of (query_id, query_row, rag_score) tuples
+    """
+    query_scores = []
+
+    for query in queries:
+        query_id = query[0]  # id is first column
+
+        # Load query embeddings
+        query_embeddings = embeddings.load_embeddings(query_id)
+        if query_embeddings is None:
+            continue
+
+        query_embeddings = query_embeddings.astype(np.float32) / 127.0
+
+        # Compute similarity matrix
+        similarity_matrix = compute_similarity_gpu_matrix(query_embeddings, post_embeddings)
+
+        # Use MAX aggregation
+        max_similarity = float(np.max(similarity_matrix))
+
+        query_scores.append((query_id, query, max_similarity))
+
+    return query_scores
+
+
+def embedding_drift(old_embeddings, new_embeddings):
+    """
+    How far a post's fragment vectors moved after an edit (0 = unchanged).
+    Every fragment on each side is matched to its closest fragment on the other side;
+    the drift is 1 - the worst of those best-match cosine similarities.
+    """
+    similarity_matrix = compute_similarity_gpu_matrix(old_embeddings, new_embeddings)
+    worst_match = min(similarity_matrix.max(axis=1).min(), similarity_matrix.max(axis=0).min())
+    return float(1.0 - worst_match)
+
+
+def rematch_edited_post(post_id, previous_embeddings):
+    """
+    Incrementally re-match an edited post against queries.
+
+    Existing scores are kept if the fragment vectors barely moved. Otherwise queries
+    whose RAG score fell below MATCH_CANDIDATE_THRESHOLD lose their match (the full
+    path would never evaluate them), only queries whose score rose above it are
+    re-evaluated, and last_match_added_at is bumped only for queries that gain a new match.
+    """
+    try:
+        new_embeddings = embeddings.load_embeddings(post_id)
+        if new_embeddings is None:
+            logger.warning(f"No embeddings found for post {post_id}")
+            return
+
+        old_embeddings = previous_embeddings.astype(np.float32) / 127.0
+        new_embeddings = new_embeddings.astype(np.float32) / 127.0
+
+        # 1. Barely changed: keep all existing scores
+        drift = embedding_drift(old_embeddings, new_embeddings)
+        if drift <= MATCH_DRIFT_THRESHOLD:
+            logger.info(f"[SEARCH] Post {post_id} drift {drift:.4f} <= {MATCH_DRIFT_THRESHOLD}, keeping existing matches")
+            return
+
+        queries = db.get_posts_by_template('query')
+        if len(queries) == 0:
+            return
+
+        # 2. Find queries whose RAG score crossed the candidate boundary
+        old_scores = {query_id: score for query_id, _, score in compute_query_rag_scores(queries, old_embeddings)}
+        crossed_up = []
+        crossed_down = []
+        for query_id, query, new_score in compute_query_rag_scores(queries, new_embeddings):
+            was_candidate = old_scores.get(query_id, 0.0) >= MATCH_CANDIDATE_THRESHOLD
+            is_candidate = new_score >= MATCH_CANDIDATE_THRESHOLD
+            if is_candidate and not was_candidate:
+                crossed_up.append((query_id, query, new_score))
+            elif was_candidate and not is_candidate:
+                crossed_down.append(query_id)
+
+        logger.info(f"[SEARCH] Post {post_id} drift {drift:.4f}: {len(crossed_up)} queries rose above and "
+                    f"{len(crossed_down)} fell below the candidate boundary (of {len(queries)})")
+        if not crossed_up and not crossed_down:
+            return
+
+        crossed_up.sort(key=lambda x: x[2], reverse=True)
+        existing = db.get_query_scores_for_post(post_id)
+        post = db.get_post_by_id(post_id)
+
+        # 3. Re-evaluate only the queries that became candidates (LLM, falling back to RAG)
+        new_scores = {}
+        BATCH_SIZE = 20
+        for batch_start in range(0, len(crossed_up), BATCH_SIZE):
+            batch = crossed_up[batch_start:batch_start + BATCH_SIZE]
+            try:
+                for query_id, llm_score in llm_evaluate_post_against_queries(batch, post):
+                    new_scores[query_id] = llm_score
+            except Exception as e:
+                logger.warning(f"[SEARCH] LLM re-evaluation failed: {e}, using RAG scores")
+                if isinstance(e, CircuitOpenError) or not llm_breaker.is_closed():
+                    llm_breaker.mark_for_rescore('post', post_id)
+                for query_id, query, rag_score in batch:
+                    new_scores[query_id] = rag_score * 100
+
+        # 4. Apply only the differences: no longer a candidate means no match
+        crossed_up_ids = {query_id for query_id, _, _ in crossed_up}
+        matched = {query_id: score for query_id, score in new_scores.items()
+                   if query_id in crossed_up_ids and score >= 40}
+        removed = [query_id for query_id in crossed_down if query_id in existing]
+        removed += [query_id for query_id in crossed_up_ids if query_id in existing and query_id not in matched]
+        gained = [query_id for query_id in matched if query_id not in existing]
+
+        db.delete_query_results_for_post(post_id, removed)
+        db.insert_query_results_bulk(
+            [(query_id, post_id, score) for query_id, score in matched.items()],
+            touch_query_ids=gained
+        )
+
+        logger.info(f"[SEARCH] Post {post_id} re-matched: {len(gained)} gained, {len(removed)} removed, "
+                    f"{len(matched) - len(gained)} rescored")
+
+    except Exception as e:
+        logger.error(f"[SEARCH] Error re-matching edited post {post_id}: {e}", exc_info=True)
+        raise
 
 
 def llm_evaluate_post_against_queries(query_batch, new_post):
@@ -1703,14 +2234,6 @@ def llm_evaluate_post_against_queries(query_batch, new_post):
         List of (query_id, score) tuples
     """
     try:
-        # Get API key from config
-        api_key = config.get_anthropic_api_key()
-        if not api_key:
-            raise Exception("ANTHROPIC_API_KEY not found in environment")
-
-        # Initialize Anthropic client
-        client = Anthropic(api_key=api_key)
-
         # Build prompt
         prompt = "You are a semantic search relevance evaluator. Below are search queries from users looking for specific content.\n\n"
 
@@ -1749,17 +2272,15 @@ Include ALL queries in your response, even if score is 0.
         logger.info(f"[LLM] Sending post-to-queries prompt (batch of {len(query_batch)} queries)")
         logger.debug(f"[LLM] Prompt:\n{prompt}")
 
-        response = client.messages.create(
-            model=LLM_MODEL,
-            max_tokens=1000,
-            temperature=0.0,
-            messages=[{"role": "user", "content": prompt}]
-        )
+        context = {
+            'task': 'evaluate',
+            'items': [(query_id, rag_score) for query_id, _, rag_score in query_batch]
+        }
+        response_text = llm_breaker.call(llm.complete, prompt, max_tokens=1000, context=context)
 
         logger.info(f"[LLM] Response received")
 
         # Parse JSON response
-        response_text = response.content[0].text
         logger.info(f"[LLM] Raw response: {response_text[:500]}...")
 
         # Extract JSON from response
@@ -1792,32 +2313,17 @@ Include ALL queries in your response, even if score is 0.
         logger.info(f"[LLM] Parsed {len(scores)} scores successfully")
         return [(item['query_id'], item['score']) for item in scores]
 
+    except CircuitOpenError:
+        logger.info("[LLM] Breaker open, skipping post-to-queries evaluation")
+        raise
     except Exception as e:
         logger.error(f"[LLM] Post-to-queries evaluation failed: {e}", exc_info=True)
         raise
 
 
 def load_all_embeddings():
-    """Load all post embeddings from disk"""
-    embedding_files = []
-    for filename in os.listdir('data/embeddings'):
-        if filename.startswith('post_') and filename.endswith('.npy'):
-            post_id = int(filename.replace('post_', '').replace('.npy', ''))
-            embedding_files.append((post_id, f'data/embeddings/{filename}'))
-
-    embedding_files.sort()
-
-    all_embeddings = []
-    index = []
-
-    for post_id, filepath in embedding_files:
-        emb = np.load(filepath)
-        all_embeddings.append(emb)
-        for frag_idx in range(emb.shape[0]):
-            index.append((post_id, frag_idx))
-
-    all_embeddings = np.vstack(all_embeddings)
-    return all_embeddings, index
+    """All post embeddings as one matrix plus its (post_id, fragment) index (cached in memory)"""
+    return embeddings.load_corpus()
 
 def compute_similarity_gpu(query_emb_float, all_embeddings_float):
     """Compute cosine similarity on GPU (single query vector vs all post vectors)"""
@@ -1959,43 +2465,30 @@ def store_llm_results(prompt, model_name, llm_results):
 def llm_rerank_posts(query_post, candidate_posts):
     """Use Claude Haiku to re-rank search results"""
     try:
-        # Get API key from config
-        api_key = config.get_anthropic_api_key()
-        if not api_key:
-            raise Exception("ANTHROPIC_API_KEY not found in environment")
-
-        # Initialize Anthropic client
-        client = Anthropic(api_key=api_key)
-
         # Build prompt
         prompt = build_reranking_prompt(query_post, candidate_posts)
 
         logger.info(f"[LLM] Prompt being sent to Claude:\n{prompt}")
 
         # CHECK CACHE FIRST
-        cached_results = get_cached_llm_results(prompt, LLM_MODEL)
+        cached_results = get_cached_llm_results(prompt, LLM_CACHE_MODEL)
         if cached_results is not None:
             return cached_results
 
-        # Call Claude Haiku API
+        # Call the LLM backend
         import time
-        logger.info("[LLM] Calling Claude Haiku for re-ranking...")
+        logger.info(f"[LLM] Calling {llm.name} backend for re-ranking...")
         start_time = time.time()
-        response = client.messages.create(
-            model=LLM_MODEL,
-            max_tokens=2000,
-            temperature=0.0,
-            messages=[{
-                "role": "user",
-                "content": prompt
-            }]
-        )
+        context = {
+            'task': 'rerank',
+            'items': [(post['id'], post.get('rag_score', 0.0)) for post in candidate_posts]
+        }
+        response_text = llm_breaker.call(llm.complete, prompt, max_tokens=2000, context=context)
         end_time = time.time()
         api_duration = end_time - start_time
         logger.info(f"[LLM] API call completed in {api_duration:.2f} seconds")
 
         # Parse JSON response
-        response_text = response.content[0].text
         logger.info(f"[LLM] Raw response: {response_text}")
 
         # Extract JSON from response (handle potential markdown code blocks and extra text)
@@ -2030,14 +2523,39 @@ def llm_rerank_posts(query_post, candidate_posts):
         logger.info(f"[LLM] Successfully parsed {len(scores)} scores")
 
         # STORE IN CACHE
-        store_llm_results(prompt, LLM_MODEL, scores)
+        store_llm_results(prompt, LLM_CACHE_MODEL, scores)
 
         return scores
 
+    except CircuitOpenError:
+        logger.info("[LLM] Breaker open, skipping re-ranking")
+        raise
     except Exception as e:
         logger.error(f"[LLM] Re-ranking failed: {e}", exc_info=True)
         raise
 
+def run_llm_rescore_pass(pending):
+    """
+    Re-score items that were stored with RAG-only scores while the LLM breaker was open.
+    Called by the breaker when it closes; runs in a background thread.
+    """
+    def run():
+        logger.info(f"[BREAKER] Starting LLM re-scoring pass for {len(pending)} items")
+        for kind, item_id in pending:
+            try:
+                if kind == 'query':
+                    populate_initial_query_results(item_id, replace=True)
+                elif kind == 'post':
+                    check_post_against_queries(item_id, replace=True)
+            except Exception as e:
+                logger.error(f"[BREAKER] Re-scoring {kind} {item_id} failed: {e}", exc_info=True)
+        logger.info("[BREAKER] LLM re-scoring pass complete")
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+llm_breaker.on_close = run_llm_rescore_pass
+
 @app.route('/api/restart', methods=['POST'])
 def restart():
     """Restart the server (triggers background restart script)"""
@@ -2156,6 +2674,8 @@ def get_debug_logs(device_id):
 def handle_sigterm(signum, frame):
     """Handle SIGTERM signal for graceful shutdown"""
     logger.info(f"Received signal {signum} (SIGTERM), shutting down gracefully")
+    db.events.close()  # End open notification streams
+    db.close_write_behind()  # Write buffered query views and last_activity
     sys.exit(0)
 
 def startup_health_check():
@@ -2196,32 +2716,20 @@ def startup_health_check():
         logger.critical(f"[HEALTH] Database connection test failed: {e}")
         sys.exit(1)
 
-    # Run migrations
-    logger.info("[HEALTH] Running migrations...")
+    # Check 4: Apply pending schema migrations (a single version check when up to date)
+    logger.info("[HEALTH] Checking schema migrations...")
     try:
-        db.migrate_add_clip_offsets()
-        db.migrate_add_ancestor_chains()
-        logger.info("[HEALTH] Migrations complete")
+        applied = db.run_migrations()
+        if applied:
+            logger.info(f"[HEALTH] Applied migrations: {applied}")
+        else:
+            logger.info("[HEALTH] Schema is up to date")
     except Exception as e:
         logger.warning(f"[HEALTH] Migration warning: {e}")
 
-    # Check 4: Create search_cache table if needed
-    logger.info("[HEALTH] Creating search_cache table if needed...")
-    try:
-        db.create_search_cache_table()
-        logger.info("[HEALTH] Search cache table ready")
-    except Exception as e:
-        logger.warning(f"[HEALTH] Failed to create search_cache table: {e}")
-        logger.warning("[HEALTH] Search caching will be disabled")
-
-    # Check 5: Create query_results table if needed
-    logger.info("[HEALTH] Creating query_results table if needed...")
-    try:
-        db.create_query_results_table()
-        logger.info("[HEALTH] Query results table ready")
-    except Exception as e:
-        logger.warning(f"[HEALTH] Failed to create query_results table: {e}")
-        logger.warning("[HEALTH] Query result caching will be disabled")
+    # Check 5: Seed new-content watermarks for notification polling
+    logger.info("[HEALTH] Seeding notification watermarks...")
+    db.seed_content_watermarks()
 
     logger.info("=" * 60)
     logger.info("[HEALTH] All startup checks passed!")
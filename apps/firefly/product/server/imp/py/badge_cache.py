@@ -0,0 +1,114 @@
+"""
+In-memory badge state for query notifications.
+Holds each query's last_match_added_at and each (user_email, query_id) pair's
+last_viewed_at, so badge polls can be answered without a database round-trip.
+Entries are loaded lazily on first use and written through by the Database
+methods that change them (storing matches, recording views, deleting posts).
+"""
+
+import threading
+from datetime import datetime
+from typing import Optional, Dict, List, Iterable, Tuple
+
+# Marks a (user_email, query_id) pair known to have no view recorded
+_NEVER_VIEWED = object()
+
+
+class BadgeCache:
+    """Thread-safe store of the two timestamps that decide a query badge"""
+
+    def __init__(self):
+        self._match_added = {}  # query_id -> datetime | None
+        self._viewed = {}       # (user_email, query_id) -> datetime | _NEVER_VIEWED
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, user_email: str, query_ids: Iterable[int]) -> Tuple[Dict[int, bool], List[int]]:
+        """
+        Answer badges from memory.
+
+        Returns:
+            (flags, missing) - flags for every query fully in the cache, and the
+            query IDs that still need loading from the database
+        """
+        flags = {}
+        missing = []
+        with self._lock:
+            for query_id in query_ids:
+                if query_id in self._match_added and (user_email, query_id) in self._viewed:
+                    flags[query_id] = self._has_new(
+                        self._match_added[query_id],
+                        self._viewed[(user_email, query_id)]
+                    )
+                else:
+                    missing.append(query_id)
+            self.hits += len(flags)
+            self.misses += len(missing)
+        return flags, missing
+
+    def load(self, user_email: str, query_id: int,
+             last_match_added_at: Optional[datetime], last_viewed_at: Optional[datetime]) -> bool:
+        """Store state read from the database and return the badge flag"""
+        viewed = _NEVER_VIEWED if last_viewed_at is None else last_viewed_at
+        with self._lock:
+            # Don't let a slower read overwrite a newer write-through value
+            self._match_added[query_id] = self._newest(self._match_added.get(query_id), last_match_added_at)
+            current = self._viewed.get((user_email, query_id))
+            if current is None or current is _NEVER_VIEWED:
+                self._viewed[(user_email, query_id)] = viewed
+            elif viewed is not _NEVER_VIEWED:
+                self._viewed[(user_email, query_id)] = max(current, viewed)
+            return self._has_new(self._match_added[query_id], self._viewed[(user_email, query_id)])
+
+    def set_match_added(self, query_id: int, timestamp: Optional[datetime]):
+        """Write-through for last_match_added_at (shared by every user)"""
+        with self._lock:
+            self._match_added[query_id] = timestamp
+
+    def set_viewed(self, user_email: str, query_id: int, timestamp: datetime):
+        """Write-through for a user's last_viewed_at"""
+        with self._lock:
+            self._viewed[(user_email, query_id)] = timestamp
+
+    def invalidate_query(self, query_id: int):
+        """Forget all state for a query (e.g. the query post was deleted)"""
+        with self._lock:
+            self._match_added.pop(query_id, None)
+            for key in [key for key in self._viewed if key[1] == query_id]:
+                del self._viewed[key]
+
+    def clear(self):
+        """Forget everything (next lookups reload from the database)"""
+        with self._lock:
+            self._match_added.clear()
+            self._viewed.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Metrics snapshot for /api/health"""
+        with self._lock:
+            return {
+                'queries': len(self._match_added),
+                'user_views': len(self._viewed),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    # Internal helpers
+
+    @staticmethod
+    def _has_new(last_match_added_at, last_viewed_at) -> bool:
+        # Never viewed: new if the query has any matches at all
+        if last_viewed_at is _NEVER_VIEWED:
+            return last_match_added_at is not None
+        return last_match_added_at is not None and last_match_added_at > last_viewed_at
+
+    @staticmethod
+    def _newest(a: Optional[datetime], b: Optional[datetime]) -> Optional[datetime]:
+        if a is None:
+            return b
+        if b is None:
+            return a
+        return max(a, b)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Benchmark ancestor_chain computation (users.ancestor_chain).
+
+Builds a synthetic invite forest in a scratch schema (default 100,000 users) and compares:
+
+    before  - the old backfill: walk users oldest first, one SELECT and one UPDATE each
+    after   - migrations._rebuild_ancestor_chains: one recursive-CTE UPDATE
+    subtree - Database._recompute_ancestor_chains after moving a large subtree to a new inviter
+
+Each result is checked in SQL: every chain must be [self] + its inviter's chain.
+
+Usage:
+    python3 benchmark_ancestor_chains.py [num_users]
+
+The scratch schema (bench_ancestor_chains) is dropped and recreated on every run; the
+real tables are never touched.
+"""
+
+import random
+import sys
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from db import db, Database
+import migrations
+
+SCHEMA = 'bench_ancestor_chains'
+
+def build_fixture(conn, num_users):
+    """Scratch users table with a random invite forest (chains left NULL)"""
+    random.seed(42)
+    invited_by = {}
+    for user_id in range(1, num_users + 1):
+        if user_id <= 3 or random.random() < 0.001:
+            invited_by[user_id] = None
+        else:
+            # Skew toward recent inviters so the tree gets deep as well as wide
+            invited_by[user_id] = random.randint(max(1, user_id - 500), user_id - 1)
+
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        cur.execute(f"SET search_path TO {SCHEMA}")
+        cur.execute("""
+            CREATE TABLE users (
+                id SERIAL PRIMARY KEY,
+                invited_by INTEGER,
+                ancestor_chain INTEGER[],
+                created_at TIMESTAMP
+            )
+        """)
+        # created_at follows id, so the old backfill sees inviters first
+        execute_values(cur, """
+            INSERT INTO users (id, invited_by, created_at) VALUES %s
+        """, [(user_id, inviter, user_id) for user_id, inviter in invited_by.items()],
+            template="(%s, %s, TIMESTAMP '2025-01-01' + %s * interval '1 second')")
+        cur.execute("CREATE INDEX idx_users_invited_by ON users(invited_by)")
+        cur.execute("ANALYZE users")
+    conn.commit()
+    return invited_by
+
+def reset_chains(conn):
+    with conn.cursor() as cur:
+        cur.execute("UPDATE users SET ancestor_chain = NULL")
+    conn.commit()
+
+def chain_errors(conn):
+    """
+    Users whose chain isn't [self] + their inviter's chain ([self] for roots).
+    Zero means every chain is correct, by induction from the roots.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT COUNT(*)
+            FROM users u
+            LEFT JOIN users i ON i.id = u.invited_by
+            WHERE u.ancestor_chain IS DISTINCT FROM
+                  CASE WHEN u.invited_by IS NULL THEN ARRAY[u.id] ELSE u.id || i.ancestor_chain END
+        """)
+        return cur.fetchone()[0]
+
+def max_chain_length(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT MAX(array_length(ancestor_chain, 1)) FROM users")
+        return cur.fetchone()[0]
+
+def before(conn):
+    """The old migrate_add_ancestor_chains loop"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT id, invited_by, ancestor_chain
+            FROM users
+            ORDER BY created_at ASC NULLS FIRST, id ASC
+        """)
+        for user_id, inviter_id, chain in cur.fetchall():
+            if chain is not None:
+                continue
+            if inviter_id is None:
+                chain = [user_id]
+            else:
+                cur.execute("SELECT ancestor_chain FROM users WHERE id = %s", (inviter_id,))
+                inviter = cur.fetchone()
+                if inviter and inviter[0]:
+                    chain = [user_id] + list(inviter[0])
+                else:
+                    chain = [user_id, inviter_id]
+            cur.execute("UPDATE users SET ancestor_chain = %s WHERE id = %s", (chain, user_id))
+    conn.commit()
+
+def after(conn):
+    with conn.cursor() as cur:
+        migrations._rebuild_ancestor_chains(cur)
+        updated = cur.rowcount
+    conn.commit()
+    return updated
+
+def move_subtree(conn, user_id, new_inviter):
+    with conn.cursor() as cur:
+        cur.execute("UPDATE users SET invited_by = %s WHERE id = %s", (new_inviter, user_id))
+        updated = Database._recompute_ancestor_chains(cur, user_id)
+    conn.commit()
+    return updated
+
+def subtree_sizes(invited_by):
+    sizes = {user_id: 1 for user_id in invited_by}
+    for user_id in sorted(invited_by, reverse=True):
+        inviter = invited_by[user_id]
+        if inviter is not None:
+            sizes[inviter] += sizes[user_id]
+    return sizes
+
+def timed(fn):
+    start = time.time()
+    result = fn()
+    return time.time() - start, result
+
+def main():
+    num_users = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    conn = psycopg2.connect(**db.db_config)
+    try:
+        invited_by = build_fixture(conn, num_users)
+        print(f"Fixture: {num_users} users")
+
+        before_s, _ = timed(lambda: before(conn))
+        print(f"\nbefore (per-user SELECT + UPDATE): {before_s:.2f}s, "
+              f"max chain length {max_chain_length(conn)}, wrong chains: {chain_errors(conn)}")
+
+        reset_chains(conn)
+        after_s, updated = timed(lambda: after(conn))
+        print(f"after  (one recursive CTE):        {after_s:.2f}s, {updated} rows, "
+              f"wrong chains: {chain_errors(conn)}, speedup {before_s / max(after_s, 1e-9):.1f}x")
+
+        # Move the largest non-root subtree under a root from another tree
+        sizes = subtree_sizes(invited_by)
+        user_id = max((u for u in invited_by if invited_by[u] is not None), key=lambda u: sizes[u])
+        root = user_id
+        while invited_by[root] is not None:
+            root = invited_by[root]
+        new_inviter = next(u for u in sorted(invited_by) if invited_by[u] is None and u != root)
+        subtree_s, updated = timed(lambda: move_subtree(conn, user_id, new_inviter))
+        print(f"subtree (user {user_id}, {sizes[user_id]} users, moved under {new_inviter}): "
+              f"{subtree_s * 1000:.1f}ms, {updated} rows, wrong chains: {chain_errors(conn)}")
+
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
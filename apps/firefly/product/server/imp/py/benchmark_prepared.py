@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark the prepared hot queries (Database._PREPARED_STATEMENTS) against plain SQL text.
+
+For each read-only statement, with parameters taken from the live database:
+
+    planning - Postgres planning time (EXPLAIN SUMMARY) for the text query and for EXECUTE
+    latency  - best-of-N round trip, sent as text vs executed by name
+
+upsert_query_result is only planned, never run. Nothing is written.
+
+Usage:
+    python3 benchmark_prepared.py [repeat]
+"""
+
+import sys
+import time
+
+import psycopg2
+
+from db import db
+from prepared_statements import StatementRegistry
+
+def sample_params(cur):
+    """Realistic parameters for each statement, or None if the table is empty"""
+    cur.execute("SELECT id FROM posts ORDER BY id DESC LIMIT 1")
+    post = cur.fetchone()
+    cur.execute("SELECT email FROM users ORDER BY id LIMIT 1")
+    user = cur.fetchone()
+    cur.execute("SELECT id FROM posts WHERE template_name = 'query' ORDER BY id LIMIT 50")
+    query_ids = [row[0] for row in cur.fetchall()]
+    if post is None or user is None:
+        return None
+
+    since = '2025-01-01T00:00:00Z'
+    return {
+        'post_by_id': (post[0],),
+        'user_by_email': (user[0],),
+        'query_badge_state': (user[0], query_ids),
+        'upsert_query_result': (post[0], post[0], 0.5),
+        'count_new_users': (since,),
+        'count_new_posts': (since, user[0])
+    }
+
+def best_of(fn, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    text = StatementRegistry(enabled=False)
+    prepared = StatementRegistry(enabled=True)
+    for name, sql in db._PREPARED_STATEMENTS.items():
+        text.register(name, sql)
+        prepared.register(name, sql)
+
+    conn = psycopg2.connect(**db.db_config)
+    try:
+        with conn.cursor() as cur:
+            params = sample_params(cur)
+            if params is None:
+                print("Need at least one user and one post to benchmark.")
+                return
+
+            print(f"{'statement':22s} {'plan text':>10s} {'plan exec':>10s} {'text':>10s} {'prepared':>10s}")
+            for name, args in params.items():
+                # Warm up so the prepared side has settled on its plan
+                for _ in range(10):
+                    if name != 'upsert_query_result':
+                        prepared.execute(cur, name, args)
+                        cur.fetchall()
+                plan_text, plan_exec = prepared.planning_times(cur, name, args)
+
+                if name == 'upsert_query_result':
+                    print(f"{name:22s} {plan_text:9.3f}ms {plan_exec:9.3f}ms {'-':>10s} {'-':>10s}")
+                    continue
+
+                def run(registry):
+                    registry.execute(cur, name, args)
+                    cur.fetchall()
+
+                text_s = best_of(lambda: run(text), repeat)
+                prepared_s = best_of(lambda: run(prepared), repeat)
+                print(f"{name:22s} {plan_text:9.3f}ms {plan_exec:9.3f}ms "
+                      f"{text_s * 1000:9.3f}ms {prepared_s * 1000:9.3f}ms")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
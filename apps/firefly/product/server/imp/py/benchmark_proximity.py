@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Benchmark proximity-ordered profile listings (get_recent_tagged_posts, tag 'profile').
+
+Builds a synthetic invite tree in a scratch schema (default 10,000 users, one profile
+each, some child posts), then for a handful of viewers compares:
+
+    before - fetch every profile with child counts, compute proximity in Python, sort, slice
+    after  - Database._profile_page: the invite tree walks outward from the viewer and the
+             nearest authors' profiles are sorted and LIMITed in the database
+
+and prints EXPLAIN (ANALYZE, BUFFERS) for the first page query.
+
+Usage:
+    python3 benchmark_proximity.py [num_users] [page_size]
+
+The scratch schema (bench_proximity) is dropped and recreated on every run; the real
+tables are never touched.
+"""
+
+import random
+import sys
+import time
+
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+
+from db import db, Database
+
+SCHEMA = 'bench_proximity'
+
+def build_fixture(conn, num_users):
+    """Scratch users/posts/templates with a random invite forest"""
+    random.seed(42)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        cur.execute(f"SET search_path TO {SCHEMA}")
+        cur.execute("""
+            CREATE TABLE users (
+                id SERIAL PRIMARY KEY,
+                email VARCHAR(255) UNIQUE NOT NULL,
+                name TEXT,
+                invited_by INTEGER,
+                ancestor_chain INTEGER[],
+                last_activity TIMESTAMP
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE templates (
+                name TEXT PRIMARY KEY,
+                placeholder_title TEXT, placeholder_summary TEXT, placeholder_body TEXT, plural_name TEXT
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE posts (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER REFERENCES users(id),
+                parent_id INTEGER,
+                title TEXT, summary TEXT, body TEXT, image_url TEXT,
+                clip_offset_x REAL DEFAULT 0, clip_offset_y REAL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                timezone TEXT DEFAULT 'UTC', location_tag TEXT, ai_generated BOOLEAN DEFAULT FALSE,
+                template_name TEXT, has_new_matches BOOLEAN DEFAULT FALSE,
+                child_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cur.execute("CREATE INDEX ON posts(parent_id)")
+        cur.execute("CREATE INDEX ON posts(template_name)")
+        cur.execute("INSERT INTO templates (name, plural_name) VALUES ('profile', 'profiles'), ('post', 'posts')")
+
+        # Invite forest: a few roots, everyone else invited by an earlier user
+        chains = {}
+        invited_by = {}
+        users = []
+        for user_id in range(1, num_users + 1):
+            if user_id <= 3 or random.random() < 0.001:
+                inviter = None
+                chain = [user_id]
+            else:
+                # Skew toward recent inviters so the tree gets deep as well as wide
+                inviter = random.randint(max(1, user_id - 500), user_id - 1)
+                chain = [user_id] + chains[inviter]
+            chains[user_id] = chain
+            invited_by[user_id] = inviter
+            users.append((user_id, f"user{user_id}@bench.local", f"User {user_id}", inviter, chain,
+                          "2025-01-01 00:00:00"))
+        execute_values(cur, """
+            INSERT INTO users (id, email, name, invited_by, ancestor_chain, last_activity) VALUES %s
+        """, users, template="(%s, %s, %s, %s, %s, %s::timestamp + (random() * interval '300 days'))")
+
+        profiles = [(user_id, -1, f"User {user_id}", "About me", "Body", 'profile') for user_id in range(1, num_users + 1)]
+        execute_values(cur, """
+            INSERT INTO posts (user_id, parent_id, title, summary, body, template_name) VALUES %s
+        """, profiles)
+
+        # Some children under profiles so child counts aren't all zero
+        children = [(random.randint(1, num_users), random.randint(1, num_users), "Child", "s", "b", 'post')
+                    for _ in range(num_users // 2)]
+        execute_values(cur, """
+            INSERT INTO posts (user_id, parent_id, title, summary, body, template_name) VALUES %s
+        """, children)
+        cur.execute("""
+            UPDATE posts p SET child_count = c.n
+            FROM (SELECT parent_id, COUNT(*) as n FROM posts WHERE parent_id > 0 GROUP BY parent_id) c
+            WHERE c.parent_id = p.id
+        """)
+
+        cur.execute("ANALYZE")
+    conn.commit()
+
+    depth = max(len(chain) for chain in chains.values())
+    print(f"Fixture: {num_users} users, max chain length {depth}")
+    return chains, invited_by
+
+def before(conn, chain, page_size):
+    """The previous implementation: everything to Python, then sort and slice"""
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            SELECT p.id, p.user_id, p.parent_id, p.title, p.summary, p.body, p.image_url,
+                   p.clip_offset_x, p.clip_offset_y,
+                   p.created_at, p.timezone, p.location_tag, p.ai_generated,
+                   p.template_name, p.has_new_matches,
+                   t.placeholder_title, t.placeholder_summary, t.placeholder_body, t.plural_name,
+                   COALESCE(u.name, u.email) as author_name,
+                   u.email as author_email,
+                   u.ancestor_chain,
+                   u.last_activity,
+                   COUNT(children.id) as child_count
+            FROM posts p
+            LEFT JOIN users u ON p.user_id = u.id
+            LEFT JOIN templates t ON p.template_name = t.name
+            LEFT JOIN posts children ON children.parent_id = p.id
+            WHERE p.template_name IN ('profile')
+            GROUP BY p.id, p.has_new_matches, u.email, u.name, u.ancestor_chain, u.last_activity,
+                     t.placeholder_title, t.placeholder_summary, t.placeholder_body, t.plural_name
+        """)
+        posts = cur.fetchall()
+
+    def calc_proximity(user_chain):
+        if not chain or not user_chain:
+            return 9999
+        chain_set = set(chain)
+        for i, ancestor in enumerate(user_chain):
+            if ancestor in chain_set:
+                return i + chain.index(ancestor)
+        return 9999
+
+    for post in posts:
+        post['proximity'] = calc_proximity(post.get('ancestor_chain') or [])
+    posts.sort(key=lambda p: (
+        p['proximity'],
+        p.get('last_activity') is None,
+        -(p.get('last_activity').timestamp() if p.get('last_activity') else 0)
+    ))
+    return posts[:page_size]
+
+def after(conn, bench_db, viewer, page_size):
+    """The invite-tree implementation (same code path get_recent_tagged_posts runs)"""
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        return bench_db._profile_page(cur, ["p.template_name IN (%s)"], ['profile'], viewer, page_size)
+
+def explain_first_batch(conn, bench_db, viewer, page_size):
+    """EXPLAIN the first page query: the viewer's nearest levels, at least page_size users"""
+    users, distances = [], []
+    for distance, level in bench_db.invite_tree.levels(viewer):
+        users.extend(level)
+        distances.extend([distance] * len(level))
+        if len(users) >= page_size:
+            break
+    query = Database._profile_page_sql(" WHERE p.template_name IN (%s)", reached=True)
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, [users, distances, 'profile', page_size])
+        return [row['QUERY PLAN'] for row in cur.fetchall()]
+
+def timed(fn, repeat=5):
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.time()
+        result = fn()
+        durations.append(time.time() - start)
+    return min(durations), result
+
+def main():
+    num_users = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    conn = psycopg2.connect(**db.db_config)
+    try:
+        chains, invited_by = build_fixture(conn, num_users)
+        with conn.cursor() as cur:
+            cur.execute(f"SET search_path TO {SCHEMA}")
+
+        # Database instance only used for its invite tree and page query (never connects)
+        bench_db = Database(db.db_config)
+        start = time.time()
+        bench_db.invite_tree.load(lambda: invited_by.items())
+        print(f"Invite tree built in {(time.time() - start) * 1000:.1f}ms: {bench_db.invite_tree.stats()}")
+
+        viewers = [1, num_users // 10, num_users // 2, num_users]
+        for viewer in viewers:
+            chain = chains[viewer]
+            before_s, before_rows = timed(lambda: before(conn, chain, page_size))
+            after_s, after_rows = timed(lambda: after(conn, bench_db, viewer, page_size))
+
+            # Same proximity sequence (ties on last_activity may order differently)
+            same = [r['proximity'] for r in before_rows] == [r['proximity'] for r in after_rows]
+            print(f"\nViewer {viewer} (chain length {len(chain)}): "
+                  f"before {before_s * 1000:.1f}ms, after {after_s * 1000:.1f}ms, "
+                  f"speedup {before_s / max(after_s, 1e-9):.1f}x, proximities match: {same}")
+
+        print(f"\nEXPLAIN ANALYZE (viewer {viewers[-1]}):")
+        for line in explain_first_batch(conn, bench_db, viewers[-1], page_size):
+            print("  " + line)
+
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark the search pipeline (RAG + LLM scoring) without network access.
+
+Runs populate_initial_query_results for every query and check_post_against_queries
+for the most recent posts, timing each call. Pick the LLM stand-in with LLM_BACKEND:
+
+    LLM_BACKEND=synthetic python3 benchmark_search.py
+    LLM_BACKEND=record    python3 benchmark_search.py   # capture live responses once
+    LLM_BACKEND=replay    python3 benchmark_search.py   # replay them offline
+
+Note: this rewrites cached query results, so run it against a benchmark database.
+"""
+
+import sys
+import time
+
+from db import db
+from app import populate_initial_query_results, check_post_against_queries, llm
+
+def percentile(values, pct):
+    """Simple nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def report(label, durations):
+    if not durations:
+        print(f"{label}: no runs")
+        return
+    print(f"{label}: n={len(durations)}  "
+          f"mean={sum(durations) / len(durations):.2f}s  "
+          f"p50={percentile(durations, 50):.2f}s  "
+          f"p95={percentile(durations, 95):.2f}s  "
+          f"max={max(durations):.2f}s")
+
+def main():
+    post_limit = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    db.initialize_pool()
+    print(f"LLM backend: {llm.name}")
+
+    queries = db.get_posts_by_template('query')
+    print(f"Populating results for {len(queries)} queries...")
+    query_durations = []
+    for query in queries:
+        query_id = query[0]
+        db.clear_query_results(query_id)
+        start = time.time()
+        populate_initial_query_results(query_id)
+        query_durations.append(time.time() - start)
+
+    posts = db.get_recent_posts(limit=post_limit)
+    posts = [p for p in posts if p.get('template_name') == 'post']
+    print(f"Matching {len(posts)} recent posts against all queries...")
+    post_durations = []
+    for post in posts:
+        start = time.time()
+        check_post_against_queries(post['id'])
+        post_durations.append(time.time() - start)
+
+    print()
+    report("populate_initial_query_results", query_durations)
+    report("check_post_against_queries", post_durations)
+
+    if hasattr(llm, 'hits'):
+        print(f"Replay hits: {llm.hits}, misses (synthetic fallback): {llm.misses}")
+
+    db.close_all_connections()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Check the denormalized posts.child_count column against the real number of children.
+Prints every post whose stored count has drifted; with --fix, corrects them.
+Exits 1 if drift was found and not fixed.
+"""
+
+import sys
+from db import db
+
+def main():
+    fix = '--fix' in sys.argv
+
+    print("Checking posts.child_count...")
+    drift = db.check_child_counts(fix=fix)
+
+    if not drift:
+        print("All child counts are correct.")
+        return 0
+
+    for row in drift:
+        print(f"Post {row['id']}: stored {row['stored']}, actual {row['actual']}")
+
+    if fix:
+        print(f"\nFixed {len(drift)} posts.")
+        return 0
+
+    print(f"\n{len(drift)} posts have a wrong child_count. Run with --fix to correct them.")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
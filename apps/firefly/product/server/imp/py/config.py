@@ -46,5 +46,12 @@ def get_config_value(key: str, default: Optional[str] = None) -> Optional[str]:
     """Get configuration value from environment"""
     return os.getenv(key, default)
 
+def get_float_config(key: str, default: float) -> float:
+    """Get a numeric configuration value (default if unset or not a number)"""
+    try:
+        return float(get_config_value(key) or default)
+    except ValueError:
+        return default
+
 # Load .env file on import
 load_env_file()
@@ -0,0 +1,291 @@
+"""
+Thread-safe, bounded PostgreSQL connection pool.
+
+Replaces psycopg2's SimpleConnectionPool (not thread-safe, and raises the moment
+it runs out). Here, when every connection is in use, getconn() waits in line for
+one to come back, up to wait_timeout. Only then does it raise PoolTimeoutError,
+so a burst of requests queues instead of failing or rebuilding the pool.
+
+Connections are validated on checkout: any that are closed, older than
+max_lifetime, or idle long enough to be suspect (and failing a SELECT 1) are
+replaced. A background thread retires expired idle connections and keeps at
+least minconn open. stats() reports in-use/idle counts, waiters and wait times
+for /api/health.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional, Dict, Any
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolError(Exception):
+    """Pool misuse (unknown connection, pool closed)"""
+    pass
+
+
+class PoolTimeoutError(PoolError):
+    """No connection became available within the wait timeout"""
+    pass
+
+
+class _Pooled:
+    """A pooled connection plus the timestamps used for validation"""
+
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """Bounded pool with a blocking wait queue, checkout validation and background replenishment"""
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        minconn: int = 1,
+        maxconn: int = 10,
+        wait_timeout: float = 10.0,
+        max_lifetime: float = 1800.0,
+        validate_idle_seconds: float = 30.0,
+        replenish_interval: float = 30.0
+    ):
+        """
+        Args:
+            connect: Opens a new connection (e.g. lambda: psycopg2.connect(**config))
+            minconn: Connections kept open (opened eagerly, so a dead server fails here)
+            maxconn: Hard cap on open connections
+            wait_timeout: Seconds getconn() waits for a free connection before PoolTimeoutError
+            max_lifetime: Connections older than this are closed instead of reused
+            validate_idle_seconds: Connections idle longer than this are pinged before checkout
+            replenish_interval: Seconds between background maintenance passes (0 disables the thread)
+        """
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool bounds: minconn={minconn}, maxconn={maxconn}")
+
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.wait_timeout = wait_timeout
+        self.max_lifetime = max_lifetime
+        self.validate_idle_seconds = validate_idle_seconds
+
+        self._idle = deque()     # _Pooled, most recently returned on the right
+        self._in_use = {}        # id(conn) -> _Pooled
+        self._opening = 0        # Connections being opened (count toward maxconn)
+        self._waiters = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        self._stop = threading.Event()
+
+        # Metrics
+        self.checkouts = 0
+        self.timeouts = 0
+        self.created = 0
+        self.discarded = 0       # Closed by validation, lifetime or errors
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        for _ in range(minconn):
+            self._idle.append(self._open())
+
+        self._replenisher = None
+        if replenish_interval > 0:
+            self._replenisher = threading.Thread(
+                target=self._maintain, args=(replenish_interval,), name='db-pool-replenisher', daemon=True
+            )
+            self._replenisher.start()
+
+    # Checkout and return
+
+    def getconn(self, timeout: Optional[float] = None):
+        """
+        Check out a connection, waiting up to `timeout` (default wait_timeout) for one.
+        Raises PoolTimeoutError if none frees up in time.
+        """
+        timeout = self.wait_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            pooled = None
+            with self._cond:
+                self._waiters += 1
+                try:
+                    while True:
+                        if self._closed:
+                            raise PoolError("Connection pool is closed")
+                        if self._idle:
+                            pooled = self._idle.pop()
+                            self._in_use[id(pooled.conn)] = pooled
+                            break
+                        if self._size() < self.maxconn:
+                            self._opening += 1
+                            break
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timeouts += 1
+                            raise PoolTimeoutError(
+                                f"No database connection available after {timeout:.1f}s "
+                                f"({self.maxconn} in use, {self._waiters - 1} other waiters)"
+                            )
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiters -= 1
+
+            if pooled is None:
+                # A free slot: open a new connection outside the lock
+                try:
+                    pooled = self._open()
+                finally:
+                    with self._cond:
+                        self._opening -= 1
+                        if pooled is None:
+                            self._cond.notify()
+                        else:
+                            self._in_use[id(pooled.conn)] = pooled
+            elif not self._usable(pooled):
+                with self._cond:
+                    self._in_use.pop(id(pooled.conn), None)
+                self._discard(pooled)
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self.checkouts += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+            return pooled.conn
+
+    def putconn(self, conn, close: bool = False):
+        """Return a checked-out connection (any open transaction is rolled back)"""
+        # Stays counted as in use until it is back in the idle list (or closed)
+        with self._cond:
+            pooled = self._in_use.get(id(conn))
+        if pooled is None:
+            raise PoolError("Trying to return a connection this pool did not hand out")
+
+        keep = not close and not conn.closed and not self._closed and not self._expired(pooled)
+        if keep and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                keep = False
+
+        if not keep:
+            with self._cond:
+                self._in_use.pop(id(conn), None)
+            self._discard(pooled)
+            return
+
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            self._in_use.pop(id(conn), None)
+            if not self._closed:
+                self._idle.append(pooled)
+                self._cond.notify()
+                return
+        self._close_quietly(conn)
+
+    def closeall(self):
+        """Close idle connections and stop handing out new ones (checked-out ones close on return)"""
+        self._stop.set()
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for pooled in idle:
+            self._close_quietly(pooled.conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot for /api/health"""
+        with self._cond:
+            return {
+                'max': self.maxconn,
+                'open': self._size(),
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'waiters': self._waiters,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'created': self.created,
+                'discarded': self.discarded,
+                'avg_wait_ms': round(1000 * self.total_wait / self.checkouts, 2) if self.checkouts else 0.0,
+                'max_wait_ms': round(1000 * self.max_wait, 2),
+                'closed': self._closed
+            }
+
+    # Internal helpers
+
+    def _size(self) -> int:
+        """Open connections, including ones being opened (caller holds self._cond)"""
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _open(self) -> _Pooled:
+        pooled = _Pooled(self._connect())
+        with self._cond:
+            self.created += 1
+        return pooled
+
+    def _expired(self, pooled: _Pooled) -> bool:
+        return bool(self.max_lifetime) and time.monotonic() - pooled.created_at > self.max_lifetime
+
+    def _usable(self, pooled: _Pooled) -> bool:
+        """Checkout validation: not closed, not too old, and answers a ping if it sat idle a while"""
+        if pooled.conn.closed or self._expired(pooled):
+            return False
+        if time.monotonic() - pooled.last_used < self.validate_idle_seconds:
+            return True
+        try:
+            with pooled.conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            pooled.conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, pooled: _Pooled):
+        self._close_quietly(pooled.conn)
+        with self._cond:
+            self.discarded += 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _maintain(self, interval: float):
+        """Background pass: retire expired idle connections, then top back up to minconn"""
+        while not self._stop.wait(interval):
+            with self._cond:
+                expired = [pooled for pooled in self._idle if self._expired(pooled)]
+                for pooled in expired:
+                    self._idle.remove(pooled)
+                missing = max(0, self.minconn - self._size())
+                self._opening += missing
+            for pooled in expired:
+                self._discard(pooled)
+
+            for _ in range(missing):
+                pooled = None
+                try:
+                    pooled = self._open()
+                except Exception as e:
+                    print(f"[DB] Pool replenish failed: {e}")
+                with self._cond:
+                    self._opening -= 1
+                    if pooled is not None and not self._closed:
+                        self._idle.append(pooled)
+                    elif pooled is not None:
+                        self._close_quietly(pooled.conn)
+                    self._cond.notify()
@@ -4,17 +4,34 @@ Handles PostgreSQL operations with pgvector for semantic search.
 """
 
 import psycopg2
-from psycopg2 import pool
-from psycopg2.extras import RealDictCursor
-from typing import Optional, List, Dict, Any
+from psycopg2.extras import RealDictCursor, execute_values
+from typing import Optional, List, Dict, Any, Tuple
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 import sys
 import embeddings
+from badge_cache import BadgeCache
+from watermarks import ContentWatermarks
+import event_stream
+import row_cache
+import migrations
+from people_directory import PeopleDirectory
+from invite_tree import InviteTree, UNRELATED
+from connection_pool import ConnectionPool
+from unit_of_work import UnitOfWork, ScopedConnection
+from prepared_statements import StatementRegistry
+from write_behind import WriteBehindBuffer
+from contextlib import contextmanager
 import subprocess
 import time
 import threading
 
+
+def _utcnow() -> datetime:
+    """The current time as TIMESTAMP columns hold it (naive UTC, see _create_pool)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class Database:
     """Database connection and operations manager"""
 
@@ -38,6 +55,29 @@ class Database:
         self.db_config = db_config
         self.connection_pool = None
         self._pool_lock = threading.Lock()  # Thread safety for pool initialization
+        self._local = threading.local()  # Current thread's unit of work (see unit_of_work())
+        self.badge_cache = BadgeCache()  # Query badge timestamps, written through below
+        self.watermarks = ContentWatermarks()  # Latest profile/post times for "new content" polls
+        self.events = event_stream.EventBroker()  # Notification events for /api/notifications/stream
+        self.invite_tree = InviteTree()  # users.invited_by index for proximity, updated on signup
+        self.directory = PeopleDirectory(self.invite_tree)  # Rows behind /api/users/recent, refreshed on writes
+        self.rows = row_cache.RowCache(  # Post/user rows for get_post_by_id and the user lookups
+            max_entries=int(os.getenv('ROW_CACHE_SIZE', '5000')),
+            ttl=float(os.getenv('ROW_CACHE_TTL_SECONDS', '10'))
+        )
+        self.statements = StatementRegistry(  # Hot queries, PREPAREd once per pooled connection
+            enabled=os.getenv('DB_PREPARED_STATEMENTS', '1') != '0'
+        )
+        for name, sql in self._PREPARED_STATEMENTS.items():
+            self.statements.register(name, sql)
+        write_behind = {
+            'flush_ms': float(os.getenv('WRITE_BEHIND_FLUSH_MS', '500')),
+            'max_entries': int(os.getenv('WRITE_BEHIND_MAX_ENTRIES', '500')),
+            'enabled': os.getenv('WRITE_BEHIND', '1') != '0'
+        }
+        # query_views.last_viewed_at and users.last_activity, written in batches (see write_behind.py)
+        self.query_views = WriteBehindBuffer('query_views', self._write_query_views, **write_behind)
+        self.activity = WriteBehindBuffer('last_activity', self._write_last_activity, **write_behind)
 
     def check_postgresql_running(self):
         """Check if PostgreSQL is running"""
@@ -75,8 +115,8 @@ class Database:
             print(f"[DB] Error restarting PostgreSQL: {e}")
             return False
 
-    def initialize_pool(self, minconn=1, maxconn=10, retry_with_restart=True):
-        """Initialize the connection pool with thread safety"""
+    def initialize_pool(self, minconn=None, maxconn=None, retry_with_restart=True):
+        """Initialize the connection pool with thread safety (sizes default to DB_POOL_MIN/DB_POOL_MAX)"""
         with self._pool_lock:
             # Check again inside the lock to avoid double initialization
             if self.connection_pool is not None:
@@ -84,9 +124,7 @@ class Database:
                 return
 
             try:
-                self.connection_pool = psycopg2.pool.SimpleConnectionPool(
-                    minconn, maxconn, **self.db_config
-                )
+                self.connection_pool = self._create_pool(minconn, maxconn)
                 print(f"Database connection pool initialized: {self.db_config['host']}:{self.db_config['port']}/{self.db_config['database']}")
             except Exception as e:
                 print(f"Error initializing database pool: {e}")
@@ -96,9 +134,7 @@ class Database:
                     print("[DB] Attempting to restart PostgreSQL and retry...")
                     if self.restart_postgresql():
                         try:
-                            self.connection_pool = psycopg2.pool.SimpleConnectionPool(
-                                minconn, maxconn, **self.db_config
-                            )
+                            self.connection_pool = self._create_pool(minconn, maxconn)
                             print(f"[DB] Database connection pool initialized after restart")
                             return
                         except Exception as e2:
@@ -106,148 +142,228 @@ class Database:
 
                 raise
 
-    def get_connection(self):
-        """Get a connection from the pool"""
-        if self.connection_pool is None:
-            self.initialize_pool()
+    def _create_pool(self, minconn=None, maxconn=None) -> ConnectionPool:
+        return ConnectionPool(
+            # Session time zone pinned to UTC: NOW() in a TIMESTAMP column and _utcnow()
+            # (the write-behind stamps) then agree whatever the server's TimeZone is
+            lambda: psycopg2.connect(**self.db_config, options='-c TimeZone=UTC'),
+            minconn=minconn if minconn is not None else int(os.getenv('DB_POOL_MIN', '1')),
+            maxconn=maxconn if maxconn is not None else int(os.getenv('DB_POOL_MAX', '10')),
+            wait_timeout=float(os.getenv('DB_POOL_WAIT_SECONDS', '10')),
+            max_lifetime=float(os.getenv('DB_POOL_MAX_LIFETIME_SECONDS', '1800'))
+        )
 
-        try:
-            return self.connection_pool.getconn()
-        except Exception as e:
-            # If we can't get a connection, try reinitializing the pool
-            print(f"[DB] Error getting connection, reinitializing pool: {e}")
-            self.connection_pool = None
-            self.initialize_pool()
-            return self.connection_pool.getconn()
+    def get_connection(self):
+        """
+        Get a connection from the pool.
+        Waits (up to DB_POOL_WAIT_SECONDS) when every connection is busy, then raises PoolTimeoutError.
+        Inside unit_of_work(), returns a savepoint on the unit's shared connection instead.
+        """
+        uow = getattr(self._local, 'uow', None)
+        if uow is not None:
+            return uow.begin()
+        return self._checkout()
 
     def return_connection(self, conn):
         """Return a connection to the pool"""
+        if isinstance(conn, ScopedConnection):
+            conn.release()
+            return
+        self._checkin(conn)
+
+    def _checkout(self):
+        if self.connection_pool is None:
+            self.initialize_pool()
+        return self.connection_pool.getconn()
+
+    def _checkin(self, conn):
         if self.connection_pool and conn:
             try:
                 self.connection_pool.putconn(conn)
             except Exception as e:
-                # If we can't return the connection, it's corrupted - close it and reset pool
+                # A connection the pool can't take back is just closed; the pool itself stays up
                 print(f"[DB] Error returning connection to pool: {e}")
                 try:
                     conn.close()
                 except:
                     pass
-                # Reset the pool to recover from corruption
-                print("[DB] Resetting connection pool due to corruption")
-                self.connection_pool.closeall()
-                self.connection_pool = None
+
+    @contextmanager
+    def unit_of_work(self, snapshot: bool = False):
+        """
+        Run a block of Database calls on one connection, in one transaction.
+
+        Commits once when the outermost block exits (rolls back if it raises). Nested
+        blocks join the enclosing unit and roll back only their own part if they raise.
+        Cache/event write-through from the calls inside runs after the commit.
+        Don't hold one across slow non-database work (LLM calls, embedding generation).
+
+        snapshot=True runs the transaction at REPEATABLE READ and bypasses the row cache,
+        so every read in it sees the same committed state (under the default READ
+        COMMITTED each statement sees its own). For read units such as a conditional GET
+        whose ETag and body must agree; ignored by a nested block.
+
+        Usage:
+            with db.unit_of_work():
+                user = db.get_user_by_email(email)
+                post_id = db.create_post(user_id=user['id'], ...)
+        """
+        uow = getattr(self._local, 'uow', None)
+        if uow is not None:
+            scope = uow.begin()
+            uow.depth += 1
+            try:
+                yield uow
+            except BaseException:
+                scope.rollback()
+                raise
+            else:
+                scope.release()
+            finally:
+                uow.depth -= 1
+            return
+
+        conn = self._checkout()
+        uow = UnitOfWork(conn)
+        self._local.uow = uow
+        if snapshot:
+            uow.snapshot = True
+            try:
+                # Must be the transaction's first statement, before any savepoint
+                with conn.cursor() as cur:
+                    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            except BaseException:
+                self._local.uow = None
+                conn.rollback()
+                self._checkin(conn)
+                raise
+        try:
+            yield uow
+            self._local.uow = None
+            uow.commit()
+        except BaseException:
+            try:
+                uow.rollback()
+            except Exception as e:
+                print(f"[DB] Error rolling back unit of work: {e}")
+            raise
+        finally:
+            self._local.uow = None
+            self._checkin(conn)
+
+    def _on_commit(self, conn, fn):
+        """Run fn(conn) once conn's work is committed: now, or when the enclosing unit of work commits"""
+        if isinstance(conn, ScopedConnection):
+            conn.uow.after_commit(fn)
+        else:
+            fn(conn)
+
+    # Row cache (get_post_by_id and the user lookups)
+
+    def _cached_row(self, kind: str, key):
+        """self.rows.get, except in a snapshot unit of work, whose reads must all come from its snapshot"""
+        cached, generation = self.rows.get(kind, key)
+        uow = getattr(self._local, 'uow', None)
+        if uow is not None and uow.snapshot:
+            return None, generation
+        return cached, generation
+
+    def _store_row(self, kind: str, key, row, generation: int):
+        """Cache a row just read, unless this thread's unit of work has uncommitted writes it may reflect (or is a snapshot)"""
+        uow = getattr(self._local, 'uow', None)
+        if uow is not None and (uow.pending_hooks() or uow.snapshot):
+            return
+        self.rows.put(kind, key, row, generation)
+
+    def _invalidate_rows(self, conn, post_ids: Tuple[Optional[int], ...] = (), user_id: Optional[int] = None,
+                         all_posts: bool = False):
+        """
+        Drop cached rows a write touched. Call after conn.commit(): inside a unit of work
+        that is only a savepoint, so they are dropped again once the real commit happens.
+        """
+        def invalidate(_):
+            if all_posts:
+                self.rows.invalidate_all_posts()
+            elif post_ids:
+                self.rows.invalidate_posts(*post_ids)
+            if user_id is not None:
+                self.rows.invalidate_user(user_id)
+
+        invalidate(conn)
+        if isinstance(conn, ScopedConnection):
+            conn.uow.after_commit(invalidate)
 
     def close_all_connections(self):
         """Close all connections in the pool"""
         if self.connection_pool:
             self.connection_pool.closeall()
 
-    def migrate_add_last_activity(self):
-        """Add last_activity column to users table if it doesn't exist"""
-        conn = self.get_connection()
-        try:
-            with conn.cursor() as cur:
-                # Add column if it doesn't exist
-                cur.execute("""
-                    ALTER TABLE users
-                    ADD COLUMN IF NOT EXISTS last_activity TIMESTAMP
-                """)
-
-                # Initialize with most recent post timestamp for existing users
-                cur.execute("""
-                    UPDATE users u
-                    SET last_activity = (
-                        SELECT MAX(p.created_at)
-                        FROM posts p
-                        WHERE p.user_id = u.id
-                    )
-                    WHERE EXISTS (
-                        SELECT 1 FROM posts p WHERE p.user_id = u.id
-                    ) AND last_activity IS NULL
-                """)
-
-                conn.commit()
-                print("Migration: last_activity column added and initialized")
-        except Exception as e:
-            conn.rollback()
-            print(f"Migration error: {e}")
-        finally:
-            self.return_connection(conn)
+    def pool_stats(self) -> Dict[str, Any]:
+        """Connection pool snapshot for /api/health"""
+        if self.connection_pool is None:
+            return {'initialized': False}
+        return self.connection_pool.stats()
+
+    # Hot queries run through self.statements (see prepared_statements.py), $n placeholders
+    _PREPARED_STATEMENTS = {
+        'post_by_id': """
+            SELECT p.id, p.user_id, p.parent_id, p.title, p.summary, p.body, p.image_url,
+                   p.clip_offset_x, p.clip_offset_y,
+                   p.created_at, p.timezone, p.location_tag, p.ai_generated,
+                   p.template_name,
+                   t.placeholder_title, t.placeholder_summary, t.placeholder_body,
+                   COALESCE(u.name, u.email) as author_name,
+                   u.email as author_email,
+                   p.child_count
+            FROM posts p
+            LEFT JOIN users u ON p.user_id = u.id
+            LEFT JOIN templates t ON p.template_name = t.name
+            WHERE p.id = $1
+        """,
+        'user_by_email': """
+            SELECT id, email, name, created_at, device_ids FROM users WHERE email = $1
+        """,
+        # Badge state for the queries a user's badge cache doesn't have yet
+        'query_badge_state': """
+            SELECT p.id, p.last_match_added_at, qv.last_viewed_at
+            FROM posts p
+            LEFT JOIN query_views qv
+                ON p.id = qv.query_id
+                AND qv.user_email = $1
+            WHERE p.id = ANY($2)
+        """,
+        'upsert_query_result': """
+            INSERT INTO query_results (query_id, post_id, relevance_score, matched_at)
+            VALUES ($1, $2, $3, NOW())
+            ON CONFLICT (query_id, post_id)
+            DO UPDATE SET relevance_score = $3, matched_at = NOW()
+        """,
+        # Notification polls (when the watermarks can't answer)
+        'count_new_users': """
+            SELECT COUNT(*) FROM users
+            WHERE profile_complete = TRUE
+            AND profile_completed_at > $1
+        """,
+        'count_new_posts': """
+            SELECT COUNT(*) FROM posts p
+            JOIN users u ON p.user_id = u.id
+            WHERE p.template_name = 'post'
+            AND p.created_at > $1
+            AND u.email != $2
+        """
+    }
 
-    def migrate_add_clip_offsets(self):
-        """Add clip_offset_x and clip_offset_y columns to posts table if they don't exist"""
-        conn = self.get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    ALTER TABLE posts
-                    ADD COLUMN IF NOT EXISTS clip_offset_x REAL DEFAULT 0
-                """)
-                cur.execute("""
-                    ALTER TABLE posts
-                    ADD COLUMN IF NOT EXISTS clip_offset_y REAL DEFAULT 0
-                """)
-                conn.commit()
-                print("Migration: clip_offset_x and clip_offset_y columns added to posts")
-        except Exception as e:
-            conn.rollback()
-            print(f"Migration error: {e}")
-        finally:
-            self.return_connection(conn)
+    def run_migrations(self) -> List[int]:
+        """
+        Apply pending schema migrations (see migrations.py).
+        When the schema is current this is a single SELECT of schema_migrations.
 
-    def migrate_add_ancestor_chains(self):
-        """Add ancestor_chain column to users table and populate for existing users"""
+        Returns:
+            Versions applied; raises RuntimeError if one fails
+        """
         conn = self.get_connection()
         try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                # Add column if not exists
-                cur.execute("""
-                    ALTER TABLE users
-                    ADD COLUMN IF NOT EXISTS ancestor_chain INTEGER[]
-                """)
-                conn.commit()
-                print("Migration: ancestor_chain column added to users")
-
-                # Get all users ordered by creation (oldest first ensures parents processed first)
-                cur.execute("""
-                    SELECT id, invited_by, ancestor_chain
-                    FROM users
-                    ORDER BY created_at ASC NULLS FIRST, id ASC
-                """)
-                users = cur.fetchall()
-
-                updated = 0
-                for user in users:
-                    if user['ancestor_chain'] is not None:
-                        continue  # Already has chain
-
-                    if user['invited_by'] is None:
-                        # Root user - chain is just themselves
-                        chain = [user['id']]
-                    else:
-                        # Get inviter's chain
-                        cur.execute(
-                            "SELECT ancestor_chain FROM users WHERE id = %s",
-                            (user['invited_by'],)
-                        )
-                        inviter = cur.fetchone()
-                        if inviter and inviter['ancestor_chain']:
-                            chain = [user['id']] + list(inviter['ancestor_chain'])
-                        else:
-                            # Inviter doesn't have chain yet, just use self + inviter
-                            chain = [user['id'], user['invited_by']]
-
-                    cur.execute(
-                        "UPDATE users SET ancestor_chain = %s WHERE id = %s",
-                        (chain, user['id'])
-                    )
-                    updated += 1
-
-                conn.commit()
-                print(f"Migration: Updated ancestor_chain for {updated} users")
-        except Exception as e:
-            conn.rollback()
-            print(f"Migration error: {e}")
+            return migrations.apply_pending(conn)
         finally:
             self.return_connection(conn)
 
@@ -272,6 +388,7 @@ class Database:
                 )
                 user_id = cur.fetchone()[0]
                 conn.commit()
+                self._on_commit(conn, lambda _: self.invite_tree.add_user(user_id, None))
                 return user_id
         except psycopg2.IntegrityError:
             conn.rollback()
@@ -285,15 +402,17 @@ class Database:
             self.return_connection(conn)
 
     def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
-        """Get user by email address"""
+        """Get user by email address (cached in self.rows)"""
+        cached, generation = self._cached_row(row_cache.USER_EMAIL, email)
+        if cached is not None:
+            return cached
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(
-                    "SELECT id, email, name, created_at, device_ids FROM users WHERE email = %s",
-                    (email,)
-                )
-                return cur.fetchone()
+                self.statements.execute(cur, 'user_by_email', (email,))
+                user = cur.fetchone()
+                self._store_row(row_cache.USER_EMAIL, email, user, generation)
+                return user
         except Exception as e:
             print(f"Error getting user: {e}")
             return None
@@ -301,7 +420,10 @@ class Database:
             self.return_connection(conn)
 
     def get_user_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Get user by ID"""
+        """Get user by ID (cached in self.rows)"""
+        cached, generation = self._cached_row(row_cache.USER_ID, user_id)
+        if cached is not None:
+            return cached
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -309,7 +431,9 @@ class Database:
                     "SELECT id, email, name, created_at, device_ids, apns_device_token FROM users WHERE id = %s",
                     (user_id,)
                 )
-                return cur.fetchone()
+                user = cur.fetchone()
+                self._store_row(row_cache.USER_ID, user_id, user, generation)
+                return user
         except Exception as e:
             print(f"Error getting user: {e}")
             return None
@@ -326,6 +450,7 @@ class Database:
                     (device_id, user_id, device_id)
                 )
                 conn.commit()
+                self._invalidate_rows(conn, user_id=user_id)
                 return True
         except Exception as e:
             conn.rollback()
@@ -335,15 +460,21 @@ class Database:
             self.return_connection(conn)
 
     def get_user_by_device_id(self, device_id: str) -> Optional[Dict[str, Any]]:
-        """Get user by device ID"""
+        """Get user by device ID (cached in self.rows)"""
+        cached, generation = self._cached_row(row_cache.USER_DEVICE, device_id)
+        if cached is not None:
+            return cached
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                # Containment rather than = ANY(), so idx_users_device_ids (GIN) can serve it
                 cur.execute(
-                    "SELECT id, email, name, created_at, device_ids, invited_by, invited_at, profile_complete FROM users WHERE %s = ANY(device_ids)",
+                    "SELECT id, email, name, created_at, device_ids, invited_by, invited_at, profile_complete FROM users WHERE device_ids @> ARRAY[%s]::text[]",
                     (device_id,)
                 )
-                return cur.fetchone()
+                user = cur.fetchone()
+                self._store_row(row_cache.USER_DEVICE, device_id, user, generation)
+                return user
         except Exception as e:
             print(f"Error getting user by device: {e}")
             return None
@@ -378,6 +509,7 @@ class Database:
                 )
 
                 conn.commit()
+                self._on_commit(conn, lambda _: self.invite_tree.add_user(user_id, invited_by))
                 return user_id
         except psycopg2.IntegrityError:
             conn.rollback()
@@ -390,45 +522,132 @@ class Database:
         finally:
             self.return_connection(conn)
 
-    def get_proximity(self, user_a_id: int, user_b_id: int) -> int:
-        """Calculate proximity between two users based on invite tree distance"""
-        if user_a_id == user_b_id:
-            return 0
+    # pg_advisory_xact_lock key held while a user is moved in the invite tree
+    _INVITE_TREE_LOCK_KEY = 4630118
+
+    def set_invited_by(self, user_id: int, invited_by: Optional[int]) -> bool:
+        """
+        Change who invited a user, recomputing the ancestor chains of the user and everyone below them.
 
+        Args:
+            user_id: User to move
+            invited_by: New inviter (None makes the user a root)
+
+        Returns:
+            True if successful, False otherwise (unknown users, or the new inviter is the user's own invitee)
+        """
         conn = self.get_connection()
         try:
             with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT id, ancestor_chain FROM users WHERE id IN (%s, %s)",
-                    (user_a_id, user_b_id)
-                )
-                rows = cur.fetchall()
+                # One move at a time: two concurrent moves could each pass the cycle
+                # check below and together form a cycle
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (self._INVITE_TREE_LOCK_KEY,))
+
+                if invited_by is not None:
+                    # Walk up from the new inviter through invited_by (not the stored
+                    # ancestor_chain, which may be stale or NULL); UNION stops on a cycle
+                    cur.execute("""
+                        WITH RECURSIVE up AS (
+                            SELECT id, invited_by FROM users WHERE id = %s
+                          UNION
+                            SELECT u.id, u.invited_by
+                            FROM up
+                            JOIN users u ON u.id = up.invited_by
+                        )
+                        SELECT COUNT(*), COALESCE(BOOL_OR(id = %s), FALSE) FROM up
+                    """, (invited_by, user_id))
+                    found, is_invitee = cur.fetchone()
+                    if found == 0:
+                        print(f"Inviter {invited_by} does not exist")
+                        return False
+                    if is_invitee:
+                        print(f"User {invited_by} is in user {user_id}'s invite tree; moving would create a cycle")
+                        return False
 
-                if len(rows) != 2:
-                    return 9999  # User not found
+                cur.execute("UPDATE users SET invited_by = %s WHERE id = %s", (invited_by, user_id))
+                if cur.rowcount == 0:
+                    print(f"User {user_id} does not exist")
+                    conn.rollback()
+                    return False
 
-                chains = {row[0]: row[1] or [] for row in rows}
-                chain_a = chains.get(user_a_id, [])
-                chain_b = chains.get(user_b_id, [])
+                updated = self._recompute_ancestor_chains(cur, user_id)
+                conn.commit()
+                print(f"Moved user {user_id} under {invited_by}: {updated} ancestor chains updated")
+                self._invalidate_rows(conn, user_id=user_id)
 
-                if not chain_a or not chain_b:
-                    return 9999
+                def after_commit(_):
+                    # Everyone below the user gets new depths and ancestors; rebuild the index
+                    if self.invite_tree.loaded:
+                        self.invite_tree.load(self._load_invite_tree)
 
-                # Find common ancestor
-                chain_b_set = set(chain_b)
-                for i, ancestor in enumerate(chain_a):
-                    if ancestor in chain_b_set:
-                        distance_a = i
-                        distance_b = chain_b.index(ancestor)
-                        return distance_a + distance_b
+                self._on_commit(conn, after_commit)
+                return True
+        except Exception as e:
+            conn.rollback()
+            print(f"Error setting inviter: {e}")
+            return False
+        finally:
+            self.return_connection(conn)
 
-                return 9999  # No common ancestor
+    @staticmethod
+    def _recompute_ancestor_chains(cur, user_id: int) -> int:
+        """
+        Rebuild ancestor_chain for user_id and all of their invitees, in one statement:
+        the user's chain comes from their inviter's, then each level down prepends itself.
+
+        Returns:
+            Number of chains that changed
+        """
+        cur.execute("""
+            WITH RECURSIVE chains AS (
+                SELECT u.id,
+                       u.id || COALESCE(i.ancestor_chain,
+                                        CASE WHEN u.invited_by IS NULL THEN ARRAY[]::integer[]
+                                             ELSE ARRAY[u.invited_by] END) as chain
+                FROM users u
+                LEFT JOIN users i ON i.id = u.invited_by
+                WHERE u.id = %s
+              UNION ALL
+                SELECT u.id, u.id || c.chain
+                FROM chains c
+                JOIN users u ON u.invited_by = c.id
+                WHERE u.id <> ALL(c.chain)
+            )
+            UPDATE users u
+            SET ancestor_chain = c.chain
+            FROM chains c
+            WHERE u.id = c.id AND u.ancestor_chain IS DISTINCT FROM c.chain
+        """, (user_id,))
+        return cur.rowcount
+
+    def get_proximity(self, user_a_id: int, user_b_id: int) -> int:
+        """Calculate proximity between two users based on invite tree distance"""
+        if user_a_id == user_b_id:
+            return 0
+
+        try:
+            self._ensure_invite_tree()
+            return self.invite_tree.proximity(user_a_id, user_b_id)
         except Exception as e:
             print(f"Error calculating proximity: {e}")
-            return 9999
+            return UNRELATED
+
+    def _load_invite_tree(self):
+        """(user_id, invited_by) for every user"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT id, invited_by FROM users")
+                users = cur.fetchall()
+            print(f"[DB] Invite tree loaded: {len(users)} users")
+            return users
         finally:
             self.return_connection(conn)
 
+    def _ensure_invite_tree(self):
+        if not self.invite_tree.loaded:
+            self.invite_tree.load(self._load_invite_tree)
+
     def update_user_apns_token(self, user_id: int, apns_token: str) -> bool:
         """Update a user's APNs device token for push notifications"""
         conn = self.get_connection()
@@ -439,6 +658,7 @@ class Database:
                     (apns_token, user_id)
                 )
                 conn.commit()
+                self._invalidate_rows(conn, user_id=user_id)
                 return cur.rowcount > 0
         except Exception as e:
             conn.rollback()
@@ -526,23 +746,35 @@ class Database:
                     INSERT INTO posts
                     (user_id, parent_id, title, summary, body, image_url, timezone, location_tag, ai_generated, embedding, template_name)
                     VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    RETURNING id
+                    RETURNING id, created_at, (SELECT email FROM users WHERE id = posts.user_id)
                     """,
                     (user_id, parent_id, title, summary, body, image_url, timezone, location_tag, ai_generated, embedding, template_name)
                 )
-                post_id = cur.fetchone()[0]
-
-                # Update user's last_activity timestamp
-                cur.execute(
-                    "UPDATE users SET last_activity = NOW() WHERE id = %s",
-                    (user_id,)
-                )
+                post_id, created_at, author_email = cur.fetchone()
+                self._adjust_child_count(cur, parent_id, 1)
 
                 conn.commit()
-
-                # Generate embeddings for the new post
-                embeddings.generate_embeddings(post_id, title, summary, body)
-
+                self._invalidate_rows(conn, post_ids=(parent_id,))
+
+                def after_commit(committed):
+                    # The author's last_activity is written behind (see _write_last_activity)
+                    last_activity = _utcnow()
+                    self.activity.put(user_id, last_activity)
+                    self.directory.touch_user(user_id, last_activity)
+                    self._refresh_directory(committed, [post_id, parent_id])
+
+                    if template_name == 'post' and author_email:
+                        self.watermarks.note_post(author_email, created_at)
+                        self.events.publish(event_stream.NEW_POST, {
+                            'post_id': post_id,
+                            'author_email': author_email,
+                            'created_at': created_at
+                        })
+
+                self._on_commit(conn, after_commit)
+
+                # Embeddings are generated by the caller, after the post is committed
+                # and without holding this connection
                 return post_id
         except Exception as e:
             conn.rollback()
@@ -553,6 +785,12 @@ class Database:
         finally:
             self.return_connection(conn)
 
+    @staticmethod
+    def _adjust_child_count(cur, parent_id: Optional[int], delta: int):
+        """Keep the parent's posts.child_count in step with a child added (+1) or removed (-1)"""
+        if parent_id is not None and parent_id > 0:
+            cur.execute("UPDATE posts SET child_count = child_count + %s WHERE id = %s", (delta, parent_id))
+
     def update_post(
         self,
         post_id: int,
@@ -580,7 +818,7 @@ class Database:
                 cur.execute(
                     """
                     UPDATE posts
-                    SET title = %s, summary = %s, body = %s, image_url = %s
+                    SET title = %s, summary = %s, body = %s, image_url = %s, updated_at = NOW()
                     WHERE id = %s
                     """,
                     (title, summary, body, image_url, post_id)
@@ -612,13 +850,26 @@ class Database:
         try:
             with conn.cursor() as cur:
                 # Check if post exists
-                cur.execute("SELECT id FROM posts WHERE id = %s", (post_id,))
-                if cur.fetchone() is None:
+                cur.execute("SELECT id, template_name, parent_id FROM posts WHERE id = %s", (post_id,))
+                row = cur.fetchone()
+                if row is None:
                     return False
 
-                # Delete the post (child posts will have parent_id set to NULL due to ON DELETE SET NULL)
+                # Delete the post (the posts_delete_children trigger deletes its children)
                 cur.execute("DELETE FROM posts WHERE id = %s", (post_id,))
+                self._adjust_child_count(cur, row[2], -1)
                 conn.commit()
+                # The delete also cascades to its children, so drop every cached post
+                self._invalidate_rows(conn, all_posts=True)
+
+                def after_commit(committed):
+                    self.badge_cache.invalidate_query(post_id)
+                    self._refresh_directory(committed, [post_id, row[2]])
+                    if row[1] == 'post':
+                        # The deleted post may have been its author's latest
+                        self.watermarks.invalidate()
+
+                self._on_commit(conn, after_commit)
                 return True
         except Exception as e:
             conn.rollback()
@@ -628,7 +879,145 @@ class Database:
             self.return_connection(conn)
 
     def get_post_by_id(self, post_id: int) -> Optional[Dict[str, Any]]:
-        """Get a post by ID"""
+        """Get a post by ID (cached in self.rows)"""
+        cached, generation = self._cached_row(row_cache.POST, post_id)
+        if cached is not None:
+            return cached
+        conn = self.get_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                self.statements.execute(cur, 'post_by_id', (post_id,))
+                post = cur.fetchone()
+                self._store_row(row_cache.POST, post_id, post, generation)
+                return post
+        except Exception as e:
+            print(f"Error getting post: {e}")
+            return None
+        finally:
+            self.return_connection(conn)
+
+    # Version stamps for conditional GETs (ETag / Last-Modified)
+
+    def get_post_version(self, post_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Cheap version check for GET /api/posts/<id>.
+
+        Returns:
+            {'digest': str, 'last_modified': datetime} or None if the post doesn't exist
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT p.updated_at,
+                           p.child_count,
+                           p.parent_id,
+                           COALESCE(u.name, u.email)
+                    FROM posts p
+                    LEFT JOIN users u ON p.user_id = u.id
+                    WHERE p.id = %s
+                    """,
+                    (post_id,)
+                )
+                row = cur.fetchone()
+                if row is None:
+                    return None
+                updated_at, child_count, parent_id, author_name = row
+                return {
+                    'digest': f"{updated_at}:{child_count}:{parent_id}:{author_name}",
+                    'last_modified': updated_at
+                }
+        except Exception as e:
+            print(f"Error getting post version: {e}")
+            return None
+        finally:
+            self.return_connection(conn)
+
+    def get_children_version(self, parent_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Cheap version check for GET /api/posts/<id>/children
+        (covers children added/removed/edited and changes to their child counts).
+
+        Returns:
+            {'digest': str, 'last_modified': datetime | None} or None on error
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT md5(COALESCE(string_agg(
+                               c.id || ':' || COALESCE(c.updated_at::text, '') || ':' || c.child_count,
+                               ',' ORDER BY c.id), '')),
+                           MAX(c.updated_at)
+                    FROM posts c
+                    WHERE c.parent_id = %s
+                    """,
+                    (parent_id,)
+                )
+                digest, last_modified = cur.fetchone()
+                return {'digest': digest, 'last_modified': last_modified}
+        except Exception as e:
+            print(f"Error getting children version: {e}")
+            return None
+        finally:
+            self.return_connection(conn)
+
+    def get_query_results_version(self, query_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Cheap version check for GET /api/search?query_id=
+        (stored matches and scores, plus modification times of the matched posts).
+
+        Returns:
+            {'digest': str, 'count': int, 'last_modified': datetime | None} or None on error
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT q.last_match_added_at,
+                           (SELECT COUNT(*) FROM query_results WHERE query_id = q.id),
+                           (SELECT md5(COALESCE(string_agg(
+                                       qr.post_id || ':' || qr.relevance_score || ':' || COALESCE(p.updated_at::text, '') || ':' || p.child_count,
+                                       ',' ORDER BY qr.post_id), ''))
+                            FROM query_results qr
+                            JOIN posts p ON qr.post_id = p.id
+                            WHERE qr.query_id = q.id)
+                    FROM posts q
+                    WHERE q.id = %s
+                    """,
+                    (query_id,)
+                )
+                row = cur.fetchone()
+                if row is None:
+                    return None
+                last_match_added_at, count, digest = row
+                return {
+                    'digest': f"{last_match_added_at}:{digest}",
+                    'count': count,
+                    'last_modified': last_match_added_at
+                }
+        except Exception as e:
+            print(f"Error getting query results version: {e}")
+            return None
+        finally:
+            self.return_connection(conn)
+
+    def get_posts_by_ids(self, post_ids: List[int]) -> List[Dict[str, Any]]:
+        """
+        Get many posts in one query, with author, template and child count joined.
+
+        Args:
+            post_ids: Post IDs to fetch
+
+        Returns:
+            Posts in the same order as post_ids (missing IDs are skipped)
+        """
+        if not post_ids:
+            return []
+
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -641,18 +1030,19 @@ class Database:
                            t.placeholder_title, t.placeholder_summary, t.placeholder_body,
                            COALESCE(u.name, u.email) as author_name,
                            u.email as author_email,
-                           (SELECT COUNT(*) FROM posts WHERE parent_id = p.id) as child_count
+                           p.child_count
                     FROM posts p
                     LEFT JOIN users u ON p.user_id = u.id
                     LEFT JOIN templates t ON p.template_name = t.name
-                    WHERE p.id = %s
+                    WHERE p.id = ANY(%s)
                     """,
-                    (post_id,)
+                    (list(post_ids),)
                 )
-                return cur.fetchone()
+                by_id = {row['id']: row for row in cur.fetchall()}
+                return [by_id[post_id] for post_id in post_ids if post_id in by_id]
         except Exception as e:
-            print(f"Error getting post: {e}")
-            return None
+            print(f"Error getting posts by ids: {e}")
+            return []
         finally:
             self.return_connection(conn)
 
@@ -683,31 +1073,37 @@ class Database:
         finally:
             self.return_connection(conn)
 
-    def get_child_posts(self, parent_id: int) -> List[Dict[str, Any]]:
-        """Get all child posts of a parent post with author names and child counts"""
+    def get_query_ids_by_user(self, user_id: int) -> List[int]:
+        """IDs of the queries a user owns"""
         conn = self.get_connection()
         try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            with conn.cursor() as cur:
                 cur.execute(
-                    """
-                    SELECT p.id, p.user_id, p.parent_id, p.title, p.summary, p.body, p.image_url,
-                           p.clip_offset_x, p.clip_offset_y,
-                           p.created_at, p.timezone, p.location_tag, p.ai_generated,
-                           p.template_name,
-                           t.placeholder_title, t.placeholder_summary, t.placeholder_body,
-                           COALESCE(u.name, u.email) as author_name,
-                           u.email as author_email,
-                           COUNT(children.id) as child_count
-                    FROM posts p
-                    LEFT JOIN users u ON p.user_id = u.id
-                    LEFT JOIN templates t ON p.template_name = t.name
-                    LEFT JOIN posts children ON children.parent_id = p.id
-                    WHERE p.parent_id = %s
-                    GROUP BY p.id, u.email, u.name, t.placeholder_title, t.placeholder_summary, t.placeholder_body
-                    ORDER BY p.created_at DESC
-                    """,
-                    (parent_id,)
+                    "SELECT id FROM posts WHERE user_id = %s AND template_name = 'query'",
+                    (user_id,)
                 )
+                return [row[0] for row in cur.fetchall()]
+        except Exception as e:
+            print(f"Error getting user queries: {e}")
+            return []
+        finally:
+            self.return_connection(conn)
+
+    def get_child_posts(self, parent_id: int, limit: Optional[int] = None,
+                        before: Optional[Tuple[datetime, int]] = None) -> List[Dict[str, Any]]:
+        """Get child posts of a parent post (newest first) with author names and child counts
+
+        Args:
+            parent_id: Parent post
+            limit: Page size (None for all children)
+            before: (created_at, id) keyset from a feed cursor - only older children are returned
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                conditions = ["p.parent_id = %s"]
+                params = [parent_id]
+                cur.execute(self._feed_page_sql(conditions, params, limit, before, include_post_flags=False), params)
                 return cur.fetchall()
         except Exception as e:
             print(f"Error getting child posts: {e}")
@@ -738,7 +1134,7 @@ class Database:
                         t.placeholder_title, t.placeholder_summary, t.placeholder_body,
                         p.title as author_name,
                         u.email as author_email,
-                        (SELECT COUNT(*) FROM posts WHERE parent_id = p.id) as child_count
+                        p.child_count
                     FROM posts p
                     LEFT JOIN users u ON p.user_id = u.id
                     LEFT JOIN templates t ON p.template_name = t.name
@@ -791,6 +1187,7 @@ class Database:
                 """, (user_id, title, summary, body, timezone, image_url))
                 post_id = cur.fetchone()[0]
                 conn.commit()
+                self._on_commit(conn, lambda committed: self._refresh_directory(committed, [post_id]))
                 print(f"[DB] Created profile post {post_id} for user {user_id}", file=sys.stderr, flush=True)
                 return post_id
         except Exception as e:
@@ -861,12 +1258,16 @@ class Database:
                 print("No fields to update")
                 return False
 
+            updates.append("updated_at = NOW()")
             params.append(post_id)
             query = f"UPDATE posts SET {', '.join(updates)} WHERE id = %s"
 
             with conn.cursor() as cur:
                 cur.execute(query, params)
                 conn.commit()
+                self._invalidate_rows(conn, post_ids=(post_id,))
+                if self.directory.has_row(post_id):
+                    self._on_commit(conn, lambda committed: self._refresh_directory(committed, [post_id]))
                 print(f"Updated post {post_id}")
                 return True
         except Exception as e:
@@ -920,31 +1321,19 @@ class Database:
         finally:
             self.return_connection(conn)
 
-    def get_recent_posts(self, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get most recent posts with child counts"""
+    def get_recent_posts(self, limit: int = 50,
+                         before: Optional[Tuple[datetime, int]] = None) -> List[Dict[str, Any]]:
+        """Get most recent posts with child counts
+
+        Args:
+            limit: Page size
+            before: (created_at, id) keyset from a feed cursor - only older posts are returned
+        """
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(
-                    """
-                    SELECT p.id, p.user_id, p.parent_id, p.title, p.summary, p.body, p.image_url,
-                           p.clip_offset_x, p.clip_offset_y,
-                           p.created_at, p.timezone, p.location_tag, p.ai_generated,
-                           p.template_name,
-                           t.placeholder_title, t.placeholder_summary, t.placeholder_body,
-                           COALESCE(u.name, u.email) as author_name,
-                           u.email as author_email,
-                           COUNT(children.id) as child_count
-                    FROM posts p
-                    LEFT JOIN users u ON p.user_id = u.id
-                    LEFT JOIN templates t ON p.template_name = t.name
-                    LEFT JOIN posts children ON children.parent_id = p.id
-                    GROUP BY p.id, u.email, u.name, t.placeholder_title, t.placeholder_summary, t.placeholder_body
-                    ORDER BY p.created_at DESC
-                    LIMIT %s
-                    """,
-                    (limit,)
-                )
+                params = []
+                cur.execute(self._feed_page_sql([], params, limit, before, include_post_flags=False), params)
                 return cur.fetchall()
         except Exception as e:
             print(f"Error getting recent posts: {e}")
@@ -952,75 +1341,225 @@ class Database:
         finally:
             self.return_connection(conn)
 
-    def get_recent_users(self, current_user_id: Optional[int] = None) -> List[Dict[str, Any]]:
-        """Get users ordered by proximity to current user, then by activity"""
-        conn = self.get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                # Get current user's ancestor chain for proximity calculation
-                current_chain = []
-                if current_user_id:
-                    cur.execute(
-                        "SELECT ancestor_chain FROM users WHERE id = %s",
-                        (current_user_id,)
-                    )
-                    result = cur.fetchone()
-                    if result and result['ancestor_chain']:
-                        current_chain = result['ancestor_chain']
-
-                # Fetch all users with profiles
-                cur.execute(
-                    """
-                    SELECT p.id, p.user_id, p.parent_id, p.title, p.summary, p.body, p.image_url,
-                           p.clip_offset_x, p.clip_offset_y,
-                           p.created_at, p.timezone, p.location_tag, p.ai_generated,
-                           p.template_name,
-                           t.placeholder_title, t.placeholder_summary, t.placeholder_body,
-                           COALESCE(u.name, u.email) as author_name,
-                           u.email as author_email,
-                           u.ancestor_chain,
-                           u.last_activity,
-                           COUNT(children.id) as child_count
-                    FROM users u
-                    JOIN posts p ON p.user_id = u.id AND p.parent_id = -1
-                    LEFT JOIN templates t ON p.template_name = t.name
-                    LEFT JOIN posts children ON children.parent_id = p.id
-                    GROUP BY p.id, u.id, u.email, u.name, u.ancestor_chain, u.last_activity,
-                             t.placeholder_title, t.placeholder_summary, t.placeholder_body
-                    """
-                )
-                users = cur.fetchall()
+    @staticmethod
+    def _feed_page_sql(conditions: List[str], params: List[Any], limit: Optional[int],
+                       before: Optional[Tuple[datetime, int]], include_post_flags: bool) -> str:
+        """
+        One page of a newest-first feed, keyset-paginated on (created_at, id).
 
-                # Calculate proximity for each user
-                def calc_proximity(user_chain):
-                    if not current_chain or not user_chain:
-                        return 9999
-                    chain_set = set(current_chain)
-                    for i, ancestor in enumerate(user_chain):
-                        if ancestor in chain_set:
-                            return i + current_chain.index(ancestor)
-                    return 9999
-
-                # Add proximity to each result and sort
-                for user in users:
-                    user_chain = user.get('ancestor_chain') or []
-                    user['proximity'] = calc_proximity(user_chain)
-
-                # Sort by proximity (ascending), then by last_activity (descending, None last)
-                users.sort(key=lambda u: (
-                    u['proximity'],
-                    u.get('last_activity') is None,  # None values last
-                    -(u.get('last_activity').timestamp() if u.get('last_activity') else 0)
-                ))
-
-                return users
+        The page is picked by walking the (..., created_at DESC, id DESC) indexes from the
+        cursor position, and only its rows are joined with authors, templates and child
+        counts, so a deep page costs the same as the first. Appends the keyset and LIMIT
+        values to params.
+
+        include_post_flags adds has_new_matches, plural_name, ancestor_chain and
+        last_activity (the recent-tagged row shape).
+        """
+        conditions = list(conditions)
+        if before is not None:
+            conditions.append("(p.created_at, p.id) < (%s, %s)")
+            params.extend(before)
+        where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+        limit_clause = ""
+        if limit is not None:
+            limit_clause = "LIMIT %s"
+            params.append(limit)
+
+        extra_columns = ""
+        if include_post_flags:
+            extra_columns = """
+                   p.has_new_matches, t.plural_name,
+                   u.ancestor_chain,
+                   u.last_activity,"""
+
+        return f"""
+            WITH page AS (
+                SELECT p.id
+                FROM posts p
+                {where}
+                ORDER BY p.created_at DESC, p.id DESC
+                {limit_clause}
+            )
+            SELECT p.id, p.user_id, p.parent_id, p.title, p.summary, p.body, p.image_url,
+                   p.clip_offset_x, p.clip_offset_y,
+                   p.created_at, p.timezone, p.location_tag, p.ai_generated,
+                   p.template_name,
+                   t.placeholder_title, t.placeholder_summary, t.placeholder_body,
+                   COALESCE(u.name, u.email) as author_name,
+                   u.email as author_email,{extra_columns}
+                   p.child_count
+            FROM page
+            JOIN posts p ON p.id = page.id
+            LEFT JOIN users u ON p.user_id = u.id
+            LEFT JOIN templates t ON p.template_name = t.name
+            ORDER BY p.created_at DESC, p.id DESC
+        """
+
+    def get_recent_users(self, current_user_id: Optional[int] = None, limit: Optional[int] = None,
+                         offset: int = 0) -> List[Dict[str, Any]]:
+        """Get users ordered by proximity to current user, then by activity
+
+        Served from self.directory (loaded on first use, refreshed by the post/user write paths).
+
+        Args:
+            current_user_id: Viewer for proximity ordering
+            limit: Page size (None for everyone)
+            offset: Rows to skip
+        """
+        try:
+            self._ensure_invite_tree()
+            if not self.directory.loaded:
+                self.directory.load(self._load_directory)
+            return self.directory.page(current_user_id, limit=limit, offset=offset)
         except Exception as e:
             print(f"Error getting recent users: {e}")
             return []
+
+    # People directory loading (see people_directory.py)
+
+    _DIRECTORY_ROW_SQL = """
+        SELECT p.id, p.user_id, p.parent_id, p.title, p.summary, p.body, p.image_url,
+               p.clip_offset_x, p.clip_offset_y,
+               p.created_at, p.timezone, p.location_tag, p.ai_generated,
+               p.template_name,
+               t.placeholder_title, t.placeholder_summary, t.placeholder_body,
+               COALESCE(u.name, u.email) as author_name,
+               u.email as author_email,
+               u.ancestor_chain,
+               u.last_activity,
+               p.child_count
+        FROM users u
+        JOIN posts p ON p.user_id = u.id AND p.parent_id = -1
+        LEFT JOIN templates t ON p.template_name = t.name
+        {where}
+    """
+
+    def _load_directory(self):
+        """Full directory snapshot: all profile rows"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(self._DIRECTORY_ROW_SQL.format(where=''))
+                rows = cur.fetchall()
+            print(f"[DB] People directory loaded: {len(rows)} rows")
+            return self._overlay_activity(rows)
         finally:
             self.return_connection(conn)
 
-    def get_recent_tagged_posts(self, tags: List[str] = None, user_id: Optional[int] = None, limit: int = 50, current_user_email: Optional[str] = None, after: Optional[str] = None, current_user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    def _refresh_directory(self, conn, post_ids: List[Optional[int]]):
+        """Re-read directory rows for post_ids on the caller's (committed) connection"""
+        def load_rows(ids):
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(self._DIRECTORY_ROW_SQL.format(where='WHERE p.id = ANY(%s)'), (ids,))
+                return self._overlay_activity(cur.fetchall())
+
+        try:
+            self.directory.refresh(post_ids, load_rows)
+        except Exception as e:
+            # Never fail the write; rebuild from scratch on next read instead
+            print(f"Error refreshing people directory: {e}")
+            self.directory.invalidate()
+
+    @staticmethod
+    def _profile_page_sql(where: str, reached: bool) -> str:
+        """
+        One page of profile posts ordered by proximity, then activity.
+        The page is chosen first, so only its rows are joined with templates and child counts.
+
+        reached=True: authors limited to a proximity table from the invite tree;
+            parameters are [user_ids], [proximities], then those in `where`, then LIMIT.
+        reached=False: everyone else, all UNRELATED; parameters are those in `where`, then LIMIT.
+        """
+        if reached:
+            source = """
+                FROM unnest(%s::integer[], %s::integer[]) AS prox(user_id, proximity)
+                JOIN posts p ON p.user_id = prox.user_id"""
+            proximity = "prox.proximity"
+        else:
+            source = "FROM posts p"
+            proximity = str(UNRELATED)
+
+        return f"""
+            WITH page AS (
+                SELECT p.id, {proximity} as proximity, u.last_activity
+                {source}
+                LEFT JOIN users u ON p.user_id = u.id
+                {where}
+                ORDER BY proximity, u.last_activity DESC NULLS LAST, p.id
+                LIMIT %s
+            )
+            SELECT p.id, p.user_id, p.parent_id, p.title, p.summary, p.body, p.image_url,
+                   p.clip_offset_x, p.clip_offset_y,
+                   p.created_at, p.timezone, p.location_tag, p.ai_generated,
+                   p.template_name, p.has_new_matches,
+                   t.placeholder_title, t.placeholder_summary, t.placeholder_body, t.plural_name,
+                   COALESCE(u.name, u.email) as author_name,
+                   u.email as author_email,
+                   u.ancestor_chain,
+                   u.last_activity,
+                   p.child_count,
+                   page.proximity
+            FROM page
+            JOIN posts p ON p.id = page.id
+            LEFT JOIN users u ON p.user_id = u.id
+            LEFT JOIN templates t ON p.template_name = t.name
+            ORDER BY page.proximity, page.last_activity DESC NULLS LAST, p.id
+        """
+
+    def _profile_page(self, cur, conditions: List[str], params: List[Any], viewer_id: Optional[int],
+                      limit: int) -> List[Dict[str, Any]]:
+        """
+        Profile posts for a viewer, nearest authors first.
+
+        Walks the invite tree outward from the viewer a few whole distance levels at a
+        time (doubling the batch each round), fetching the best rows among those authors,
+        until the page is full; whatever is left comes from authors the walk never
+        reached, by activity. A page near the viewer only looks at nearby users.
+        """
+        posts = []
+        reached_users = []
+
+        if viewer_id is not None:
+            where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+            query = self._profile_page_sql(where, reached=True)
+            batch_target = max(limit, 1)
+            batch_users, batch_distances = [], []
+            levels = self.invite_tree.levels(viewer_id)
+            exhausted = False
+            while len(posts) < limit and not exhausted:
+                # Whole levels only, so activity order within a distance is never split
+                level = next(levels, None)
+                if level is not None:
+                    distance, user_ids = level
+                    batch_users.extend(user_ids)
+                    batch_distances.extend([distance] * len(user_ids))
+                    if len(batch_users) < batch_target:
+                        continue
+                else:
+                    exhausted = True
+                if not batch_users:
+                    break
+
+                cur.execute(query, [batch_users, batch_distances] + params + [limit - len(posts)])
+                posts.extend(cur.fetchall())
+                reached_users.extend(batch_users)
+                batch_users, batch_distances = [], []
+                batch_target *= 2
+
+        if len(posts) < limit:
+            tail_conditions = list(conditions)
+            tail_params = list(params)
+            if reached_users:
+                tail_conditions.append("NOT (p.user_id = ANY(%s))")
+                tail_params.append(reached_users)
+            where = (" WHERE " + " AND ".join(tail_conditions)) if tail_conditions else ""
+            cur.execute(self._profile_page_sql(where, reached=False), tail_params + [limit - len(posts)])
+            posts.extend(cur.fetchall())
+
+        # Activity order above is as of the last write-behind flush; the rows show the latest
+        return self._overlay_activity(posts)
+
+    def get_recent_tagged_posts(self, tags: List[str] = None, user_id: Optional[int] = None, limit: int = 50, current_user_email: Optional[str] = None, after: Optional[str] = None, current_user_id: Optional[int] = None, before: Optional[Tuple[datetime, int]] = None) -> List[Dict[str, Any]]:
         """Get recent posts filtered by template tags and optionally by user.
 
         For profile posts, incomplete profiles (empty summary AND body) are hidden
@@ -1029,39 +1568,14 @@ class Database:
         Args:
             after: ISO8601 timestamp - only return posts created after this time
             current_user_id: ID of current user for proximity sorting (profiles)
+            before: (created_at, id) keyset from a feed cursor - only older posts are returned
+                    (not used for profiles, which are ordered by proximity)
         """
         conn = self.get_connection()
         try:
+            # Proximity to the current user comes from the shared invite tree
+            self._ensure_invite_tree()
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                # Get current user's ancestor chain for proximity sorting
-                current_chain = []
-                if current_user_id:
-                    cur.execute(
-                        "SELECT ancestor_chain FROM users WHERE id = %s",
-                        (current_user_id,)
-                    )
-                    result = cur.fetchone()
-                    if result and result['ancestor_chain']:
-                        current_chain = result['ancestor_chain']
-
-                # Build query
-                query = """
-                    SELECT p.id, p.user_id, p.parent_id, p.title, p.summary, p.body, p.image_url,
-                           p.clip_offset_x, p.clip_offset_y,
-                           p.created_at, p.timezone, p.location_tag, p.ai_generated,
-                           p.template_name, p.has_new_matches,
-                           t.placeholder_title, t.placeholder_summary, t.placeholder_body, t.plural_name,
-                           COALESCE(u.name, u.email) as author_name,
-                           u.email as author_email,
-                           u.ancestor_chain,
-                           u.last_activity,
-                           COUNT(children.id) as child_count
-                    FROM posts p
-                    LEFT JOIN users u ON p.user_id = u.id
-                    LEFT JOIN templates t ON p.template_name = t.name
-                    LEFT JOIN posts children ON children.parent_id = p.id
-                """
-
                 conditions = []
                 params = []
 
@@ -1088,59 +1602,26 @@ class Database:
                     conditions.append("p.created_at > %s")
                     params.append(after)
 
-                # Add WHERE clause if conditions exist
-                if conditions:
-                    query += " WHERE " + " AND ".join(conditions)
-
-                # Group by
-                query += " GROUP BY p.id, p.has_new_matches, u.email, u.name, u.ancestor_chain, u.last_activity, t.placeholder_title, t.placeholder_summary, t.placeholder_body, t.plural_name"
-
-                # Sort order - if profile tag, we'll sort by proximity in Python
-                # Otherwise sort by post date in SQL
-                if not (tags and "profile" in tags):
-                    query += " ORDER BY p.created_at DESC"
-
-                # Add limit (but for profiles, we fetch all and sort by proximity, then limit)
-                if not (tags and "profile" in tags):
-                    query += " LIMIT %s"
-                    params.append(limit)
+                if tags and "profile" in tags:
+                    # Profiles: proximity first, then activity - nearest authors' pages are
+                    # fetched first, so only the requested page is joined with child counts
+                    return self._profile_page(cur, conditions, params, current_user_id or None, limit)
 
-                cur.execute(query, params)
-                posts = cur.fetchall()
-
-                # Helper to calculate proximity
-                def calc_proximity(user_chain):
-                    if not current_chain or not user_chain:
-                        return 9999
-                    chain_set = set(current_chain)
-                    for i, ancestor in enumerate(user_chain):
-                        if ancestor in chain_set:
-                            return i + current_chain.index(ancestor)
-                    return 9999
-
-                # Calculate proximity for all posts
+                # Posts/queries: newest first in SQL (keyset page), proximity as tiebreaker below
+                cur.execute(self._feed_page_sql(conditions, params, limit, before, include_post_flags=True), params)
+                posts = self._overlay_activity(cur.fetchall())
                 for post in posts:
-                    user_chain = post.get('ancestor_chain') or []
-                    post['proximity'] = calc_proximity(user_chain)
-
-                # Sort based on content type
-                if tags and "profile" in tags:
-                    # Profiles: proximity first, then activity
-                    posts.sort(key=lambda p: (
-                        p['proximity'],
-                        p.get('last_activity') is None,
-                        -(p.get('last_activity').timestamp() if p.get('last_activity') else 0)
-                    ))
-                    posts = posts[:limit]
-                else:
-                    # Posts/queries: date (day) first, proximity as tiebreaker within same day
-                    def get_date_key(p):
-                        created = p.get('created_at')
-                        if created is None:
-                            return (1, None, 9999)  # None dates sort last
-                        # Sort by date (newest first), then proximity (closest first)
-                        return (0, -created.toordinal(), p['proximity'])
-                    posts.sort(key=get_date_key)
+                    post['proximity'] = (self.invite_tree.proximity(current_user_id, post['user_id'])
+                                         if current_user_id and post['user_id'] is not None else UNRELATED)
+
+                # Date (day) first, proximity as tiebreaker within same day
+                def get_date_key(p):
+                    created = p.get('created_at')
+                    if created is None:
+                        return (1, None, 9999)  # None dates sort last
+                    # Sort by date (newest first), then proximity (closest first)
+                    return (0, -created.toordinal(), p['proximity'])
+                posts.sort(key=get_date_key)
 
                 return posts
         except Exception as e:
@@ -1170,17 +1651,23 @@ class Database:
                         print(f"Parent post {parent_id} does not exist")
                         return False
 
-                cur.execute("SELECT id FROM posts WHERE id = %s", (post_id,))
-                if cur.fetchone() is None:
+                cur.execute("SELECT id, parent_id FROM posts WHERE id = %s", (post_id,))
+                existing = cur.fetchone()
+                if existing is None:
                     print(f"Post {post_id} does not exist")
                     return False
 
                 # Update the parent_id
                 cur.execute(
-                    "UPDATE posts SET parent_id = %s WHERE id = %s",
+                    "UPDATE posts SET parent_id = %s, updated_at = NOW() WHERE id = %s",
                     (parent_id, post_id)
                 )
+                if existing[1] != parent_id:
+                    self._adjust_child_count(cur, existing[1], -1)
+                    self._adjust_child_count(cur, parent_id, 1)
                 conn.commit()
+                self._invalidate_rows(conn, post_ids=(post_id, existing[1], parent_id))
+                self._on_commit(conn, lambda committed: self._refresh_directory(committed, [post_id, existing[1], parent_id]))
                 return True
         except Exception as e:
             conn.rollback()
@@ -1189,72 +1676,49 @@ class Database:
         finally:
             self.return_connection(conn)
 
-    def create_search_cache_table(self):
-        """Create search_cache table for LLM result caching"""
-        conn = self.get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS search_cache (
-                        prompt_hash TEXT PRIMARY KEY,
-                        model_name TEXT NOT NULL,
-                        llm_results TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-
-                cur.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_search_cache_model
-                    ON search_cache(model_name)
-                """)
+    def check_child_counts(self, fix: bool = False) -> List[Dict[str, int]]:
+        """
+        Compare posts.child_count with the actual number of children.
 
-                conn.commit()
-                print("Search cache table created successfully")
-        except Exception as e:
-            conn.rollback()
-            print(f"Error creating search_cache table: {e}")
-        finally:
-            self.return_connection(conn)
+        Args:
+            fix: Also overwrite the stored counts that are wrong
 
-    def create_query_results_table(self):
-        """Create query_results table for cached search results"""
+        Returns:
+            [{'id', 'stored', 'actual'}] for every post whose stored count was wrong
+        """
         conn = self.get_connection()
         try:
-            with conn.cursor() as cur:
-                # Create query_results table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS query_results (
-                        id SERIAL PRIMARY KEY,
-                        query_id INTEGER REFERENCES posts(id) ON DELETE CASCADE,
-                        post_id INTEGER REFERENCES posts(id) ON DELETE CASCADE,
-                        relevance_score FLOAT NOT NULL,
-                        matched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        UNIQUE(query_id, post_id)
-                    )
-                """)
-
-                # Create indexes for fast queries
-                cur.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_query_results_query_id
-                    ON query_results(query_id)
-                """)
-
-                cur.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_query_results_score
-                    ON query_results(query_id, relevance_score DESC)
-                """)
-
-                # Add has_new_matches column to posts table
-                cur.execute("""
-                    ALTER TABLE posts
-                    ADD COLUMN IF NOT EXISTS has_new_matches BOOLEAN DEFAULT FALSE
-                """)
-
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                drift_sql = """
+                    SELECT p.id, p.child_count as stored, COALESCE(c.actual, 0) as actual
+                    FROM posts p
+                    LEFT JOIN (
+                        SELECT parent_id, COUNT(*) as actual
+                        FROM posts
+                        WHERE parent_id > 0
+                        GROUP BY parent_id
+                    ) c ON c.parent_id = p.id
+                    WHERE p.child_count IS DISTINCT FROM COALESCE(c.actual, 0)
+                """
+                if fix:
+                    cur.execute(f"""
+                        UPDATE posts p
+                        SET child_count = drift.actual
+                        FROM ({drift_sql}) drift
+                        WHERE p.id = drift.id
+                        RETURNING p.id, drift.stored, drift.actual
+                    """)
+                else:
+                    cur.execute(drift_sql + " ORDER BY p.id")
+                rows = [dict(row) for row in cur.fetchall()]
                 conn.commit()
-                print("Query results table created successfully")
+                if fix and rows:
+                    self._invalidate_rows(conn, post_ids=tuple(row['id'] for row in rows))
+                return sorted(rows, key=lambda row: row['id'])
         except Exception as e:
             conn.rollback()
-            print(f"Error creating query_results table: {e}")
+            print(f"Error checking child counts: {e}")
+            return []
         finally:
             self.return_connection(conn)
 
@@ -1282,16 +1746,76 @@ class Database:
         conn = self.get_connection()
         try:
             with conn.cursor() as cur:
-                cur.execute("""
+                self.statements.execute(cur, 'upsert_query_result', (query_id, post_id, score))
+                conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error inserting query result: {e}")
+        finally:
+            self.return_connection(conn)
+
+    def insert_query_results_bulk(self, rows: List[tuple], touch_query_ids: Optional[List[int]] = None) -> int:
+        """
+        Insert or update many query result matches in a single transaction.
+        Also bumps last_match_added_at for the affected queries in the same commit.
+
+        Args:
+            rows: List of (query_id, post_id, score) tuples
+            touch_query_ids: Queries whose last_match_added_at should be bumped
+                             (defaults to every query in rows)
+
+        Returns:
+            Number of matches written (0 on error)
+        """
+        if not rows:
+            return 0
+
+        # One row per (query_id, post_id) - ON CONFLICT can't touch a row twice per statement
+        deduped = {}
+        for query_id, post_id, score in rows:
+            deduped[(int(query_id), int(post_id))] = float(score)
+        values = [(query_id, post_id, score) for (query_id, post_id), score in deduped.items()]
+        if touch_query_ids is None:
+            query_ids = sorted({query_id for query_id, _, _ in values})
+        else:
+            query_ids = sorted({int(query_id) for query_id in touch_query_ids})
+
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                execute_values(cur, """
                     INSERT INTO query_results (query_id, post_id, relevance_score, matched_at)
-                    VALUES (%s, %s, %s, NOW())
+                    VALUES %s
                     ON CONFLICT (query_id, post_id)
-                    DO UPDATE SET relevance_score = %s, matched_at = NOW()
-                """, (query_id, post_id, score, score))
+                    DO UPDATE SET relevance_score = EXCLUDED.relevance_score, matched_at = NOW()
+                """, values, template="(%s, %s, %s, NOW())")
+
+                touched = []
+                if query_ids:
+                    cur.execute("""
+                        UPDATE posts
+                        SET last_match_added_at = CURRENT_TIMESTAMP
+                        WHERE id = ANY(%s)
+                        RETURNING id, last_match_added_at
+                    """, (query_ids,))
+                    touched = cur.fetchall()
+
                 conn.commit()
+
+                def after_commit(_):
+                    for query_id, last_match_added_at in touched:
+                        self.badge_cache.set_match_added(query_id, last_match_added_at)
+                        self.events.publish(event_stream.QUERY_MATCH, {
+                            'query_id': query_id,
+                            'last_match_added_at': last_match_added_at
+                        })
+
+                self._on_commit(conn, after_commit)
+                return len(values)
         except Exception as e:
             conn.rollback()
-            print(f"Error inserting query result: {e}")
+            print(f"Error bulk inserting query results: {e}")
+            return 0
         finally:
             self.return_connection(conn)
 
@@ -1311,23 +1835,71 @@ class Database:
             self.return_connection(conn)
 
     def record_query_view(self, user_email: str, query_id: int):
-        """Record that a user viewed a query's results"""
+        """Record that a user viewed a query's results (written behind, see _write_query_views)"""
+        last_viewed_at = _utcnow()
+        self.query_views.put((query_id, user_email), last_viewed_at)
+        self.badge_cache.set_viewed(user_email, query_id, last_viewed_at)
+        self.events.publish(event_stream.QUERY_VIEWED, {
+            'query_id': query_id,
+            'user_email': user_email,
+            'last_viewed_at': last_viewed_at
+        })
+
+    # Write-behind flushes (see write_behind.py). Timestamps are _utcnow() from this
+    # process, on the same UTC scale as NOW() on our connections (TimeZone=UTC).
+
+    def _write_query_views(self, batch: List[Tuple[Tuple[int, str], datetime]]):
+        """Upsert buffered query views in one statement (views of since-deleted queries are dropped)"""
         conn = self.get_connection()
         try:
             with conn.cursor() as cur:
-                cur.execute("""
+                values = [(query_id, user_email, viewed_at) for (query_id, user_email), viewed_at in batch]
+                execute_values(cur, """
                     INSERT INTO query_views (query_id, user_email, last_viewed_at)
-                    VALUES (%s, %s, CURRENT_TIMESTAMP)
+                    SELECT v.query_id, v.user_email, v.last_viewed_at
+                    FROM (VALUES %s) AS v(query_id, user_email, last_viewed_at)
+                    JOIN posts p ON p.id = v.query_id
                     ON CONFLICT (query_id, user_email)
-                    DO UPDATE SET last_viewed_at = CURRENT_TIMESTAMP
-                """, (query_id, user_email))
-                conn.commit()
-        except Exception as e:
+                    DO UPDATE SET last_viewed_at = GREATEST(query_views.last_viewed_at, EXCLUDED.last_viewed_at)
+                """, values, page_size=len(values))
+            conn.commit()
+        except Exception:
             conn.rollback()
-            print(f"Error recording query view: {e}")
+            raise
         finally:
             self.return_connection(conn)
 
+    def _write_last_activity(self, batch: List[Tuple[int, datetime]]):
+        """Apply buffered users.last_activity bumps in one statement"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                execute_values(cur, """
+                    UPDATE users u
+                    SET last_activity = GREATEST(u.last_activity, v.last_activity)
+                    FROM (VALUES %s) AS v(id, last_activity)
+                    WHERE u.id = v.id
+                """, batch, page_size=len(batch))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.return_connection(conn)
+
+    def close_write_behind(self):
+        """Flush buffered query views and last_activity and stop their threads (on shutdown)"""
+        self.query_views.close()
+        self.activity.close()
+
+    def _overlay_activity(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Show last_activity bumps that are still in the write-behind buffer"""
+        for row in rows:
+            buffered = self.activity.get(row['user_id'])
+            if buffered is not None:
+                row['last_activity'] = self.activity.newest(row.get('last_activity'), buffered)
+        return rows
+
     def update_last_match_added(self, query_id: int):
         """Update the last_match_added_at timestamp for a query"""
         conn = self.get_connection()
@@ -1337,48 +1909,153 @@ class Database:
                     UPDATE posts
                     SET last_match_added_at = CURRENT_TIMESTAMP
                     WHERE id = %s
+                    RETURNING last_match_added_at
                 """, (query_id,))
+                row = cur.fetchone()
                 conn.commit()
+                if row is not None:
+                    def after_commit(_):
+                        self.badge_cache.set_match_added(query_id, row[0])
+                        self.events.publish(event_stream.QUERY_MATCH, {
+                            'query_id': query_id,
+                            'last_match_added_at': row[0]
+                        })
+
+                    self._on_commit(conn, after_commit)
         except Exception as e:
             conn.rollback()
             print(f"Error updating last_match_added_at: {e}")
         finally:
             self.return_connection(conn)
 
+    # "New content" watermarks (users/posts notification badges)
+
+    def seed_content_watermarks(self):
+        """Load the latest profile completion and per-author latest post into self.watermarks"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT MAX(profile_completed_at) FROM users
+                    WHERE profile_complete = TRUE
+                """)
+                latest_profile_completed_at = cur.fetchone()[0]
+
+                cur.execute("""
+                    SELECT u.email, MAX(p.created_at)
+                    FROM posts p
+                    JOIN users u ON p.user_id = u.id
+                    WHERE p.template_name = 'post'
+                    GROUP BY u.email
+                """)
+                author_latest = cur.fetchall()
+
+            self.watermarks.seed(latest_profile_completed_at, author_latest)
+            print(f"[DB] Content watermarks seeded ({len(author_latest)} authors)")
+        except Exception as e:
+            print(f"Error seeding content watermarks: {e}")
+        finally:
+            self.return_connection(conn)
+
+    def _ensure_watermarks(self):
+        if not self.watermarks.seeded:
+            self.seed_content_watermarks()
+
+    def mark_profile_complete(self, user_id: int) -> bool:
+        """Mark a user's profile as complete (timestamped for new-user notifications)"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE users SET profile_complete = TRUE, profile_completed_at = NOW() WHERE id = %s RETURNING profile_completed_at",
+                    (user_id,)
+                )
+                row = cur.fetchone()
+                conn.commit()
+                if row is None:
+                    return False
+                self._invalidate_rows(conn, user_id=user_id)
+
+                def after_commit(_):
+                    self.watermarks.note_profile_completed(row[0])
+                    self.events.publish(event_stream.NEW_USER, {
+                        'user_id': user_id,
+                        'profile_completed_at': row[0]
+                    })
+
+                self._on_commit(conn, after_commit)
+                return True
+        except Exception as e:
+            conn.rollback()
+            print(f"Error marking profile complete: {e}")
+            return False
+        finally:
+            self.return_connection(conn)
+
+    def count_new_users_since(self, since: str) -> int:
+        """Count users whose profile was completed after `since` (0 without a DB hit when nothing is new)"""
+        self._ensure_watermarks()
+        if self.watermarks.has_new_users(since) is False:
+            return 0
+
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                self.statements.execute(cur, 'count_new_users', (since,))
+                return cur.fetchone()[0]
+        finally:
+            self.return_connection(conn)
+
+    def has_new_users_since(self, since: str) -> bool:
+        """Has any profile been completed after `since`?"""
+        self._ensure_watermarks()
+        answer = self.watermarks.has_new_users(since)
+        if answer is not None:
+            return answer
+        return self.count_new_users_since(since) > 0
+
+    def has_new_posts_since(self, since: str, exclude_email: str) -> bool:
+        """Has anyone other than exclude_email created a post after `since`?"""
+        self._ensure_watermarks()
+        answer = self.watermarks.has_new_posts(since, exclude_email)
+        if answer is not None:
+            return answer
+
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                self.statements.execute(cur, 'count_new_posts', (since, exclude_email))
+                return cur.fetchone()[0] > 0
+        finally:
+            self.return_connection(conn)
+
     def get_has_new_matches_bulk(self, user_email: str, query_ids: List[int]) -> dict:
         """Get has_new_matches flags for multiple queries for a specific user
         Returns: dict mapping query_id -> bool
         A query has new matches if:
         - last_match_added_at > last_viewed_at (or never viewed)
+        Answered from badge_cache; only queries not yet cached for this user hit the database.
         """
         if not query_ids:
             return {}
 
+        flags, missing = self.badge_cache.lookup(user_email, query_ids)
+        if not missing:
+            return flags
+
         conn = self.get_connection()
         try:
             with conn.cursor() as cur:
-                # Check if last_match_added_at > last_viewed_at for each query
-                # If user has never viewed a query, treat as having new matches if any matches exist
-                cur.execute("""
-                    SELECT
-                        p.id,
-                        CASE
-                            WHEN qv.last_viewed_at IS NULL THEN
-                                p.last_match_added_at IS NOT NULL
-                            ELSE
-                                p.last_match_added_at > qv.last_viewed_at
-                        END as has_new
-                    FROM posts p
-                    LEFT JOIN query_views qv
-                        ON p.id = qv.query_id
-                        AND qv.user_email = %s
-                    WHERE p.id = ANY(%s)
-                """, (user_email, query_ids))
-                results = cur.fetchall()
-                return {row[0]: row[1] for row in results}
+                # Load both timestamps for the uncached queries; has_new is computed by the cache
+                # (never viewed -> new if any matches exist)
+                self.statements.execute(cur, 'query_badge_state', (user_email, missing))
+                for query_id, last_match_added_at, last_viewed_at in cur.fetchall():
+                    last_viewed_at = self.query_views.newest(last_viewed_at, self.query_views.get((query_id, user_email)))
+                    flags[query_id] = self.badge_cache.load(user_email, query_id, last_match_added_at, last_viewed_at)
+                return flags
         except Exception as e:
             print(f"Error getting has_new_matches bulk: {e}")
-            return {}
+            return flags
         finally:
             self.return_connection(conn)
 
@@ -1414,6 +2091,41 @@ class Database:
         finally:
             self.return_connection(conn)
 
+    def get_query_scores_for_post(self, post_id: int) -> Dict[int, float]:
+        """Get the stored match score of a post for every query it matches"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT query_id, relevance_score FROM query_results WHERE post_id = %s",
+                    (post_id,)
+                )
+                return {row[0]: row[1] for row in cur.fetchall()}
+        except Exception as e:
+            print(f"Error getting query scores for post: {e}")
+            return {}
+        finally:
+            self.return_connection(conn)
+
+    def delete_query_results_for_post(self, post_id: int, query_ids: List[int]):
+        """Remove a post's matches for specific queries (used by incremental re-matching)"""
+        if not query_ids:
+            return
+
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM query_results WHERE post_id = %s AND query_id = ANY(%s)",
+                    (post_id, list(query_ids))
+                )
+                conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error deleting query results for post: {e}")
+        finally:
+            self.return_connection(conn)
+
     def clear_post_from_results(self, post_id: int):
         """Clear all query results for a specific post (used when post is edited)"""
         conn = self.get_connection()
@@ -1,71 +1,472 @@
 """
 Database module for Firefly server using SQLite.
-Simple, reliable, zero-configuration database with no connection pool issues.
+Same interface as db.py (PostgreSQL), for single-box deployments, local benchmarks
+and CI without a Postgres server. Select it with DB_BACKEND=sqlite.
+
+Each thread keeps one connection, opened in WAL mode so readers never block the
+writer. Postgres types are emulated: array columns (device_ids, ancestor_chain) and
+embeddings are stored as JSON text, and timestamps as UTC text read back as datetimes.
+Connections take psycopg2-style SQL (%s placeholders, `with conn.cursor()`, lists
+as parameters), so app.py's own queries and unit_of_work.py run unchanged.
 """
 
 import sqlite3
 import json
-from typing import Optional, List, Dict, Any
+import hashlib
+import math
+import re
+import weakref
+from typing import Optional, List, Dict, Any, Tuple
 import os
-from datetime import datetime
+from datetime import datetime, timezone
+from functools import lru_cache
 import sys
+from badge_cache import BadgeCache
+from watermarks import ContentWatermarks, parse_since
+import event_stream
+import row_cache
+from people_directory import PeopleDirectory
+from invite_tree import InviteTree, UNRELATED
+from unit_of_work import UnitOfWork, ScopedConnection
+from write_behind import WriteBehindBuffer
+from contextlib import contextmanager
+import threading
+
+# Stored timestamp format: fixed width, so text comparison is chronological
+_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+# Column default in the same format (%f is seconds with milliseconds)
+_DEFAULT_NOW = "(strftime('%Y-%m-%d %H:%M:%f000', 'now'))"
+
+
+def _format_timestamp(value: datetime) -> str:
+    """A datetime as stored: aware values are converted to UTC, naive ones kept as they are"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime(_TIMESTAMP_FORMAT)
+
+
+def _utcnow() -> datetime:
+    """The current time as stored (naive UTC)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _now() -> str:
+    """NOW() in SQL"""
+    return _utcnow().strftime(_TIMESTAMP_FORMAT)
+
+
+def _since(since: str, aware_column: bool) -> str:
+    """
+    A client ISO8601 timestamp compared the way Postgres compares it: against a
+    TIMESTAMP column the zone is ignored, against TIMESTAMPTZ it is converted to UTC
+    """
+    parsed = parse_since(since)
+    if parsed is None:
+        return since
+    if not aware_column:
+        parsed = parsed.replace(tzinfo=None)
+    return _format_timestamp(parsed)
+
+
+@lru_cache(maxsize=16)
+def _vector(value: str) -> Tuple[Tuple[float, ...], float]:
+    """Parsed embedding plus its norm (the query side repeats on every row)"""
+    vector = tuple(json.loads(value))
+    return vector, math.sqrt(sum(x * x for x in vector))
+
+
+def _cosine_similarity(a: Optional[str], b: Optional[str]) -> Optional[float]:
+    """cosine_similarity(embedding, embedding) in SQL: 1 - pgvector's <=> distance"""
+    if a is None or b is None:
+        return None
+    (va, norm_a), (vb, norm_b) = _vector(a), _vector(b)
+    if not norm_a or not norm_b:
+        return None
+    return sum(x * y for x, y in zip(va, vb)) / (norm_a * norm_b)
+
+
+# Declared column types read back as Python values
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('TIMESTAMPTZ', lambda value: datetime.fromisoformat(value.decode()).replace(tzinfo=timezone.utc))
+sqlite3.register_converter('JSON', lambda value: json.loads(value))
+sqlite3.register_converter('BOOLEAN', lambda value: bool(int(value)))
+
+
+def _adapt(value):
+    """A parameter as psycopg2 would send it: lists become arrays (JSON here), datetimes timestamps"""
+    if hasattr(value, 'tolist'):
+        # numpy arrays (embeddings) and scalars
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return json.dumps(list(value))
+    if isinstance(value, datetime):
+        return _format_timestamp(value)
+    return value
+
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+_WRITE = re.compile(r"\s*(INSERT|UPDATE|DELETE|REPLACE|SAVEPOINT|CREATE|DROP|ALTER)\b", re.IGNORECASE)
+
+
+def _translate(sql: str) -> str:
+    """psycopg2 placeholders (%s, %(name)s, %%) to sqlite3's (?, :name, %)"""
+    def replace(match):
+        if match.group(1):
+            return ':' + match.group(1)
+        return '?' if match.group(0) == '%s' else '%'
+    return _PLACEHOLDER.sub(replace, sql)
+
+
+class _Cursor:
+    """psycopg2-style cursor: %s placeholders, usable as a context manager, dict rows on request"""
+
+    def __init__(self, connection: '_Connection', dict_rows: bool):
+        self.connection = connection
+        self._cur = connection.raw.cursor()
+        self._dict_rows = dict_rows
+
+    def execute(self, sql: str, params=None):
+        self.connection.begin(write=bool(_WRITE.match(sql)))
+        if params is None:
+            # Like psycopg2, no placeholder processing without parameters
+            self._cur.execute(sql)
+        elif isinstance(params, dict):
+            self._cur.execute(_translate(sql), {name: _adapt(value) for name, value in params.items()})
+        else:
+            self._cur.execute(_translate(sql), [_adapt(value) for value in params])
+
+    def executemany(self, sql: str, seq_of_params):
+        self.connection.begin(write=True)
+        self._cur.executemany(_translate(sql), [[_adapt(value) for value in params] for params in seq_of_params])
+
+    def fetchone(self):
+        return self._row(self._cur.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cur.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def rowcount(self) -> int:
+        return self._cur.rowcount
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    def close(self):
+        self._cur.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _row(self, row):
+        if row is None or not self._dict_rows:
+            return row
+        return {column[0]: value for column, value in zip(self._cur.description, row)}
+
+
+class _Connection:
+    """
+    One thread's sqlite3 connection with psycopg2's transaction behavior: the first
+    statement opens a transaction that lasts until commit() or rollback()
+    """
+
+    def __init__(self, raw: sqlite3.Connection):
+        self.raw = raw
+        self.closed = False
+
+    def cursor(self, cursor_factory=None, dict_rows: bool = False) -> _Cursor:
+        """Any cursor_factory (RealDictCursor in code written for db.py) gives dict rows"""
+        return _Cursor(self, dict_rows or cursor_factory is not None)
+
+    def begin(self, write: bool = False):
+        """
+        Open the transaction now unless one is open. A transaction that will write takes
+        the write lock up front (BEGIN IMMEDIATE), waiting up to the busy timeout; one that
+        only reads and later writes could otherwise fail outright if another connection
+        committed in between. Savepoints (a unit of work) count as writes, unless a
+        snapshot unit already opened a plain BEGIN.
+        """
+        if not self.raw.in_transaction:
+            self.raw.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.raw.close()
+
+
+class _StatementCache:
+    """
+    /api/health counterpart of db.py's StatementRegistry. sqlite3 already compiles each
+    statement once per connection and reuses it (the connection's statement cache).
+    """
+
+    def __init__(self, database: 'Database'):
+        self._database = database
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': True,
+            'backend': 'sqlite',
+            'connections': len(self._database._connections),
+            'cached_statements_per_connection': self._database.cached_statements
+        }
+
 
 class Database:
     """Database connection and operations manager for SQLite"""
 
     def __init__(self, db_path: Optional[str] = None):
         """
-        Initialize database connection.
+        Initialize the database file and its schema.
 
         Args:
-            db_path: Path to SQLite database file. If None, uses 'firefly.db'
+            db_path: Path to SQLite database file. If None, reads SQLITE_PATH, else 'firefly.db'
         """
         if db_path is None:
-            db_path = os.path.join(os.path.dirname(__file__), 'firefly.db')
+            db_path = os.getenv('SQLITE_PATH') or os.path.join(os.path.dirname(__file__), 'firefly.db')
 
         self.db_path = db_path
+        self.busy_timeout = float(os.getenv('SQLITE_BUSY_TIMEOUT_SECONDS', '5'))
+        self.mmap_size = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+        self.cached_statements = int(os.getenv('SQLITE_CACHED_STATEMENTS', '256'))
+        self._local = threading.local()  # This thread's connection and unit of work
+        self._connections = weakref.WeakSet()  # Every thread's connection (closed with the thread)
+        self._connections_lock = threading.Lock()
+        self.badge_cache = BadgeCache()  # Query badge timestamps, written through below
+        self.watermarks = ContentWatermarks()  # Latest profile/post times for "new content" polls
+        self.events = event_stream.EventBroker()  # Notification events for /api/notifications/stream
+        self.invite_tree = InviteTree()  # users.invited_by index for proximity, updated on signup
+        self.directory = PeopleDirectory(self.invite_tree)  # Rows behind /api/users/recent, refreshed on writes
+        self.rows = row_cache.RowCache(  # Post/user rows for get_post_by_id and the user lookups
+            max_entries=int(os.getenv('ROW_CACHE_SIZE', '5000')),
+            ttl=float(os.getenv('ROW_CACHE_TTL_SECONDS', '10'))
+        )
+        self.statements = _StatementCache(self)
+        write_behind = {
+            'flush_ms': float(os.getenv('WRITE_BEHIND_FLUSH_MS', '500')),
+            'max_entries': int(os.getenv('WRITE_BEHIND_MAX_ENTRIES', '500')),
+            'enabled': os.getenv('WRITE_BEHIND', '1') != '0'
+        }
+        # query_views.last_viewed_at and users.last_activity, written in batches (see write_behind.py)
+        self.query_views = WriteBehindBuffer('query_views', self._write_query_views, **write_behind)
+        self.activity = WriteBehindBuffer('last_activity', self._write_last_activity, **write_behind)
         self._ensure_schema()
 
-    def _dict_factory(self, cursor, row):
-        """Convert sqlite3 rows to dictionaries"""
-        fields = [column[0] for column in cursor.description]
-        return {key: value for key, value in zip(fields, row)}
+    # Server and connection management (no server; one connection per thread)
 
-    def get_connection(self):
-        """Get a database connection"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = self._dict_factory
-        # Enable foreign keys
-        conn.execute('PRAGMA foreign_keys = ON')
+    def check_postgresql_running(self):
+        """There is no database server to check"""
+        return True
+
+    def restart_postgresql(self):
+        """There is no database server to restart"""
+        return False
+
+    def initialize_pool(self, minconn=None, maxconn=None, retry_with_restart=True):
+        """Open this thread's connection (other threads open theirs on first use)"""
+        self._thread_connection()
+        print(f"SQLite database ready: {self.db_path} (WAL, one connection per thread)")
+
+    def _connect(self) -> _Connection:
+        raw = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout,
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+            isolation_level=None,  # Transactions are opened by _Connection.begin
+            check_same_thread=False,  # Only used by its own thread, but closed by close_all_connections
+            cached_statements=self.cached_statements
+        )
+        raw.execute('PRAGMA journal_mode = WAL')
+        # WAL makes NORMAL durable against crashes of the process (not of the OS) and much cheaper than FULL
+        raw.execute('PRAGMA synchronous = NORMAL')
+        raw.execute(f'PRAGMA mmap_size = {self.mmap_size}')
+        raw.execute('PRAGMA temp_store = MEMORY')
+        raw.execute('PRAGMA foreign_keys = ON')
+        # Deleting a post deletes its children, and theirs (see the posts_delete_children trigger)
+        raw.execute('PRAGMA recursive_triggers = ON')
+        raw.create_function('now', 0, _now)
+        raw.create_function('cosine_similarity', 2, _cosine_similarity, deterministic=True)
+        return _Connection(raw)
+
+    def _thread_connection(self) -> _Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or conn.closed:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.add(conn)
         return conn
 
+    def get_connection(self):
+        """
+        Get this thread's connection.
+        Inside unit_of_work(), returns a savepoint on it instead.
+        """
+        uow = getattr(self._local, 'uow', None)
+        if uow is not None:
+            return uow.begin()
+        return self._thread_connection()
+
     def return_connection(self, conn):
-        """Close a connection (no pooling needed with SQLite)"""
-        if conn:
+        """Done with a connection: like a pool checkin, anything not committed is rolled back"""
+        if isinstance(conn, ScopedConnection):
+            conn.release()
+            return
+        if conn is not None and not conn.closed and conn.raw.in_transaction:
+            conn.rollback()
+
+    @contextmanager
+    def unit_of_work(self, snapshot: bool = False):
+        """
+        Run a block of Database calls in one transaction (see db.py's unit_of_work).
+
+        The transaction takes SQLite's write lock when the block starts, so keep it short.
+        snapshot=True is for read-only blocks: it opens a plain BEGIN instead, so the
+        block reads one WAL snapshot without the write lock and runs alongside writers
+        and other readers (a write inside it may fail with "database is locked").
+        """
+        uow = getattr(self._local, 'uow', None)
+        if uow is not None:
+            scope = uow.begin()
+            uow.depth += 1
             try:
-                conn.close()
-            except:
-                pass
+                yield uow
+            except BaseException:
+                scope.rollback()
+                raise
+            else:
+                scope.release()
+            finally:
+                uow.depth -= 1
+            return
+
+        conn = self._thread_connection()
+        uow = UnitOfWork(conn)
+        self._local.uow = uow
+        if snapshot:
+            uow.snapshot = True
+            # Before the first savepoint, which would otherwise take the write lock
+            conn.begin()
+        try:
+            yield uow
+            self._local.uow = None
+            uow.commit()
+        except BaseException:
+            try:
+                uow.rollback()
+            except Exception as e:
+                print(f"[DB] Error rolling back unit of work: {e}")
+            raise
+        finally:
+            self._local.uow = None
+            self.return_connection(conn)
+
+    def _on_commit(self, conn, fn):
+        """Run fn(conn) once conn's work is committed: now, or when the enclosing unit of work commits"""
+        if isinstance(conn, ScopedConnection):
+            conn.uow.after_commit(fn)
+        else:
+            fn(conn)
+
+    # Row cache (get_post_by_id and the user lookups)
+
+    def _cached_row(self, kind: str, key):
+        """self.rows.get, except in a snapshot unit of work, whose reads must all come from its snapshot"""
+        cached, generation = self.rows.get(kind, key)
+        uow = getattr(self._local, 'uow', None)
+        if uow is not None and uow.snapshot:
+            return None, generation
+        return cached, generation
+
+    def _store_row(self, kind: str, key, row, generation: int):
+        """Cache a row just read, unless this thread's unit of work has uncommitted writes it may reflect (or is a snapshot)"""
+        uow = getattr(self._local, 'uow', None)
+        if uow is not None and (uow.pending_hooks() or uow.snapshot):
+            return
+        self.rows.put(kind, key, row, generation)
+
+    def _invalidate_rows(self, conn, post_ids: Tuple[Optional[int], ...] = (), user_id: Optional[int] = None,
+                         all_posts: bool = False):
+        """Drop cached rows a write touched (again after the real commit inside a unit of work)"""
+        def invalidate(_):
+            if all_posts:
+                self.rows.invalidate_all_posts()
+            elif post_ids:
+                self.rows.invalidate_posts(*post_ids)
+            if user_id is not None:
+                self.rows.invalidate_user(user_id)
+
+        invalidate(conn)
+        if isinstance(conn, ScopedConnection):
+            conn.uow.after_commit(invalidate)
 
     def close_all_connections(self):
-        """No-op for SQLite (no connection pool)"""
-        pass
+        """Close every thread's connection (each reopens on next use)"""
+        with self._connections_lock:
+            connections = list(self._connections)
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                print(f"[DB] Error closing connection: {e}")
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Connection snapshot for /api/health"""
+        return {
+            'initialized': True,
+            'backend': 'sqlite',
+            'path': self.db_path,
+            'connections': len(self._connections),
+            'journal_mode': 'wal',
+            'mmap_size': self.mmap_size
+        }
+
+    def run_migrations(self) -> List[int]:
+        """
+        The SQLite schema has no numbered migrations: _ensure_schema creates it whole
+        and adds columns missing from older database files.
+
+        Returns:
+            [] (nothing to apply)
+        """
+        return []
 
     def _ensure_schema(self):
         """Create tables if they don't exist"""
-        conn = self.get_connection()
+        conn = self._thread_connection()
         try:
             cursor = conn.cursor()
 
             # Users table
-            cursor.execute("""
+            cursor.execute(f"""
                 CREATE TABLE IF NOT EXISTS users (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     email TEXT NOT NULL UNIQUE,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    device_ids TEXT DEFAULT '[]',
                     name TEXT,
-                    last_activity TEXT
+                    created_at TIMESTAMPTZ DEFAULT {_DEFAULT_NOW},
+                    device_ids JSON DEFAULT '[]',
+                    apns_device_token TEXT,
+                    invited_by INTEGER,
+                    invited_at TIMESTAMP,
+                    ancestor_chain JSON,
+                    num_invites INTEGER DEFAULT 0,
+                    profile_complete BOOLEAN DEFAULT 0,
+                    profile_completed_at TIMESTAMP,
+                    last_activity TIMESTAMP
                 )
             """)
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)")
@@ -81,27 +482,103 @@ class Database:
                 )
             """)
 
-            # Posts table
-            cursor.execute("""
+            # Posts table (parent_id -1 marks a profile post, so it has no foreign key)
+            cursor.execute(f"""
                 CREATE TABLE IF NOT EXISTS posts (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     user_id INTEGER NOT NULL,
-                    parent_id INTEGER,
+                    parent_id INTEGER CHECK (parent_id IS NULL OR parent_id = -1 OR parent_id > 0),
                     title TEXT NOT NULL,
                     summary TEXT NOT NULL,
                     body TEXT NOT NULL,
                     image_url TEXT,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    clip_offset_x REAL DEFAULT 0,
+                    clip_offset_y REAL DEFAULT 0,
+                    created_at TIMESTAMPTZ DEFAULT {_DEFAULT_NOW},
+                    updated_at TIMESTAMP DEFAULT {_DEFAULT_NOW},
                     timezone TEXT NOT NULL,
                     location_tag TEXT,
-                    ai_generated INTEGER NOT NULL DEFAULT 0,
+                    ai_generated BOOLEAN NOT NULL DEFAULT 0,
                     template_name TEXT DEFAULT 'post',
+                    child_count INTEGER NOT NULL DEFAULT 0,
+                    has_new_matches BOOLEAN DEFAULT 0,
+                    last_match_added_at TIMESTAMP,
+                    embedding TEXT,
                     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
                 )
             """)
+
+            # Columns added since the first SQLite schema (earlier database files lack them)
+            self._add_missing_columns(cursor, 'users', {
+                'apns_device_token': 'TEXT',
+                'invited_by': 'INTEGER',
+                'invited_at': 'TIMESTAMP',
+                'ancestor_chain': 'JSON',
+                'num_invites': 'INTEGER DEFAULT 0',
+                'profile_complete': 'BOOLEAN DEFAULT 0',
+                'profile_completed_at': 'TIMESTAMP'
+            })
+            self._add_missing_columns(cursor, 'posts', {
+                'clip_offset_x': 'REAL DEFAULT 0',
+                'clip_offset_y': 'REAL DEFAULT 0',
+                'updated_at': 'TIMESTAMP',
+                'child_count': 'INTEGER NOT NULL DEFAULT 0',
+                'has_new_matches': 'BOOLEAN DEFAULT 0',
+                'last_match_added_at': 'TIMESTAMP',
+                'embedding': 'TEXT'
+            })
+
+            # The same indexes as the Postgres schema and migrations
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_invited_by ON users(invited_by)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_user_id ON posts(user_id)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_parent_id ON posts(parent_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_created_at ON posts(created_at DESC)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_created_at_id ON posts(created_at DESC, id DESC)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_parent_created_at_id ON posts(parent_id, created_at DESC, id DESC)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_template_created_at_id ON posts(template_name, created_at DESC, id DESC)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_user_created_at_id ON posts(user_id, created_at DESC, id DESC)")
+
+            # Same trigger as Postgres (migrations.py); a foreign key would reject parent_id = -1
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS posts_delete_children
+                AFTER DELETE ON posts
+                BEGIN
+                    DELETE FROM posts WHERE parent_id = OLD.id;
+                END
+            """)
+
+            # Stored query matches and per-user views (badges)
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS query_results (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    query_id INTEGER REFERENCES posts(id) ON DELETE CASCADE,
+                    post_id INTEGER REFERENCES posts(id) ON DELETE CASCADE,
+                    relevance_score REAL NOT NULL,
+                    matched_at TIMESTAMP DEFAULT {_DEFAULT_NOW},
+                    UNIQUE(query_id, post_id)
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_results_score ON query_results(query_id, relevance_score DESC)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_results_post_id ON query_results(post_id)")
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS query_views (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    query_id INTEGER NOT NULL REFERENCES posts(id) ON DELETE CASCADE,
+                    user_email TEXT NOT NULL,
+                    last_viewed_at TIMESTAMP NOT NULL DEFAULT {_DEFAULT_NOW},
+                    UNIQUE(query_id, user_email)
+                )
+            """)
+
+            # LLM result cache (app.py)
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    prompt_hash TEXT PRIMARY KEY,
+                    model_name TEXT NOT NULL,
+                    llm_results TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT {_DEFAULT_NOW}
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_model ON search_cache(model_name)")
 
             # Insert default templates
             cursor.execute("""
@@ -124,20 +601,1720 @@ class Database:
             print(f"[DB] Error ensuring schema: {e}")
             conn.rollback()
             raise
+
+    @staticmethod
+    def _add_missing_columns(cur, table: str, columns: Dict[str, str]):
+        cur.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in cur.fetchall()}
+        for name, definition in columns.items():
+            if name not in existing:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+    # User operations
+
+    def create_user(self, email: str) -> Optional[int]:
+        """
+        Create a new user.
+
+        Args:
+            email: User's email address
+
+        Returns:
+            User ID if successful, None otherwise
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO users (email) VALUES (%s) RETURNING id",
+                    (email,)
+                )
+                user_id = cur.fetchone()[0]
+                conn.commit()
+                self._on_commit(conn, lambda _: self.invite_tree.add_user(user_id, None))
+                return user_id
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            print(f"User with email {email} already exists")
+            return None
+        except Exception as e:
+            conn.rollback()
+            print(f"Error creating user: {e}")
+            return None
+        finally:
+            self.return_connection(conn)
+
+    def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """Get user by email address (cached in self.rows)"""
+        cached, generation = self._cached_row(row_cache.USER_EMAIL, email)
+        if cached is not None:
+            return cached
+        conn = self.get_connection()
+        try:
+            with conn.cursor(dict_rows=True) as cur:
+                cur.execute(
+                    "SELECT id, email, name, created_at, device_ids FROM users WHERE email = %s",
+                    (email,)
+                )
+                user = cur.fetchone()
+                self._store_row(row_cache.USER_EMAIL, email, user, generation)
+                return user
+        except Exception as e:
+            print(f"Error getting user: {e}")
+            return None
+        finally:
+            self.return_connection(conn)
+
+    def get_user_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Get user by ID (cached in self.rows)"""
+        cached, generation = self._cached_row(row_cache.USER_ID, user_id)
+        if cached is not None:
+            return cached
+        conn = self.get_connection()
+        try:
+            with conn.cursor(dict_rows=True) as cur:
+                cur.execute(
+                    "SELECT id, email, name, created_at, device_ids, apns_device_token FROM users WHERE id = %s",
+                    (user_id,)
+                )
+                user = cur.fetchone()
+                self._store_row(row_cache.USER_ID, user_id, user, generation)
+                return user
+        except Exception as e:
+            print(f"Error getting user: {e}")
+            return None
+        finally:
+            self.return_connection(conn)
+
+    def add_device_to_user(self, user_id: int, device_id: str) -> bool:
+        """Add a device ID to a user's device list"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE users SET device_ids = json_insert(COALESCE(device_ids, '[]'), '$[#]', %s)
+                    WHERE id = %s AND NOT EXISTS (SELECT 1 FROM json_each(users.device_ids) WHERE value = %s)
+                    """,
+                    (device_id, user_id, device_id)
+                )
+                conn.commit()
+                self._invalidate_rows(conn, user_id=user_id)
+                return True
+        except Exception as e:
+            conn.rollback()
+            print(f"Error adding device to user: {e}")
+            return False
+        finally:
+            self.return_connection(conn)
+
+    def get_user_by_device_id(self, device_id: str) -> Optional[Dict[str, Any]]:
+        """Get user by device ID (cached in self.rows; a scan of users.device_ids on a miss)"""
+        cached, generation = self._cached_row(row_cache.USER_DEVICE, device_id)
+        if cached is not None:
+            return cached
+        conn = self.get_connection()
+        try:
+            with conn.cursor(dict_rows=True) as cur:
+                cur.execute(
+                    """
+                    SELECT id, email, name, created_at, device_ids, invited_by, invited_at, profile_complete
+                    FROM users
+                    WHERE EXISTS (SELECT 1 FROM json_each(users.device_ids) WHERE value = %s)
+                    """,
+                    (device_id,)
+                )
+                user = cur.fetchone()
+                self._store_row(row_cache.USER_DEVICE, device_id, user, generation)
+                return user
+        except Exception as e:
+            print(f"Error getting user by device: {e}")
+            return None
+        finally:
+            self.return_connection(conn)
+
+    def create_user_from_invite(self, email: str, name: str, invited_by: int) -> Optional[int]:
+        """Create a new user from an invitation, including ancestor chain"""
+        conn = self.get_connection()
+        try:
+            conn.begin(write=True)
+            with conn.cursor() as cur:
+                # Get inviter's ancestor chain
+                cur.execute(
+                    "SELECT ancestor_chain FROM users WHERE id = %s",
+                    (invited_by,)
+                )
+                inviter = cur.fetchone()
+                inviter_chain = inviter[0] if inviter and inviter[0] else [invited_by]
+
+                # Insert new user
+                cur.execute(
+                    "INSERT INTO users (email, name, invited_by, invited_at, profile_complete) VALUES (%s, %s, %s, NOW(), FALSE) RETURNING id",
+                    (email, name, invited_by)
+                )
+                user_id = cur.fetchone()[0]
+
+                # Set ancestor chain: [new_user_id] + inviter's chain
+                new_chain = [user_id] + list(inviter_chain)
+                cur.execute(
+                    "UPDATE users SET ancestor_chain = %s WHERE id = %s",
+                    (new_chain, user_id)
+                )
+
+                conn.commit()
+                self._on_commit(conn, lambda _: self.invite_tree.add_user(user_id, invited_by))
+                return user_id
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            print(f"User with email {email} already exists")
+            return None
+        except Exception as e:
+            conn.rollback()
+            print(f"Error creating user from invite: {e}")
+            return None
+        finally:
+            self.return_connection(conn)
+
+    def set_invited_by(self, user_id: int, invited_by: Optional[int]) -> bool:
+        """
+        Change who invited a user, recomputing the ancestor chains of the user and everyone below them.
+
+        Returns:
+            True if successful, False otherwise (unknown users, or the new inviter is the user's own invitee)
+        """
+        conn = self.get_connection()
+        try:
+            # The write lock, taken up front, also keeps two moves from racing past the cycle check
+            conn.begin(write=True)
+            with conn.cursor() as cur:
+                if invited_by is not None:
+                    # Walk up from the new inviter through invited_by (not the stored
+                    # ancestor_chain, which may be stale or NULL); UNION stops on a cycle
+                    cur.execute("""
+                        WITH RECURSIVE up(id, invited_by) AS (
+                            SELECT id, invited_by FROM users WHERE id = %s
+                          UNION
+                            SELECT u.id, u.invited_by
+                            FROM up
+                            JOIN users u ON u.id = up.invited_by
+                        )
+                        SELECT COUNT(*), COALESCE(MAX(id = %s), 0) FROM up
+                    """, (invited_by, user_id))
+                    found, is_invitee = cur.fetchone()
+                    if found == 0:
+                        print(f"Inviter {invited_by} does not exist")
+                        return False
+                    if is_invitee:
+                        print(f"User {invited_by} is in user {user_id}'s invite tree; moving would create a cycle")
+                        return False
+
+                cur.execute("UPDATE users SET invited_by = %s WHERE id = %s", (invited_by, user_id))
+                if cur.rowcount == 0:
+                    print(f"User {user_id} does not exist")
+                    conn.rollback()
+                    return False
+
+                updated = self._recompute_ancestor_chains(cur, user_id)
+                conn.commit()
+                print(f"Moved user {user_id} under {invited_by}: {updated} ancestor chains updated")
+                self._invalidate_rows(conn, user_id=user_id)
+
+                def after_commit(_):
+                    # Everyone below the user gets new depths and ancestors; rebuild the index
+                    if self.invite_tree.loaded:
+                        self.invite_tree.load(self._load_invite_tree)
+
+                self._on_commit(conn, after_commit)
+                return True
+        except Exception as e:
+            conn.rollback()
+            print(f"Error setting inviter: {e}")
+            return False
+        finally:
+            self.return_connection(conn)
+
+    @staticmethod
+    def _recompute_ancestor_chains(cur, user_id: int) -> int:
+        """
+        Rebuild ancestor_chain for user_id and all of their invitees. The subtree is read
+        with one recursive query (UNION stops at cycles); the JSON chains are built here,
+        each level prepending itself to its inviter's chain.
+
+        Returns:
+            Number of chains that changed
+        """
+        cur.execute("""
+            WITH RECURSIVE subtree(id) AS (
+                SELECT %s
+              UNION
+                SELECT u.id FROM users u JOIN subtree s ON u.invited_by = s.id
+            )
+            SELECT u.id, u.invited_by, u.ancestor_chain, i.ancestor_chain
+            FROM subtree s
+            JOIN users u ON u.id = s.id
+            LEFT JOIN users i ON i.id = u.invited_by
+        """, (user_id,))
+        rows = {row[0]: row for row in cur.fetchall()}
+        if user_id not in rows:
+            return 0
+
+        invitees = {}
+        for row_id, inviter_id, _, _ in rows.values():
+            if row_id != user_id:
+                invitees.setdefault(inviter_id, []).append(row_id)
+
+        _, inviter_id, _, inviter_chain = rows[user_id]
+        if inviter_chain:
+            base = list(inviter_chain)
+        else:
+            base = [inviter_id] if inviter_id is not None else []
+        chains = {user_id: [user_id] + base}
+        pending = [user_id]
+        while pending:
+            parent = pending.pop()
+            for child in invitees.get(parent, []):
+                if child not in chains:
+                    chains[child] = [child] + chains[parent]
+                    pending.append(child)
+
+        changed = [(chain, row_id) for row_id, chain in chains.items() if rows[row_id][2] != chain]
+        if changed:
+            cur.executemany("UPDATE users SET ancestor_chain = %s WHERE id = %s", changed)
+        return len(changed)
+
+    def get_proximity(self, user_a_id: int, user_b_id: int) -> int:
+        """Calculate proximity between two users based on invite tree distance"""
+        if user_a_id == user_b_id:
+            return 0
+
+        try:
+            self._ensure_invite_tree()
+            return self.invite_tree.proximity(user_a_id, user_b_id)
+        except Exception as e:
+            print(f"Error calculating proximity: {e}")
+            return UNRELATED
+
+    def _load_invite_tree(self):
+        """(user_id, invited_by) for every user"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT id, invited_by FROM users")
+                users = cur.fetchall()
+            print(f"[DB] Invite tree loaded: {len(users)} users")
+            return users
+        finally:
+            self.return_connection(conn)
+
+    def _ensure_invite_tree(self):
+        if not self.invite_tree.loaded:
+            self.invite_tree.load(self._load_invite_tree)
+
+    def update_user_apns_token(self, user_id: int, apns_token: str) -> bool:
+        """Update a user's APNs device token for push notifications"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE users SET apns_device_token = %s WHERE id = %s",
+                    (apns_token, user_id)
+                )
+                updated = cur.rowcount > 0
+                conn.commit()
+                self._invalidate_rows(conn, user_id=user_id)
+                return updated
+        except Exception as e:
+            conn.rollback()
+            print(f"Error updating APNs token: {e}")
+            return False
         finally:
             self.return_connection(conn)
 
-    # Helper methods for device_ids array (stored as JSON)
-    def _encode_device_ids(self, device_ids: List[str]) -> str:
-        """Convert Python list to JSON string"""
-        return json.dumps(device_ids or [])
+    def get_all_users_with_push_tokens(self) -> List[Dict[str, Any]]:
+        """Get all users who have APNs tokens registered"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor(dict_rows=True) as cur:
+                cur.execute(
+                    "SELECT id, name, email, apns_device_token FROM users WHERE apns_device_token IS NOT NULL"
+                )
+                return cur.fetchall()
+        except Exception as e:
+            print(f"Error getting users with tokens: {e}")
+            return []
+        finally:
+            self.return_connection(conn)
 
-    def _decode_device_ids(self, device_ids_json: str) -> List[str]:
-        """Convert JSON string to Python list"""
+    def get_queries_matching_embedding(self, embedding: List[float], threshold: float = 0.3) -> List[Dict[str, Any]]:
+        """Find all query posts that match a given embedding above threshold (a scan: no vector index)"""
+        conn = self.get_connection()
         try:
-            return json.loads(device_ids_json or '[]')
-        except:
+            with conn.cursor(dict_rows=True) as cur:
+                cur.execute("""
+                    SELECT p.id, p.title, p.user_id, u.name as user_name,
+                           cosine_similarity(p.embedding, %s) as similarity
+                    FROM posts p
+                    JOIN users u ON p.user_id = u.id
+                    WHERE p.template_name = 'query'
+                    AND p.embedding IS NOT NULL
+                    AND cosine_similarity(p.embedding, %s) > %s
+                """, (embedding, embedding, threshold))
+                return cur.fetchall()
+        except Exception as e:
+            print(f"Error finding matching queries: {e}")
             return []
+        finally:
+            self.return_connection(conn)
+
+    # Post operations
+
+    def create_post(
+        self,
+        user_id: int,
+        title: str,
+        summary: str,
+        body: str,
+        timezone: str,
+        parent_id: Optional[int] = None,
+        image_url: Optional[str] = None,
+        location_tag: Optional[str] = None,
+        ai_generated: bool = False,
+        embedding: Optional[List[float]] = None,
+        template_name: str = 'post'
+    ) -> Optional[int]:
+        """
+        Create a new post.
+
+        Args:
+            user_id: ID of the user creating the post
+            title: Post title
+            summary: One-line summary
+            body: Post body text
+            timezone: User's timezone
+            parent_id: ID of parent post (if this is a child post)
+            image_url: URL to post image
+            location_tag: Optional location tag
+            ai_generated: Whether this post was AI-generated
+            embedding: Vector embedding for semantic search (stored as JSON)
+            template_name: Name of template to use (defaults to 'post')
+
+        Returns:
+            Post ID if successful, None otherwise
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO posts
+                    (user_id, parent_id, title, summary, body, image_url, timezone, location_tag, ai_generated, embedding, template_name)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id, created_at, (SELECT email FROM users WHERE id = posts.user_id)
+                    """,
+                    (user_id, parent_id, title, summary, body, image_url, timezone, location_tag, ai_generated, embedding, template_name)
+                )
+                post_id, created_at, author_email = cur.fetchone()
+                self._adjust_child_count(cur, parent_id, 1)
+
+                conn.commit()
+                self._invalidate_rows(conn, post_ids=(parent_id,))
+
+                def after_commit(committed):
+                    # The author's last_activity is written behind (see _write_last_activity)
+                    last_activity = _utcnow()
+                    self.activity.put(user_id, last_activity)
+                    self.directory.touch_user(user_id, last_activity)
+                    self._refresh_directory(committed, [post_id, parent_id])
+
+                    if template_name == 'post' and author_email:
+                        self.watermarks.note_post(author_email, created_at)
+                        self.events.publish(event_stream.NEW_POST, {
+                            'post_id': post_id,
+                            'author_email': author_email,
+                            'created_at': created_at
+                        })
+
+                self._on_commit(conn, after_commit)
+                return post_id
+        except Exception as e:
+            conn.rollback()
+            print(f"Error creating post: {e}", file=sys.stderr, flush=True)
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return None
+        finally:
+            self.return_connection(conn)
+
+    @staticmethod
+    def _adjust_child_count(cur, parent_id: Optional[int], delta: int):
+        """Keep the parent's posts.child_count in step with a child added (+1) or removed (-1)"""
+        if parent_id is not None and parent_id > 0:
+            cur.execute("UPDATE posts SET child_count = child_count + %s WHERE id = %s", (delta, parent_id))
+
+    def delete_post(self, post_id: int) -> bool:
+        """
+        Delete a post (and, through the posts_delete_children trigger, its children).
+
+        Returns:
+            True if successful, False otherwise
+        """
+        conn = self.get_connection()
+        try:
+            conn.begin(write=True)
+            with conn.cursor() as cur:
+                cur.execute("SELECT id, template_name, parent_id FROM posts WHERE id = %s", (post_id,))
+                row = cur.fetchone()
+                if row is None:
+                    return False
+
+                cur.execute("DELETE FROM posts WHERE id = %s", (post_id,))
+                self._adjust_child_count(cur, row[2], -1)
+                conn.commit()
+                # The delete also cascades to its children, so drop every cached post
+                self._invalidate_rows(conn, all_posts=True)
+
+                def after_commit(committed):
+                    self.badge_cache.invalidate_query(post_id)
+                    self._refresh_directory(committed, [post_id, row[2]])
+                    if row[1] == 'post':
+                        # The deleted post may have been its author's latest
+                        self.watermarks.invalidate()
+
+                self._on_commit(conn, after_commit)
+                return True
+        except Exception as e:
+            conn.rollback()
+            print(f"Error deleting post: {e}")
+            return False
+        finally:
+            self.return_connection(conn)
+
+    _POST_ROW_SQL = """
+        SELECT p.id, p.user_id, p.parent_id, p.title, p.summary, p.body, p.image_url,
+               p.clip_offset_x, p.clip_offset_y,
+               p.created_at, p.timezone, p.location_tag, p.ai_generated,
+               p.template_name,
+               t.placeholder_title, t.placeholder_summary, t.placeholder_body,
+               COALESCE(u.name, u.email) as author_name,
+               u.email as author_email,
+               p.child_count
+        FROM posts p
+        LEFT JOIN users u ON p.user_id = u.id
+        LEFT JOIN templates t ON p.template_name = t.name
+        {where}
+    """
+
+    def get_post_by_id(self, post_id: int) -> Optional[Dict[str, Any]]:
+        """Get a post by ID (cached in self.rows)"""
+        cached, generation = self._cached_row(row_cache.POST, post_id)
+        if cached is not None:
+            return cached
+        conn = self.get_connection()
+        try:
+            with conn.cursor(dict_rows=True) as cur:
+                cur.execute(self._POST_ROW_SQL.format(where="WHERE p.id = %s"), (post_id,))
+                post = cur.fetchone()
+                self._store_row(row_cache.POST, post_id, post, generation)
+                return post
+        except Exception as e:
+            print(f"Error getting post: {e}")
+            return None
+        finally:
+            self.return_connection(conn)
+
+    # Version stamps for conditional GETs (ETag / Last-Modified)
+
+    def get_post_version(self, post_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Cheap version check for GET /api/posts/<id>.
+
+        Returns:
+            {'digest': str, 'last_modified': datetime} or None if the post doesn't exist
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT p.updated_at,
+                           p.child_count,
+                           p.parent_id,
+                           COALESCE(u.name, u.email)
+                    FROM posts p
+                    LEFT JOIN users u ON p.user_id = u.id
+                    WHERE p.id = %s
+                    """,
+                    (post_id,)
+                )
+                row = cur.fetchone()
+                if row is None:
+                    return None
+                updated_at, child_count, parent_id, author_name = row
+                return {
+                    'digest': f"{updated_at}:{child_count}:{parent_id}:{author_name}",
+                    'last_modified': updated_at
+                }
+        except Exception as e:
+            print(f"Error getting post version: {e}")
+            return None
+        finally:
+            self.return_connection(conn)
+
+    @staticmethod
+    def _md5(text: Optional[str]) -> str:
+        """md5(COALESCE(string_agg(...), '')) as Postgres computes it"""
+        return hashlib.md5((text or '').encode()).hexdigest()
+
+    def get_children_version(self, parent_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Cheap version check for GET /api/posts/<id>/children
+        (covers children added/removed/edited and changes to their child counts).
+
+        Returns:
+            {'digest': str, 'last_modified': datetime | None} or None on error
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT group_concat(c.id || ':' || COALESCE(c.updated_at, '') || ':' || c.child_count, ','),
+                           MAX(c.updated_at) as "last_modified [timestamp]"
+                    FROM (
+                        SELECT id, updated_at, child_count
+                        FROM posts
+                        WHERE parent_id = %s
+                        ORDER BY id
+                    ) c
+                    """,
+                    (parent_id,)
+                )
+                aggregate, last_modified = cur.fetchone()
+                return {'digest': self._md5(aggregate), 'last_modified': last_modified}
+        except Exception as e:
+            print(f"Error getting children version: {e}")
+            return None
+        finally:
+            self.return_connection(conn)
+
+    def get_query_results_version(self, query_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Cheap version check for GET /api/search?query_id=
+        (stored matches and scores, plus modification times of the matched posts).
+
+        Returns:
+            {'digest': str, 'count': int, 'last_modified': datetime | None} or None on error
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT q.last_match_added_at,
+                           (SELECT COUNT(*) FROM query_results WHERE query_id = q.id),
+                           (SELECT group_concat(item, ',')
+                            FROM (
+                                SELECT qr.post_id || ':' || qr.relevance_score || ':' || COALESCE(p.updated_at, '') || ':' || p.child_count as item
+                                FROM query_results qr
+                                JOIN posts p ON qr.post_id = p.id
+                                WHERE qr.query_id = %s
+                                ORDER BY qr.post_id
+                            ))
+                    FROM posts q
+                    WHERE q.id = %s
+                    """,
+                    (query_id, query_id)
+                )
+                row = cur.fetchone()
+                if row is None:
+                    return None
+                last_match_added_at, count, aggregate = row
+                return {
+                    'digest': f"{last_match_added_at}:{self._md5(aggregate)}",
+                    'count': count,
+                    'last_modified': last_match_added_at
+                }
+        except Exception as e:
+            print(f"Error getting query results version: {e}")
+            return None
+        finally:
+            self.return_connection(conn)
+
+    def get_posts_by_ids(self, post_ids: List[int]) -> List[Dict[str, Any]]:
+        """
+        Get many posts in one query, with author, template and child count joined.
+
+        Returns:
+            Posts in the same order as post_ids (missing IDs are skipped)
+        """
+        if not post_ids:
+            return []
+
+        conn = self.get_connection()
+        try:
+            with conn.cursor(dict_rows=True) as cur:
+                cur.execute(
+                    self._POST_ROW_SQL.format(where="WHERE p.id IN (SELECT value FROM json_each(%s))"),
+                    (list(post_ids),)
+                )
+                by_id = {row['id']: row for row in cur.fetchall()}
+                return [by_id[post_id] for post_id in post_ids if post_id in by_id]
+        except Exception as e:
+            print(f"Error getting posts by ids: {e}")
+            return []
+        finally:
+            self.return_connection(conn)
+
+    def get_posts_by_user(self, user_id: int, limit: int = 100) -> List[Dict[str, Any]]:
+        """Get all posts by a user"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor(dict_rows=True) as cur:
+                cur.execute(
+                    """
+                    SELECT p.id, p.user_id, p.parent_id, p.title, p.summary, p.body, p.image_url,
+                           p.clip_offset_x, p.clip_offset_y,
+                           p.created_at, p.timezone, p.location_tag, p.ai_generated,
+                           p.template_name,
+                           t.placeholder_title, t.placeholder_summary, t.placeholder_body
+                    FROM posts p
+                    LEFT JOIN templates t ON p.template_name = t.name
+                    WHERE p.user_id = %s
+                    ORDER BY p.created_at DESC
+                    LIMIT %s
+                    """,
+                    (user_id, limit)
+                )
+                return cur.fetchall()
+        except Exception as e:
+            print(f"Error getting user posts: {e}")
+            return []
+        finally:
+            self.return_connection(conn)
+
+    def get_query_ids_by_user(self, user_id: int) -> List[int]:
+        """IDs of the queries a user owns"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT id FROM posts WHERE user_id = %s AND template_name = 'query'",
+                    (user_id,)
+                )
+                return [row[0] for row in cur.fetchall()]
+        except Exception as e:
+            print(f"Error getting user queries: {e}")
+            return []
+        finally:
+            self.return_connection(conn)
+
+    def get_child_posts(self, parent_id: int, limit: Optional[int] = None,
+                        before: Optional[Tuple[datetime, int]] = None) -> List[Dict[str, Any]]:
+        """Get child posts of a parent post (newest first) with author names and child counts
+
+        Args:
+            parent_id: Parent post
+            limit: Page size (None for all children)
+            before: (created_at, id) keyset from a feed cursor - only older children are returned
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor(dict_rows=True) as cur:
+                conditions = ["p.parent_id = %s"]
+                params = [parent_id]
+                cur.execute(self._feed_page_sql(conditions, params, limit, before, include_post_flags=False), params)
+                return cur.fetchall()
+        except Exception as e:
+            print(f"Error getting child posts: {e}")
+            return []
+        finally:
+            self.return_connection(conn)
+
+    def get_user_profile(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a user's profile post (post with parent_id = -1).
+
+        Returns:
+            Profile post dict if found, None otherwise
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor(dict_rows=True) as cur:
+                cur.execute("""
+                    SELECT
+                        p.id, p.user_id, p.parent_id, p.title, p.summary, p.body,
+                        p.image_url, p.clip_offset_x, p.clip_offset_y,
+                        p.created_at, p.timezone, p.location_tag, p.ai_generated,
+                        p.template_name,
+                        t.placeholder_title, t.placeholder_summary, t.placeholder_body,
+                        p.title as author_name,
+                        u.email as author_email,
+                        p.child_count
+                    FROM posts p
+                    LEFT JOIN users u ON p.user_id = u.id
+                    LEFT JOIN templates t ON p.template_name = t.name
+                    WHERE p.user_id = %s AND p.template_name = 'profile'
+                    LIMIT 1
+                """, (user_id,))
+                return cur.fetchone()
+        except Exception as e:
+            print(f"Error getting user profile: {e}")
+            return None
+        finally:
+            self.return_connection(conn)
+
+    def create_profile_post(
+        self,
+        user_id: int,
+        title: str,
+        summary: str,
+        body: str,
+        timezone: str = 'UTC',
+        image_url: Optional[str] = None
+    ) -> Optional[int]:
+        """
+        Create a profile post for a user (with parent_id = -1).
+
+        Returns:
+            Post ID if successful, None otherwise
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO posts (user_id, parent_id, title, summary, body, timezone, image_url, ai_generated, template_name)
+                    VALUES (%s, -1, %s, %s, %s, %s, %s, FALSE, 'profile')
+                    RETURNING id
+                """, (user_id, title, summary, body, timezone, image_url))
+                post_id = cur.fetchone()[0]
+                conn.commit()
+                self._on_commit(conn, lambda committed: self._refresh_directory(committed, [post_id]))
+                print(f"[DB] Created profile post {post_id} for user {user_id}", file=sys.stderr, flush=True)
+                return post_id
+        except Exception as e:
+            conn.rollback()
+            print(f"[DB] Error creating profile post: {e}", file=sys.stderr, flush=True)
+            return None
+        finally:
+            self.return_connection(conn)
+
+    def update_post(
+        self,
+        post_id: int,
+        title: Optional[str] = None,
+        summary: Optional[str] = None,
+        body: Optional[str] = None,
+        image_url: Optional[str] = None,
+        clip_offset_x: Optional[float] = None,
+        clip_offset_y: Optional[float] = None
+    ) -> bool:
+        """
+        Update an existing post.
+
+        Args:
+            post_id: ID of post to update
+            title: New title (optional)
+            summary: New summary (optional)
+            body: New body (optional)
+            image_url: New image URL (optional)
+            clip_offset_x: Image clip X offset -1 to 1 (optional)
+            clip_offset_y: Image clip Y offset -1 to 1 (optional)
+
+        Returns:
+            True if successful, False otherwise
+        """
+        updates = []
+        params = []
+
+        if title is not None:
+            updates.append("title = %s")
+            params.append(title)
+
+        if summary is not None:
+            updates.append("summary = %s")
+            params.append(summary)
+
+        if body is not None:
+            updates.append("body = %s")
+            params.append(body)
+
+        if image_url is not None:
+            updates.append("image_url = %s")
+            params.append(image_url)
+
+        if clip_offset_x is not None:
+            updates.append("clip_offset_x = %s")
+            params.append(max(-1.0, min(1.0, clip_offset_x)))
+
+        if clip_offset_y is not None:
+            updates.append("clip_offset_y = %s")
+            params.append(max(-1.0, min(1.0, clip_offset_y)))
+
+        if not updates:
+            print("No fields to update")
+            return False
+
+        updates.append("updated_at = NOW()")
+        params.append(post_id)
+        query = f"UPDATE posts SET {', '.join(updates)} WHERE id = %s"
+
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                conn.commit()
+                self._invalidate_rows(conn, post_ids=(post_id,))
+                if self.directory.has_row(post_id):
+                    self._on_commit(conn, lambda committed: self._refresh_directory(committed, [post_id]))
+                print(f"Updated post {post_id}")
+                return True
+        except Exception as e:
+            conn.rollback()
+            print(f"Error updating post: {e}")
+            return False
+        finally:
+            self.return_connection(conn)
+
+    def search_posts_by_embedding(
+        self,
+        query_embedding: List[float],
+        limit: int = 10,
+        threshold: float = 0.7
+    ) -> List[Dict[str, Any]]:
+        """
+        Search posts using vector similarity (a scan: no vector index).
+
+        Args:
+            query_embedding: The query vector
+            limit: Maximum number of results
+            threshold: Minimum similarity threshold (0-1, where 1 is most similar)
+
+        Returns:
+            List of posts with similarity scores
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor(dict_rows=True) as cur:
+                cur.execute(
+                    """
+                    SELECT * FROM (
+                        SELECT
+                            p.id, p.user_id, p.parent_id, p.title, p.summary, p.body, p.image_url,
+                            p.created_at, p.timezone, p.location_tag, p.ai_generated,
+                            p.template_name,
+                            t.placeholder_title, t.placeholder_summary, t.placeholder_body,
+                            cosine_similarity(p.embedding, %s) as similarity
+                        FROM posts p
+                        LEFT JOIN templates t ON p.template_name = t.name
+                        WHERE p.embedding IS NOT NULL
+                    )
+                    WHERE similarity >= %s
+                    ORDER BY similarity DESC
+                    LIMIT %s
+                    """,
+                    (query_embedding, threshold, limit)
+                )
+                return cur.fetchall()
+        except Exception as e:
+            print(f"Error searching posts: {e}")
+            return []
+        finally:
+            self.return_connection(conn)
+
+    def get_recent_posts(self, limit: int = 50,
+                         before: Optional[Tuple[datetime, int]] = None) -> List[Dict[str, Any]]:
+        """Get most recent posts with child counts
+
+        Args:
+            limit: Page size
+            before: (created_at, id) keyset from a feed cursor - only older posts are returned
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor(dict_rows=True) as cur:
+                params = []
+                cur.execute(self._feed_page_sql([], params, limit, before, include_post_flags=False), params)
+                return cur.fetchall()
+        except Exception as e:
+            print(f"Error getting recent posts: {e}")
+            return []
+        finally:
+            self.return_connection(conn)
+
+    @staticmethod
+    def _feed_page_sql(conditions: List[str], params: List[Any], limit: Optional[int],
+                       before: Optional[Tuple[datetime, int]], include_post_flags: bool) -> str:
+        """
+        One page of a newest-first feed, keyset-paginated on (created_at, id)
+        (see db.py; SQLite compares row values the same way). Appends the keyset and
+        LIMIT values to params.
+        """
+        conditions = list(conditions)
+        if before is not None:
+            conditions.append("(p.created_at, p.id) < (%s, %s)")
+            params.extend(before)
+        where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+        limit_clause = ""
+        if limit is not None:
+            limit_clause = "LIMIT %s"
+            params.append(limit)
+
+        extra_columns = ""
+        if include_post_flags:
+            extra_columns = """
+                   p.has_new_matches, t.plural_name,
+                   u.ancestor_chain,
+                   u.last_activity,"""
+
+        return f"""
+            WITH page AS (
+                SELECT p.id
+                FROM posts p
+                {where}
+                ORDER BY p.created_at DESC, p.id DESC
+                {limit_clause}
+            )
+            SELECT p.id, p.user_id, p.parent_id, p.title, p.summary, p.body, p.image_url,
+                   p.clip_offset_x, p.clip_offset_y,
+                   p.created_at, p.timezone, p.location_tag, p.ai_generated,
+                   p.template_name,
+                   t.placeholder_title, t.placeholder_summary, t.placeholder_body,
+                   COALESCE(u.name, u.email) as author_name,
+                   u.email as author_email,{extra_columns}
+                   p.child_count
+            FROM page
+            JOIN posts p ON p.id = page.id
+            LEFT JOIN users u ON p.user_id = u.id
+            LEFT JOIN templates t ON p.template_name = t.name
+            ORDER BY p.created_at DESC, p.id DESC
+        """
+
+    def get_recent_users(self, current_user_id: Optional[int] = None, limit: Optional[int] = None,
+                         offset: int = 0) -> List[Dict[str, Any]]:
+        """Get users ordered by proximity to current user, then by activity (served from self.directory)"""
+        try:
+            self._ensure_invite_tree()
+            if not self.directory.loaded:
+                self.directory.load(self._load_directory)
+            return self.directory.page(current_user_id, limit=limit, offset=offset)
+        except Exception as e:
+            print(f"Error getting recent users: {e}")
+            return []
+
+    # People directory loading (see people_directory.py)
+
+    _DIRECTORY_ROW_SQL = """
+        SELECT p.id, p.user_id, p.parent_id, p.title, p.summary, p.body, p.image_url,
+               p.clip_offset_x, p.clip_offset_y,
+               p.created_at, p.timezone, p.location_tag, p.ai_generated,
+               p.template_name,
+               t.placeholder_title, t.placeholder_summary, t.placeholder_body,
+               COALESCE(u.name, u.email) as author_name,
+               u.email as author_email,
+               u.ancestor_chain,
+               u.last_activity,
+               p.child_count
+        FROM users u
+        JOIN posts p ON p.user_id = u.id AND p.parent_id = -1
+        LEFT JOIN templates t ON p.template_name = t.name
+        {where}
+    """
+
+    def _load_directory(self):
+        """Full directory snapshot: all profile rows"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor(dict_rows=True) as cur:
+                cur.execute(self._DIRECTORY_ROW_SQL.format(where=''))
+                rows = cur.fetchall()
+            print(f"[DB] People directory loaded: {len(rows)} rows")
+            return self._overlay_activity(rows)
+        finally:
+            self.return_connection(conn)
+
+    def _refresh_directory(self, conn, post_ids: List[Optional[int]]):
+        """Re-read directory rows for post_ids on the caller's (committed) connection"""
+        def load_rows(ids):
+            with conn.cursor(dict_rows=True) as cur:
+                cur.execute(self._DIRECTORY_ROW_SQL.format(where='WHERE p.id IN (SELECT value FROM json_each(%s))'), (ids,))
+                return self._overlay_activity(cur.fetchall())
+
+        try:
+            self.directory.refresh(post_ids, load_rows)
+        except Exception as e:
+            # Never fail the write; rebuild from scratch on next read instead
+            print(f"Error refreshing people directory: {e}")
+            self.directory.invalidate()
+
+    @staticmethod
+    def _profile_page_sql(where: str, reached: bool) -> str:
+        """
+        One page of profile posts ordered by proximity, then activity (see db.py).
+
+        reached=True: authors limited to a proximity table from the invite tree;
+            parameters are [user_ids], [proximities], then those in `where`, then LIMIT.
+        reached=False: everyone else, all UNRELATED; parameters are those in `where`, then LIMIT.
+        """
+        if reached:
+            # The two JSON arrays zipped by position, like unnest() of two arrays
+            source = """
+                FROM (
+                    SELECT ids.value as user_id, distances.value as proximity
+                    FROM json_each(%s) ids
+                    JOIN json_each(%s) distances ON distances.key = ids.key
+                ) prox
+                JOIN posts p ON p.user_id = prox.user_id"""
+            proximity = "prox.proximity"
+        else:
+            source = "FROM posts p"
+            proximity = str(UNRELATED)
+
+        return f"""
+            WITH page AS (
+                SELECT p.id, {proximity} as proximity, u.last_activity
+                {source}
+                LEFT JOIN users u ON p.user_id = u.id
+                {where}
+                ORDER BY proximity, u.last_activity DESC NULLS LAST, p.id
+                LIMIT %s
+            )
+            SELECT p.id, p.user_id, p.parent_id, p.title, p.summary, p.body, p.image_url,
+                   p.clip_offset_x, p.clip_offset_y,
+                   p.created_at, p.timezone, p.location_tag, p.ai_generated,
+                   p.template_name, p.has_new_matches,
+                   t.placeholder_title, t.placeholder_summary, t.placeholder_body, t.plural_name,
+                   COALESCE(u.name, u.email) as author_name,
+                   u.email as author_email,
+                   u.ancestor_chain,
+                   u.last_activity,
+                   p.child_count,
+                   page.proximity
+            FROM page
+            JOIN posts p ON p.id = page.id
+            LEFT JOIN users u ON p.user_id = u.id
+            LEFT JOIN templates t ON p.template_name = t.name
+            ORDER BY page.proximity, page.last_activity DESC NULLS LAST, p.id
+        """
+
+    def _profile_page(self, cur, conditions: List[str], params: List[Any], viewer_id: Optional[int],
+                      limit: int) -> List[Dict[str, Any]]:
+        """Profile posts for a viewer, nearest authors first (see db.py)"""
+        posts = []
+        reached_users = []
+
+        if viewer_id is not None:
+            where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+            query = self._profile_page_sql(where, reached=True)
+            batch_target = max(limit, 1)
+            batch_users, batch_distances = [], []
+            levels = self.invite_tree.levels(viewer_id)
+            exhausted = False
+            while len(posts) < limit and not exhausted:
+                # Whole levels only, so activity order within a distance is never split
+                level = next(levels, None)
+                if level is not None:
+                    distance, user_ids = level
+                    batch_users.extend(user_ids)
+                    batch_distances.extend([distance] * len(user_ids))
+                    if len(batch_users) < batch_target:
+                        continue
+                else:
+                    exhausted = True
+                if not batch_users:
+                    break
+
+                cur.execute(query, [batch_users, batch_distances] + params + [limit - len(posts)])
+                posts.extend(cur.fetchall())
+                reached_users.extend(batch_users)
+                batch_users, batch_distances = [], []
+                batch_target *= 2
+
+        if len(posts) < limit:
+            tail_conditions = list(conditions)
+            tail_params = list(params)
+            if reached_users:
+                tail_conditions.append("p.user_id NOT IN (SELECT value FROM json_each(%s))")
+                tail_params.append(reached_users)
+            where = (" WHERE " + " AND ".join(tail_conditions)) if tail_conditions else ""
+            cur.execute(self._profile_page_sql(where, reached=False), tail_params + [limit - len(posts)])
+            posts.extend(cur.fetchall())
+
+        # Activity order above is as of the last write-behind flush; the rows show the latest
+        return self._overlay_activity(posts)
+
+    def get_recent_tagged_posts(self, tags: List[str] = None, user_id: Optional[int] = None, limit: int = 50, current_user_email: Optional[str] = None, after: Optional[str] = None, current_user_id: Optional[int] = None, before: Optional[Tuple[datetime, int]] = None) -> List[Dict[str, Any]]:
+        """Get recent posts filtered by template tags and optionally by user.
+
+        For profile posts, incomplete profiles (empty summary AND body) are hidden
+        unless they belong to the current user. Profiles are sorted by proximity first.
+
+        Args:
+            after: ISO8601 timestamp - only return posts created after this time
+            current_user_id: ID of current user for proximity sorting (profiles)
+            before: (created_at, id) keyset from a feed cursor - only older posts are returned
+                    (not used for profiles, which are ordered by proximity)
+        """
+        conn = self.get_connection()
+        try:
+            # Proximity to the current user comes from the shared invite tree
+            self._ensure_invite_tree()
+            with conn.cursor(dict_rows=True) as cur:
+                conditions = []
+                params = []
+
+                # Filter by tags if provided
+                if tags:
+                    placeholders = ','.join(['%s'] * len(tags))
+                    conditions.append(f"p.template_name IN ({placeholders})")
+                    params.extend(tags)
+
+                # Filter by user if provided
+                if user_id is not None:
+                    conditions.append("p.user_id = %s")
+                    params.append(user_id)
+
+                # For profile posts, hide incomplete profiles unless they belong to current user
+                if tags and "profile" in tags and current_user_email:
+                    conditions.append("(COALESCE(p.summary, '') != '' OR COALESCE(p.body, '') != '' OR LOWER(u.email) = %s)")
+                    params.append(current_user_email.lower())
+
+                # Filter by timestamp if provided
+                if after:
+                    conditions.append("p.created_at > %s")
+                    params.append(_since(after, aware_column=True))
+
+                if tags and "profile" in tags:
+                    return self._profile_page(cur, conditions, params, current_user_id or None, limit)
+
+                # Posts/queries: newest first in SQL (keyset page), proximity as tiebreaker below
+                cur.execute(self._feed_page_sql(conditions, params, limit, before, include_post_flags=True), params)
+                posts = self._overlay_activity(cur.fetchall())
+                for post in posts:
+                    post['proximity'] = (self.invite_tree.proximity(current_user_id, post['user_id'])
+                                         if current_user_id and post['user_id'] is not None else UNRELATED)
+
+                # Date (day) first, proximity as tiebreaker within same day
+                def get_date_key(p):
+                    created = p.get('created_at')
+                    if created is None:
+                        return (1, None, 9999)  # None dates sort last
+                    return (0, -created.toordinal(), p['proximity'])
+                posts.sort(key=get_date_key)
+
+                return posts
+        except Exception as e:
+            print(f"Error getting recent tagged posts: {e}")
+            return []
+        finally:
+            self.return_connection(conn)
+
+    def set_post_parent(self, post_id: int, parent_id: Optional[int]) -> bool:
+        """
+        Set or update the parent of a post.
+
+        Returns:
+            True if successful, False otherwise
+        """
+        conn = self.get_connection()
+        try:
+            conn.begin(write=True)
+            with conn.cursor() as cur:
+                # Verify both posts exist if parent_id is provided
+                if parent_id is not None:
+                    cur.execute("SELECT id FROM posts WHERE id = %s", (parent_id,))
+                    if cur.fetchone() is None:
+                        print(f"Parent post {parent_id} does not exist")
+                        return False
+
+                cur.execute("SELECT id, parent_id FROM posts WHERE id = %s", (post_id,))
+                existing = cur.fetchone()
+                if existing is None:
+                    print(f"Post {post_id} does not exist")
+                    return False
+
+                cur.execute(
+                    "UPDATE posts SET parent_id = %s, updated_at = NOW() WHERE id = %s",
+                    (parent_id, post_id)
+                )
+                if existing[1] != parent_id:
+                    self._adjust_child_count(cur, existing[1], -1)
+                    self._adjust_child_count(cur, parent_id, 1)
+                conn.commit()
+                self._invalidate_rows(conn, post_ids=(post_id, existing[1], parent_id))
+                self._on_commit(conn, lambda committed: self._refresh_directory(committed, [post_id, existing[1], parent_id]))
+                return True
+        except Exception as e:
+            conn.rollback()
+            print(f"Error setting post parent: {e}")
+            return False
+        finally:
+            self.return_connection(conn)
+
+    def check_child_counts(self, fix: bool = False) -> List[Dict[str, int]]:
+        """
+        Compare posts.child_count with the actual number of children.
+
+        Args:
+            fix: Also overwrite the stored counts that are wrong
+
+        Returns:
+            [{'id', 'stored', 'actual'}] for every post whose stored count was wrong
+        """
+        conn = self.get_connection()
+        try:
+            if fix:
+                conn.begin(write=True)
+            with conn.cursor(dict_rows=True) as cur:
+                cur.execute("""
+                    SELECT p.id, p.child_count as stored, COALESCE(c.actual, 0) as actual
+                    FROM posts p
+                    LEFT JOIN (
+                        SELECT parent_id, COUNT(*) as actual
+                        FROM posts
+                        WHERE parent_id > 0
+                        GROUP BY parent_id
+                    ) c ON c.parent_id = p.id
+                    WHERE p.child_count IS NOT COALESCE(c.actual, 0)
+                    ORDER BY p.id
+                """)
+                rows = cur.fetchall()
+                if fix and rows:
+                    cur.executemany("UPDATE posts SET child_count = %s WHERE id = %s",
+                                    [(row['actual'], row['id']) for row in rows])
+                conn.commit()
+                if fix and rows:
+                    self._invalidate_rows(conn, post_ids=tuple(row['id'] for row in rows))
+                return rows
+        except Exception as e:
+            conn.rollback()
+            print(f"Error checking child counts: {e}")
+            return []
+        finally:
+            self.return_connection(conn)
+
+    def get_posts_by_template(self, template_name: str) -> List[tuple]:
+        """Get all posts with specific template"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id, user_id, parent_id, title, summary, body, image_url,
+                           created_at, timezone, location_tag, ai_generated, template_name,
+                           has_new_matches
+                    FROM posts
+                    WHERE template_name = %s
+                """, (template_name,))
+                return cur.fetchall()
+        except Exception as e:
+            print(f"Error getting posts by template: {e}")
+            return []
+        finally:
+            self.return_connection(conn)
+
+    _UPSERT_QUERY_RESULT_SQL = """
+        INSERT INTO query_results (query_id, post_id, relevance_score, matched_at)
+        VALUES (%s, %s, %s, NOW())
+        ON CONFLICT (query_id, post_id)
+        DO UPDATE SET relevance_score = excluded.relevance_score, matched_at = NOW()
+    """
+
+    def insert_query_result(self, query_id: int, post_id: int, score: float):
+        """Insert or update a query result match"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(self._UPSERT_QUERY_RESULT_SQL, (query_id, post_id, score))
+                conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error inserting query result: {e}")
+        finally:
+            self.return_connection(conn)
+
+    def insert_query_results_bulk(self, rows: List[tuple], touch_query_ids: Optional[List[int]] = None) -> int:
+        """
+        Insert or update many query result matches in a single transaction.
+        Also bumps last_match_added_at for the affected queries in the same commit.
+
+        Args:
+            rows: List of (query_id, post_id, score) tuples
+            touch_query_ids: Queries whose last_match_added_at should be bumped
+                             (defaults to every query in rows)
+
+        Returns:
+            Number of matches written (0 on error)
+        """
+        if not rows:
+            return 0
+
+        deduped = {}
+        for query_id, post_id, score in rows:
+            deduped[(int(query_id), int(post_id))] = float(score)
+        values = [(query_id, post_id, score) for (query_id, post_id), score in deduped.items()]
+        if touch_query_ids is None:
+            query_ids = sorted({query_id for query_id, _, _ in values})
+        else:
+            query_ids = sorted({int(query_id) for query_id in touch_query_ids})
+
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.executemany(self._UPSERT_QUERY_RESULT_SQL, values)
+
+                touched = []
+                if query_ids:
+                    cur.execute("""
+                        UPDATE posts
+                        SET last_match_added_at = NOW()
+                        WHERE id IN (SELECT value FROM json_each(%s))
+                        RETURNING id, last_match_added_at
+                    """, (query_ids,))
+                    touched = cur.fetchall()
+
+                conn.commit()
+
+                def after_commit(_):
+                    for query_id, last_match_added_at in touched:
+                        self.badge_cache.set_match_added(query_id, last_match_added_at)
+                        self.events.publish(event_stream.QUERY_MATCH, {
+                            'query_id': query_id,
+                            'last_match_added_at': last_match_added_at
+                        })
+
+                self._on_commit(conn, after_commit)
+                return len(values)
+        except Exception as e:
+            conn.rollback()
+            print(f"Error bulk inserting query results: {e}")
+            return 0
+        finally:
+            self.return_connection(conn)
+
+    def set_has_new_matches(self, query_id: int, value: bool):
+        """Set the has_new_matches flag for a query"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("UPDATE posts SET has_new_matches = %s WHERE id = %s", (value, query_id))
+                conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error setting has_new_matches: {e}")
+        finally:
+            self.return_connection(conn)
+
+    def record_query_view(self, user_email: str, query_id: int):
+        """Record that a user viewed a query's results (written behind, see _write_query_views)"""
+        last_viewed_at = _utcnow()
+        self.query_views.put((query_id, user_email), last_viewed_at)
+        self.badge_cache.set_viewed(user_email, query_id, last_viewed_at)
+        self.events.publish(event_stream.QUERY_VIEWED, {
+            'query_id': query_id,
+            'user_email': user_email,
+            'last_viewed_at': last_viewed_at
+        })
+
+    # Write-behind flushes (see write_behind.py)
+
+    def _write_query_views(self, batch: List[Tuple[Tuple[int, str], datetime]]):
+        """Upsert buffered query views in one transaction (views of since-deleted queries are dropped)"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.executemany("""
+                    INSERT INTO query_views (query_id, user_email, last_viewed_at)
+                    SELECT %s, %s, %s
+                    WHERE EXISTS (SELECT 1 FROM posts WHERE id = %s)
+                    ON CONFLICT (query_id, user_email)
+                    DO UPDATE SET last_viewed_at = MAX(last_viewed_at, excluded.last_viewed_at)
+                """, [(query_id, user_email, viewed_at, query_id) for (query_id, user_email), viewed_at in batch])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.return_connection(conn)
+
+    def _write_last_activity(self, batch: List[Tuple[int, datetime]]):
+        """Apply buffered users.last_activity bumps in one transaction"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.executemany(
+                    "UPDATE users SET last_activity = MAX(COALESCE(last_activity, ''), %s) WHERE id = %s",
+                    [(last_activity, user_id) for user_id, last_activity in batch]
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.return_connection(conn)
+
+    def close_write_behind(self):
+        """Flush buffered query views and last_activity and stop their threads (on shutdown)"""
+        self.query_views.close()
+        self.activity.close()
+
+    def _overlay_activity(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Show last_activity bumps that are still in the write-behind buffer"""
+        for row in rows:
+            buffered = self.activity.get(row['user_id'])
+            if buffered is not None:
+                row['last_activity'] = self.activity.newest(row.get('last_activity'), buffered)
+        return rows
+
+    def update_last_match_added(self, query_id: int):
+        """Update the last_match_added_at timestamp for a query"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE posts
+                    SET last_match_added_at = NOW()
+                    WHERE id = %s
+                    RETURNING last_match_added_at
+                """, (query_id,))
+                row = cur.fetchone()
+                conn.commit()
+                if row is not None:
+                    def after_commit(_):
+                        self.badge_cache.set_match_added(query_id, row[0])
+                        self.events.publish(event_stream.QUERY_MATCH, {
+                            'query_id': query_id,
+                            'last_match_added_at': row[0]
+                        })
+
+                    self._on_commit(conn, after_commit)
+        except Exception as e:
+            conn.rollback()
+            print(f"Error updating last_match_added_at: {e}")
+        finally:
+            self.return_connection(conn)
+
+    # "New content" watermarks (users/posts notification badges)
+
+    def seed_content_watermarks(self):
+        """Load the latest profile completion and per-author latest post into self.watermarks"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT MAX(profile_completed_at) as "latest [timestamp]" FROM users
+                    WHERE profile_complete = TRUE
+                """)
+                latest_profile_completed_at = cur.fetchone()[0]
+
+                cur.execute("""
+                    SELECT u.email, MAX(p.created_at) as "latest [timestamptz]"
+                    FROM posts p
+                    JOIN users u ON p.user_id = u.id
+                    WHERE p.template_name = 'post'
+                    GROUP BY u.email
+                """)
+                author_latest = cur.fetchall()
+
+            self.watermarks.seed(latest_profile_completed_at, author_latest)
+            print(f"[DB] Content watermarks seeded ({len(author_latest)} authors)")
+        except Exception as e:
+            print(f"Error seeding content watermarks: {e}")
+        finally:
+            self.return_connection(conn)
+
+    def _ensure_watermarks(self):
+        if not self.watermarks.seeded:
+            self.seed_content_watermarks()
+
+    def mark_profile_complete(self, user_id: int) -> bool:
+        """Mark a user's profile as complete (timestamped for new-user notifications)"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE users SET profile_complete = TRUE, profile_completed_at = NOW() WHERE id = %s RETURNING profile_completed_at",
+                    (user_id,)
+                )
+                row = cur.fetchone()
+                conn.commit()
+                if row is None:
+                    return False
+                self._invalidate_rows(conn, user_id=user_id)
+
+                def after_commit(_):
+                    self.watermarks.note_profile_completed(row[0])
+                    self.events.publish(event_stream.NEW_USER, {
+                        'user_id': user_id,
+                        'profile_completed_at': row[0]
+                    })
+
+                self._on_commit(conn, after_commit)
+                return True
+        except Exception as e:
+            conn.rollback()
+            print(f"Error marking profile complete: {e}")
+            return False
+        finally:
+            self.return_connection(conn)
+
+    def count_new_users_since(self, since: str) -> int:
+        """Count users whose profile was completed after `since` (0 without a DB hit when nothing is new)"""
+        self._ensure_watermarks()
+        if self.watermarks.has_new_users(since) is False:
+            return 0
+
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT COUNT(*) FROM users
+                    WHERE profile_complete = TRUE
+                    AND profile_completed_at > %s
+                """, (_since(since, aware_column=False),))
+                return cur.fetchone()[0]
+        finally:
+            self.return_connection(conn)
+
+    def has_new_users_since(self, since: str) -> bool:
+        """Has any profile been completed after `since`?"""
+        self._ensure_watermarks()
+        answer = self.watermarks.has_new_users(since)
+        if answer is not None:
+            return answer
+        return self.count_new_users_since(since) > 0
+
+    def has_new_posts_since(self, since: str, exclude_email: str) -> bool:
+        """Has anyone other than exclude_email created a post after `since`?"""
+        self._ensure_watermarks()
+        answer = self.watermarks.has_new_posts(since, exclude_email)
+        if answer is not None:
+            return answer
+
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT COUNT(*) FROM posts p
+                    JOIN users u ON p.user_id = u.id
+                    WHERE p.template_name = 'post'
+                    AND p.created_at > %s
+                    AND u.email != %s
+                """, (_since(since, aware_column=True), exclude_email))
+                return cur.fetchone()[0] > 0
+        finally:
+            self.return_connection(conn)
+
+    def get_has_new_matches_bulk(self, user_email: str, query_ids: List[int]) -> dict:
+        """Get has_new_matches flags for multiple queries for a specific user
+        Returns: dict mapping query_id -> bool
+        Answered from badge_cache; only queries not yet cached for this user hit the database.
+        """
+        if not query_ids:
+            return {}
+
+        flags, missing = self.badge_cache.lookup(user_email, query_ids)
+        if not missing:
+            return flags
+
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT p.id, p.last_match_added_at, qv.last_viewed_at
+                    FROM posts p
+                    LEFT JOIN query_views qv
+                        ON p.id = qv.query_id
+                        AND qv.user_email = %s
+                    WHERE p.id IN (SELECT value FROM json_each(%s))
+                """, (user_email, missing))
+                for query_id, last_match_added_at, last_viewed_at in cur.fetchall():
+                    last_viewed_at = self.query_views.newest(last_viewed_at, self.query_views.get((query_id, user_email)))
+                    flags[query_id] = self.badge_cache.load(user_email, query_id, last_match_added_at, last_viewed_at)
+                return flags
+        except Exception as e:
+            print(f"Error getting has_new_matches bulk: {e}")
+            return flags
+        finally:
+            self.return_connection(conn)
+
+    def get_query_results(self, query_id: int) -> List[tuple]:
+        """Get cached results for a query, sorted by post creation date (most recent first)"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT qr.post_id, qr.relevance_score, qr.matched_at
+                    FROM query_results qr
+                    JOIN posts p ON qr.post_id = p.id
+                    WHERE qr.query_id = %s
+                    ORDER BY p.created_at DESC, qr.relevance_score DESC
+                """, (query_id,))
+                return cur.fetchall()
+        except Exception as e:
+            print(f"Error getting query results: {e}")
+            return []
+        finally:
+            self.return_connection(conn)
+
+    def clear_query_results(self, query_id: int):
+        """Clear all cached results for a query (used when query is edited)"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM query_results WHERE query_id = %s", (query_id,))
+                conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error clearing query results: {e}")
+        finally:
+            self.return_connection(conn)
+
+    def get_query_scores_for_post(self, post_id: int) -> Dict[int, float]:
+        """Get the stored match score of a post for every query it matches"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT query_id, relevance_score FROM query_results WHERE post_id = %s",
+                    (post_id,)
+                )
+                return {row[0]: row[1] for row in cur.fetchall()}
+        except Exception as e:
+            print(f"Error getting query scores for post: {e}")
+            return {}
+        finally:
+            self.return_connection(conn)
+
+    def delete_query_results_for_post(self, post_id: int, query_ids: List[int]):
+        """Remove a post's matches for specific queries (used by incremental re-matching)"""
+        if not query_ids:
+            return
+
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM query_results WHERE post_id = %s AND query_id IN (SELECT value FROM json_each(%s))",
+                    (post_id, list(query_ids))
+                )
+                conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error deleting query results for post: {e}")
+        finally:
+            self.return_connection(conn)
+
+    def clear_post_from_results(self, post_id: int):
+        """Clear all query results for a specific post (used when post is edited)"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM query_results WHERE post_id = %s", (post_id,))
+                conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error clearing post from query results: {e}")
+        finally:
+            self.return_connection(conn)
 
 # Global database instance
 db = Database()
@@ -5,9 +5,11 @@ Uses sentence-transformers with all-mpnet-base-v2 model (768-dim, best quality).
 
 import os
 import re
+import threading
 import numpy as np
 import torch
-from typing import List, Optional
+from functools import lru_cache
+from typing import List, Optional, Tuple
 
 # Set offline mode BEFORE importing sentence_transformers
 # This prevents it from trying to connect to HuggingFace
@@ -19,6 +21,12 @@ from sentence_transformers import SentenceTransformer
 # Global model instance (loaded once on first use)
 _model = None
 
+# Every post's fragments stacked into one matrix (see load_corpus), rebuilt after
+# this process writes or deletes an embedding file, or the directory's entries change
+_corpus = None          # (key, matrix, index)
+_corpus_generation = 0  # Bumped by generate_embeddings / delete_embeddings
+_corpus_lock = threading.Lock()
+
 def get_model():
     """Get or initialize the sentence transformer model"""
     global _model
@@ -48,6 +56,40 @@ def chunk_text(text: str) -> List[str]:
 
     return fragments
 
+def normalize_query(text: str) -> str:
+    """Canonical form of free-text search input (case and whitespace folded)"""
+    return ' '.join(text.lower().split())
+
+@lru_cache(maxsize=int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '512')))
+def _embed_normalized(text: str) -> np.ndarray:
+    model = get_model()
+
+    # Whole query first, then its fragments (same chunking as post bodies)
+    fragments = [text]
+    body_fragments = chunk_text(text)
+    if len(body_fragments) > 1:
+        fragments.extend(body_fragments)
+
+    embeddings_float = model.encode(fragments, convert_to_numpy=True).astype(np.float32)
+    embeddings_float.setflags(write=False)  # Shared by every caller of the cache
+    return embeddings_float
+
+def embed_text(text: str) -> np.ndarray:
+    """
+    Embed free-text search input, cached by normalized text.
+
+    Args:
+        text: Search text
+
+    Returns:
+        Read-only float32 array of shape (num_fragments, 768)
+    """
+    return _embed_normalized(normalize_query(text))
+
+def embed_cache_info():
+    """Hit/miss counters of the query embedding cache"""
+    return _embed_normalized.cache_info()
+
 # Quantization functions removed - using float32 for better search quality
 
 def generate_embeddings(post_id: int, title: str, summary: str, body: str) -> bool:
@@ -83,6 +125,8 @@ def generate_embeddings(post_id: int, title: str, summary: str, body: str) -> bo
         filepath = f'data/embeddings/post_{post_id}.npy'
         np.save(filepath, embeddings_float.astype(np.float32))
 
+        invalidate_corpus()
+
         print(f"[EMBEDDINGS] Saved embeddings to {filepath}: shape {embeddings_float.shape}")
         return True
 
@@ -125,8 +169,58 @@ def delete_embeddings(post_id: int) -> bool:
         filepath = f'data/embeddings/post_{post_id}.npy'
         if os.path.exists(filepath):
             os.remove(filepath)
+            invalidate_corpus()
             print(f"[EMBEDDINGS] Deleted embeddings for post {post_id}")
         return True
     except Exception as e:
         print(f"[EMBEDDINGS] Error deleting embeddings for post {post_id}: {e}")
         return False
+
+def invalidate_corpus():
+    """Drop the cached corpus matrix (an embedding file was written or deleted)"""
+    global _corpus, _corpus_generation
+    with _corpus_lock:
+        _corpus_generation += 1
+        _corpus = None
+
+def load_corpus() -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+    """
+    All post embeddings stacked into one matrix, plus (post_id, fragment) per row.
+    The matrix is shared by every caller: don't modify it in place.
+
+    Kept in memory between calls. Files written by other processes (the regenerate
+    scripts) are picked up when they add or remove files in data/embeddings.
+    """
+    global _corpus
+    with _corpus_lock:
+        key = (_corpus_generation, os.stat('data/embeddings').st_mtime_ns)
+        if _corpus is not None and _corpus[0] == key:
+            return _corpus[1], _corpus[2]
+
+    matrix, index = _read_corpus()
+    with _corpus_lock:
+        if key[0] == _corpus_generation:
+            _corpus = (key, matrix, index)
+    return matrix, index
+
+def _read_corpus() -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+    """Load all post embeddings from disk"""
+    embedding_files = []
+    for filename in os.listdir('data/embeddings'):
+        if filename.startswith('post_') and filename.endswith('.npy'):
+            post_id = int(filename.replace('post_', '').replace('.npy', ''))
+            embedding_files.append((post_id, f'data/embeddings/{filename}'))
+
+    embedding_files.sort()
+
+    all_embeddings = []
+    index = []
+
+    for post_id, filepath in embedding_files:
+        emb = np.load(filepath)
+        all_embeddings.append(emb)
+        for frag_idx in range(emb.shape[0]):
+            index.append((post_id, frag_idx))
+
+    all_embeddings = np.vstack(all_embeddings)
+    return all_embeddings, index
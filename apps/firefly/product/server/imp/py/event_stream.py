@@ -0,0 +1,217 @@
+"""
+In-process pub/sub for notification events, served to clients as server-sent events.
+
+Database write paths publish events (matches stored, queries viewed, posts created,
+profiles completed); each /api/notifications/stream connection holds a Subscription
+that receives them. Recent events are kept in a ring buffer so a reconnecting client
+can resume from its Last-Event-ID. Event IDs are "<boot>-<seq>", so an ID from an
+earlier server process (or one that has fallen out of the buffer) triggers a
+'resync' event telling the client to poll once instead.
+"""
+
+import json
+import queue
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict, Any, List, Iterator
+
+# Event types published by the database layer
+QUERY_MATCH = 'query_match'      # {'query_id', 'last_match_added_at'}
+QUERY_VIEWED = 'query_viewed'    # {'query_id', 'user_email', 'last_viewed_at'}
+NEW_POST = 'new_post'            # {'post_id', 'author_email', 'created_at'}
+NEW_USER = 'new_user'            # {'user_id', 'profile_completed_at'}
+RESYNC = 'resync'                # Sent to a subscriber that missed events
+
+
+class Event:
+    """One published event"""
+
+    __slots__ = ('id', 'seq', 'type', 'data')
+
+    def __init__(self, event_id: str, seq: int, event_type: str, data: Dict[str, Any]):
+        self.id = event_id
+        self.seq = seq
+        self.type = event_type
+        self.data = data
+
+
+def _json_default(value):
+    """Timestamps go out as ISO8601 like the rest of the API"""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def format_sse(event_type: str, data: Dict[str, Any], event_id: Optional[str] = None) -> str:
+    """Encode one server-sent event frame"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, default=_json_default)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    """A subscriber's event queue (one per open stream)"""
+
+    def __init__(self, broker: 'EventBroker', max_queue: int):
+        self.broker = broker
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def deliver(self, event: Event):
+        """Called by the broker; a subscriber that can't keep up is told to resync"""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout: float) -> Optional[Event]:
+        """Next event, or None if nothing arrived within timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    """Fan-out of published events to all open subscriptions"""
+
+    def __init__(self, buffer_size: int = 1000, max_queue: int = 500, heartbeat_seconds: float = 15.0):
+        """
+        Args:
+            buffer_size: Number of recent events kept for Last-Event-ID resume
+            max_queue: Per-subscriber backlog before it is told to resync
+            heartbeat_seconds: Idle time before a stream sends a keep-alive comment
+        """
+        self.boot = str(int(time.time()))
+        self.heartbeat_seconds = heartbeat_seconds
+        self.max_queue = max_queue
+
+        self._seq = 0
+        self._buffer = deque(maxlen=buffer_size)
+        self._subscribers = set()
+        self._closed = False
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.published = 0
+        self.resyncs = 0
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> Optional[Event]:
+        """Record an event and hand it to every subscriber"""
+        with self._lock:
+            if self._closed:
+                return None
+            self._seq += 1
+            event = Event(f"{self.boot}-{self._seq}", self._seq, event_type, data)
+            self._buffer.append(event)
+            self.published += 1
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            subscription.deliver(event)
+        return event
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Subscription:
+        """
+        Open a subscription. With last_event_id, buffered events after it are queued
+        first; if they can't be replayed exactly, a RESYNC event is queued instead.
+        """
+        subscription = Subscription(self, self.max_queue)
+        with self._lock:
+            if last_event_id:
+                replay = self._events_after(last_event_id)
+                if replay is None:
+                    self.resyncs += 1
+                    subscription.deliver(Event(None, self._seq, RESYNC, {'reason': 'events_missed'}))
+                else:
+                    for event in replay:
+                        subscription.deliver(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def close(self):
+        """Stop accepting events and wake open streams so they finish"""
+        with self._lock:
+            self._closed = True
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        for subscription in subscribers:
+            subscription.deliver(None)
+
+    def stream(self, subscription: Subscription, accept) -> Iterator[str]:
+        """
+        Generate SSE frames for a subscription until the broker closes.
+
+        Args:
+            subscription: From subscribe()
+            accept: Called with each Event; returns (event_type, data) to send, or None to skip
+        """
+        try:
+            yield f"retry: {int(self.heartbeat_seconds * 1000)}\n\n"
+            yield format_sse('ready', {'boot': self.boot})
+
+            while True:
+                if subscription.overflowed:
+                    self.resyncs += 1
+                    yield format_sse(RESYNC, {'reason': 'slow_consumer'})
+                    return
+
+                event = subscription.get(self.heartbeat_seconds)
+                if event is None:
+                    if self._closed:
+                        return
+                    yield ": heartbeat\n\n"
+                    continue
+
+                if event.type == RESYNC:
+                    yield format_sse(RESYNC, event.data)
+                    continue
+
+                message = accept(event)
+                if message is not None:
+                    event_type, data = message
+                    yield format_sse(event_type, data, event.id)
+        finally:
+            subscription.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot for /api/health"""
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'published': self.published,
+                'buffered': len(self._buffer),
+                'resyncs': self.resyncs
+            }
+
+    # Internal helpers (caller holds self._lock)
+
+    def _events_after(self, last_event_id: str) -> Optional[List[Event]]:
+        """Buffered events newer than last_event_id, or None if some were lost"""
+        boot, _, seq = last_event_id.partition('-')
+        try:
+            seq = int(seq)
+        except ValueError:
+            return None
+        if boot != self.boot or seq > self._seq:
+            return None
+
+        if seq == self._seq:
+            return []
+        oldest = self._buffer[0].seq if self._buffer else self._seq + 1
+        if seq + 1 < oldest:
+            return None  # Fell out of the ring buffer
+        return [event for event in self._buffer if event.seq > seq]
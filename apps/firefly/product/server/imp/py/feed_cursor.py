@@ -0,0 +1,46 @@
+"""
+Opaque cursors for keyset-paginated post feeds.
+
+Feeds are ordered newest first by (created_at, id). A cursor encodes the
+(created_at, id) of the last post a client has seen; the next page is every post
+strictly before it, which an index on (created_at DESC, id DESC) serves directly,
+so page 100 costs the same as page 1. Clients treat cursors as opaque strings.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+
+def encode_cursor(created_at: datetime, post_id: int) -> str:
+    """Cursor pointing just past (created_at, post_id)"""
+    payload = json.dumps({'t': created_at.isoformat(), 'id': post_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """(created_at, id) from a cursor; raises ValueError if it isn't one of ours"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        created_at = datetime.fromisoformat(payload['t'])
+        post_id = int(payload['id'])
+    except (ValueError, TypeError, KeyError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    return created_at, post_id
+
+
+def next_cursor(posts: List[Dict[str, Any]], limit: Optional[int]) -> Optional[str]:
+    """
+    Cursor for the page after `posts`, or None if this was the last page.
+    Uses the oldest (created_at, id) on the page, which is the last row in feed order
+    even if the caller re-sorted the page for display.
+    """
+    if not posts or limit is None or len(posts) < limit:
+        return None
+    keyed = [post for post in posts if post.get('created_at') is not None]
+    if not keyed:
+        return None
+    oldest = min(keyed, key=lambda post: (post['created_at'], post['id']))
+    return encode_cursor(oldest['created_at'], oldest['id'])
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Index advisor: replay the server's query catalogue with and without the managed indexes.
+
+Builds a synthetic dataset in a scratch schema (default 20,000 users, each with a
+profile, a handful of posts and sometimes a query), then runs every catalogue query
+under EXPLAIN (ANALYZE, BUFFERS):
+
+    before - primary keys and unique constraints only
+    after  - plus migrations.MANAGED_INDEXES
+
+and prints execution time, shared buffers touched and the scan each plan used.
+The catalogue is taken from the code that runs in production: the prepared hot
+queries (Database._PREPARED_STATEMENTS), the feed pages (Database._feed_page_sql)
+and the remaining per-request lookups.
+
+Usage:
+    python3 index_advisor.py [num_users] [--plans]
+
+--plans prints the full before/after plan of every query. The scratch schema
+(bench_index_advisor) is dropped and recreated on every run; the real tables are
+never touched.
+"""
+
+import re
+import sys
+
+import psycopg2
+
+from db import db, Database
+from migrations import MANAGED_INDEXES
+
+SCHEMA = 'bench_index_advisor'
+
+POSTS_PER_USER = 5
+
+def build_fixture(conn, num_users):
+    """Scratch tables shaped like production (without managed indexes) and synthetic rows"""
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        cur.execute(f"SET search_path TO {SCHEMA}")
+        cur.execute("SELECT setseed(0.42)")
+        cur.execute("""
+            CREATE TABLE users (
+                id SERIAL PRIMARY KEY,
+                email VARCHAR(255) UNIQUE NOT NULL,
+                name TEXT,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                device_ids TEXT[] DEFAULT ARRAY[]::TEXT[],
+                invited_by INTEGER,
+                invited_at TIMESTAMP,
+                profile_complete BOOLEAN DEFAULT FALSE,
+                profile_completed_at TIMESTAMP,
+                ancestor_chain INTEGER[],
+                last_activity TIMESTAMP,
+                apns_device_token TEXT
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE templates (
+                name TEXT PRIMARY KEY,
+                placeholder_title TEXT, placeholder_summary TEXT, placeholder_body TEXT, plural_name TEXT
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE posts (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER NOT NULL REFERENCES users(id),
+                parent_id INTEGER,
+                title TEXT NOT NULL, summary TEXT NOT NULL, body TEXT NOT NULL, image_url TEXT,
+                clip_offset_x REAL DEFAULT 0, clip_offset_y REAL DEFAULT 0,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                timezone VARCHAR(50) NOT NULL DEFAULT 'UTC',
+                location_tag TEXT,
+                ai_generated BOOLEAN NOT NULL DEFAULT FALSE,
+                template_name TEXT DEFAULT 'post',
+                has_new_matches BOOLEAN DEFAULT FALSE,
+                last_match_added_at TIMESTAMP,
+                child_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE query_views (
+                id SERIAL PRIMARY KEY,
+                query_id INTEGER NOT NULL REFERENCES posts(id),
+                user_email VARCHAR(255) NOT NULL,
+                last_viewed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(query_id, user_email)
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE query_results (
+                id SERIAL PRIMARY KEY,
+                query_id INTEGER REFERENCES posts(id),
+                post_id INTEGER REFERENCES posts(id),
+                relevance_score FLOAT NOT NULL,
+                matched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(query_id, post_id)
+            )
+        """)
+        cur.execute("""
+            INSERT INTO templates (name, plural_name)
+            VALUES ('profile', 'profiles'), ('post', 'posts'), ('query', 'queries')
+        """)
+
+        # Users: an invite forest, two devices each, 90% with a completed profile
+        cur.execute("""
+            INSERT INTO users (id, email, name, created_at, device_ids, invited_by, invited_at,
+                               profile_complete, last_activity)
+            SELECT g, 'user' || g || '@bench.local', 'User ' || g,
+                   now() - (%(n)s - g) * interval '5 minutes',
+                   ARRAY['device-' || g, 'device-' || g || '-b'],
+                   CASE WHEN g <= 3 THEN NULL ELSE greatest(1, g - 1 - (random() * 500)::int) END,
+                   now() - (%(n)s - g) * interval '5 minutes',
+                   random() < 0.9,
+                   now() - random() * interval '300 days'
+            FROM generate_series(1, %(n)s) g
+        """, {'n': num_users})
+        cur.execute("UPDATE users SET profile_completed_at = created_at WHERE profile_complete")
+
+        # Profiles (post id = user id), then posts under each profile, then queries for 10% of users
+        cur.execute("""
+            INSERT INTO posts (id, user_id, parent_id, title, summary, body, template_name, created_at)
+            SELECT g, g, -1, 'User ' || g, 'About me', 'Body', 'profile', u.created_at
+            FROM generate_series(1, %(n)s) g JOIN users u ON u.id = g
+        """, {'n': num_users})
+        cur.execute("""
+            INSERT INTO posts (id, user_id, parent_id, title, summary, body, template_name, created_at)
+            SELECT %(n)s * i + g, g, g, 'Post ' || i, 'Summary', 'Body', 'post',
+                   now() - random() * interval '300 days'
+            FROM generate_series(1, %(n)s) g, generate_series(1, %(per_user)s) i
+        """, {'n': num_users, 'per_user': POSTS_PER_USER})
+        cur.execute("""
+            INSERT INTO posts (id, user_id, parent_id, title, summary, body, template_name, created_at,
+                               last_match_added_at)
+            SELECT %(n)s * (%(per_user)s + 1) + g, g, g, 'Looking for', 'Summary', 'Body', 'query',
+                   now() - random() * interval '300 days', now() - random() * interval '30 days'
+            FROM generate_series(1, %(n)s) g
+            WHERE g %% 10 = 0
+        """, {'n': num_users, 'per_user': POSTS_PER_USER})
+        cur.execute("SELECT setval('posts_id_seq', (SELECT MAX(id) FROM posts))")
+        cur.execute("SELECT setval('users_id_seq', (SELECT MAX(id) FROM users))")
+        cur.execute("""
+            UPDATE posts p SET child_count = c.n
+            FROM (SELECT parent_id, COUNT(*) as n FROM posts WHERE parent_id > 0 GROUP BY parent_id) c
+            WHERE c.parent_id = p.id
+        """)
+
+        # Each query viewed by its author and matched against a few posts
+        cur.execute("""
+            INSERT INTO query_views (query_id, user_email, last_viewed_at)
+            SELECT p.id, u.email, now() - random() * interval '30 days'
+            FROM posts p JOIN users u ON u.id = p.user_id
+            WHERE p.template_name = 'query'
+        """)
+        cur.execute("""
+            INSERT INTO query_results (query_id, post_id, relevance_score)
+            SELECT q.id, %(n)s * k + (q.user_id * 7 + k) %% %(n)s + 1, random()
+            FROM posts q, generate_series(1, %(per_user)s) k
+            WHERE q.template_name = 'query'
+            ON CONFLICT DO NOTHING
+        """, {'n': num_users, 'per_user': POSTS_PER_USER})
+        cur.execute("ANALYZE users, posts, templates, query_views, query_results")
+    conn.commit()
+
+def apply_managed_indexes(conn):
+    with conn.cursor() as cur:
+        for name, definition, _ in MANAGED_INDEXES:
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {name} {definition}")
+        cur.execute("ANALYZE users, posts, templates, query_views, query_results")
+    conn.commit()
+
+def catalogue(conn, num_users):
+    """(name, sql, params) for every query pattern the server runs per request"""
+    user_id = num_users // 2
+    with conn.cursor() as cur:
+        cur.execute("SELECT email, device_ids[1] FROM users WHERE id = %s", (user_id,))
+        email, device_id = cur.fetchone()
+        cur.execute("SELECT id FROM posts WHERE template_name = 'query' ORDER BY id LIMIT 50")
+        query_ids = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT id FROM posts WHERE template_name = 'post' ORDER BY id DESC LIMIT 1")
+        post_id = cur.fetchone()[0]
+    since = '2025-06-01T00:00:00Z'
+
+    prepared_params = {
+        'post_by_id': (post_id,),
+        'user_by_email': (email,),
+        'query_badge_state': (email, query_ids),
+        'upsert_query_result': (query_ids[0], post_id, 0.5),
+        'count_new_users': (since,),
+        'count_new_posts': (since, email)
+    }
+    entries = []
+    for name, params in prepared_params.items():
+        sql, text_params = db.statements.text(name, params)
+        entries.append((name, sql, text_params))
+
+    entries.append(('user_by_device', """
+        SELECT id, email, name, created_at, device_ids, invited_by, invited_at, profile_complete
+        FROM users WHERE device_ids @> ARRAY[%s]::text[]
+    """, [device_id]))
+    entries.append(('user_by_device (= ANY, before)', """
+        SELECT id, email, name, created_at, device_ids, invited_by, invited_at, profile_complete
+        FROM users WHERE %s = ANY(device_ids)
+    """, [device_id]))
+    entries.append(('user_profile', """
+        SELECT p.id, p.title, p.child_count
+        FROM posts p
+        LEFT JOIN users u ON p.user_id = u.id
+        LEFT JOIN templates t ON p.template_name = t.name
+        WHERE p.user_id = %s AND p.template_name = 'profile'
+        LIMIT 1
+    """, [user_id]))
+    entries.append(('posts_by_template (query)', """
+        SELECT id, user_id, parent_id, title, summary, body, image_url,
+               created_at, timezone, location_tag, ai_generated, template_name,
+               has_new_matches
+        FROM posts
+        WHERE template_name = %s
+    """, ['query']))
+
+    for name, conditions, params, flags in [
+        ('recent_page', [], [], False),
+        ('child_page', ["p.parent_id = %s"], [user_id], False),
+        ('tagged_page (post)', ["p.template_name IN (%s)"], ['post'], True),
+        ('tagged_page (post, author)', ["p.template_name IN (%s)", "p.user_id = %s"], ['post', user_id], True),
+    ]:
+        params = list(params)
+        sql = Database._feed_page_sql(conditions, params, 50, None, include_post_flags=flags)
+        entries.append((name, sql, params))
+
+    entries.append(('watermark_posts', """
+        SELECT u.email, MAX(p.created_at)
+        FROM posts p
+        JOIN users u ON p.user_id = u.id
+        WHERE p.template_name = 'post'
+        GROUP BY u.email
+    """, []))
+    return entries
+
+def explain(conn, sql, params):
+    """(execution ms, shared buffers touched, scans used, plan lines); writes are rolled back"""
+    with conn.cursor() as cur:
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, params or None)
+        lines = [row[0] for row in cur.fetchall()]
+    conn.rollback()
+
+    execution_ms = next((float(m.group(1)) for line in lines
+                         for m in [re.search(r'Execution Time: ([\d.]+) ms', line)] if m), 0.0)
+    buffers = 0
+    for line in lines:
+        if 'Buffers:' in line:
+            buffers = sum(int(n) for n in re.findall(r'(?:hit|read)=(\d+)', line))
+            break  # The top node's counts include its children
+    scans = sorted({f"{m.group(1)} {m.group(2) or m.group(3)}"
+                    for line in lines
+                    for m in [re.search(r'((?:Parallel )?(?:Seq|Index Only|Index|Bitmap Index|Bitmap Heap) Scan)'
+                                        r'(?: using (\w+)| on (\w+))', line)] if m})
+    return execution_ms, buffers, scans, lines
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    num_users = int(args[0]) if args else 20000
+    show_plans = '--plans' in sys.argv
+
+    conn = psycopg2.connect(**db.db_config)
+    try:
+        build_fixture(conn, num_users)
+        entries = catalogue(conn, num_users)
+        print(f"Fixture: {num_users} users, {num_users * (POSTS_PER_USER + 1) + num_users // 10} posts\n")
+
+        before = {name: explain(conn, sql, params) for name, sql, params in entries}
+        apply_managed_indexes(conn)
+        after = {name: explain(conn, sql, params) for name, sql, params in entries}
+
+        print(f"{'query':34s} {'before':>10s} {'after':>10s} {'buffers':>16s}  scans after")
+        for name, _, _ in entries:
+            before_ms, before_buffers, _, _ = before[name]
+            after_ms, after_buffers, scans, _ = after[name]
+            print(f"{name:34s} {before_ms:8.2f}ms {after_ms:8.2f}ms "
+                  f"{before_buffers:7d} -> {after_buffers:<6d}  {', '.join(scans)}")
+
+        print("\nManaged indexes:")
+        for index_name, definition, purpose in MANAGED_INDEXES:
+            print(f"  {index_name}: {definition}\n      {purpose}")
+
+        if show_plans:
+            for name, _, _ in entries:
+                print(f"\n=== {name} (before) ===")
+                print("\n".join(before[name][3]))
+                print(f"=== {name} (after) ===")
+                print("\n".join(after[name][3]))
+
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+In-memory index of the invite tree (users.invited_by) for proximity queries.
+
+Proximity between two users is their distance in the invite tree: the number of
+invite edges on the path through their lowest common ancestor. Ancestors are kept
+in binary-lifting tables (the 2^k-th ancestor of every user), so proximity(a, b)
+is O(log n); adding a user is O(log n) as well. Users in different trees (or
+unknown users) are UNRELATED.
+
+The tree is shared by every proximity-sorted read (get_proximity, the people
+directory, get_recent_tagged_posts) and kept current by create_user_from_invite.
+"""
+
+import threading
+from typing import Callable, Optional, Dict, Any, Iterable, Iterator, List, Tuple
+
+# Proximity reported when there is no path between two users
+UNRELATED = 9999
+
+
+class InviteTree:
+    """Invite forest with binary-lifting ancestor tables"""
+
+    def __init__(self):
+        self.loaded = False
+        self._parent = {}    # user_id -> inviter id (None for roots)
+        self._children = {}  # user_id -> set of invitee ids
+        self._depth = {}     # user_id -> edges from its root
+        self._root = {}      # user_id -> root of its tree
+        self._jumps = {}     # user_id -> [1st, 2nd, 4th, 8th, ...] ancestor
+        self._lock = threading.RLock()
+
+    # Building and updating
+
+    def load(self, loader: Callable[[], Iterable[Tuple[int, Optional[int]]]]):
+        """
+        Rebuild from scratch. loader() returns (user_id, invited_by) pairs; it runs
+        under the tree lock so add_user can't interleave with the snapshot.
+        """
+        with self._lock:
+            invited_by = {user_id: inviter for user_id, inviter in loader()}
+
+            children = {user_id: [] for user_id in invited_by}
+            roots = []
+            for user_id, inviter in invited_by.items():
+                if inviter is None or inviter not in invited_by or inviter == user_id:
+                    roots.append(user_id)
+                else:
+                    children[inviter].append(user_id)
+
+            self._parent.clear()
+            self._children.clear()
+            self._depth.clear()
+            self._root.clear()
+            self._jumps.clear()
+
+            # Parents before children, so each user's jump table can reuse its ancestors'
+            pending = sorted(roots)
+            for root in pending:
+                self._attach(root, None)
+            visited = set(pending)
+            while True:
+                index = 0
+                while index < len(pending):
+                    user_id = pending[index]
+                    index += 1
+                    for child in sorted(children[user_id]):
+                        if child not in visited:
+                            visited.add(child)
+                            self._attach(child, user_id)
+                            pending.append(child)
+
+                # Users on an invite cycle are unreachable from any root; cut the cycle
+                leftover = [user_id for user_id in invited_by if user_id not in visited]
+                if not leftover:
+                    break
+                root = min(leftover)
+                self._attach(root, None)
+                visited.add(root)
+                pending = [root]
+
+            self.loaded = True
+
+    def add_user(self, user_id: int, invited_by: Optional[int]):
+        """A user joined (no-op until loaded, or if already known)"""
+        with self._lock:
+            if not self.loaded or user_id in self._parent:
+                return
+            if invited_by is not None and invited_by not in self._parent:
+                invited_by = None  # Unknown inviter: start a new tree
+            self._attach(user_id, invited_by)
+
+    def __contains__(self, user_id) -> bool:
+        return user_id in self._parent
+
+    def __len__(self) -> int:
+        return len(self._parent)
+
+    # Queries
+
+    def depth(self, user_id: int) -> Optional[int]:
+        return self._depth.get(user_id)
+
+    def ancestor(self, user_id: int, steps: int) -> Optional[int]:
+        """The ancestor `steps` invites up (None if past the root)"""
+        with self._lock:
+            if user_id not in self._parent or steps > self._depth[user_id]:
+                return None
+            return self._lift(user_id, steps)
+
+    def lca(self, a: int, b: int) -> Optional[int]:
+        """Lowest common ancestor, or None if unrelated"""
+        with self._lock:
+            if a not in self._parent or b not in self._parent or self._root[a] != self._root[b]:
+                return None
+
+            if self._depth[a] < self._depth[b]:
+                a, b = b, a
+            a = self._lift(a, self._depth[a] - self._depth[b])
+            if a == b:
+                return a
+
+            # Jump both up while their ancestors differ, largest jumps first
+            for k in range(len(self._jumps[a]) - 1, -1, -1):
+                if k < len(self._jumps[a]) and self._jumps[a][k] != self._jumps[b][k]:
+                    a = self._jumps[a][k]
+                    b = self._jumps[b][k]
+            return self._parent[a]
+
+    def proximity(self, a: int, b: int) -> int:
+        """Invite-tree distance between two users (UNRELATED if no path)"""
+        if a == b:
+            return 0
+        with self._lock:
+            ancestor = self.lca(a, b)
+            if ancestor is None:
+                return UNRELATED
+            return self._depth[a] + self._depth[b] - 2 * self._depth[ancestor]
+
+    def levels(self, user_id: int) -> Iterator[Tuple[int, List[int]]]:
+        """
+        Breadth-first walk outward from user_id through inviters and invitees:
+        yields (distance, [user_ids at that distance]), starting with (0, [user_id]).
+        Each level costs only the users in it, so callers can stop as soon as they have enough.
+        """
+        with self._lock:
+            if user_id not in self._parent:
+                return
+        level = [user_id]
+        seen = {user_id}
+        distance = 0
+        while level:
+            yield distance, level
+            next_level = []
+            with self._lock:
+                for current in level:
+                    parent = self._parent.get(current)
+                    neighbors = list(self._children.get(current, ()))
+                    if parent is not None:
+                        neighbors.append(parent)
+                    for neighbor in sorted(neighbors):
+                        if neighbor not in seen:
+                            seen.add(neighbor)
+                            next_level.append(neighbor)
+            level = next_level
+            distance += 1
+
+    def closest(self, user_id: int, k: int) -> List[Tuple[int, int]]:
+        """The k users closest to user_id (excluding itself) as (user_id, distance)"""
+        result = []
+        for distance, level in self.levels(user_id):
+            if distance == 0:
+                continue
+            for other in level:
+                result.append((other, distance))
+                if len(result) >= k:
+                    return result
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot for /api/health"""
+        with self._lock:
+            return {
+                'loaded': self.loaded,
+                'users': len(self._parent),
+                'trees': sum(1 for parent in self._parent.values() if parent is None),
+                'max_depth': max(self._depth.values(), default=0)
+            }
+
+    # Internal helpers (caller holds self._lock)
+
+    def _attach(self, user_id: int, parent: Optional[int]):
+        self._parent[user_id] = parent
+        self._children.setdefault(user_id, set())
+        if parent is None:
+            self._depth[user_id] = 0
+            self._root[user_id] = user_id
+            self._jumps[user_id] = []
+            return
+
+        self._children[parent].add(user_id)
+        self._depth[user_id] = self._depth[parent] + 1
+        self._root[user_id] = self._root[parent]
+
+        # jumps[k] = 2^k-th ancestor = the 2^(k-1)-th ancestor's 2^(k-1)-th ancestor
+        jumps = [parent]
+        while len(self._jumps[jumps[-1]]) >= len(jumps):
+            jumps.append(self._jumps[jumps[-1]][len(jumps) - 1])
+        self._jumps[user_id] = jumps
+
+    def _lift(self, user_id: int, steps: int) -> int:
+        k = 0
+        while steps:
+            if steps & 1:
+                user_id = self._jumps[user_id][k]
+            steps >>= 1
+            k += 1
+        return user_id
@@ -0,0 +1,217 @@
+"""
+Pluggable LLM backends for search scoring.
+
+The search pipeline only needs "prompt in, response text out", so every backend
+implements complete(prompt, max_tokens, context) and returns the raw text that
+the Anthropic API would have returned. Selected with LLM_BACKEND:
+
+    anthropic  - live Claude API (default)
+    synthetic  - deterministic scores from embedding similarity, with simulated latency
+    record     - live Claude API, appending every prompt/response to a recording file
+    replay     - serve responses from a recording file (no network)
+
+`context` carries what a stand-in needs to answer without reading the prompt:
+    {'task': 'rerank' | 'evaluate', 'items': [(id, rag_score), ...]}
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional, Dict, Any
+
+import config
+
+# Default location for recorded LLM traffic
+DEFAULT_RECORDING_PATH = 'data/llm_recordings.jsonl'
+
+
+def prompt_hash(prompt: str) -> str:
+    """Stable key for a prompt (same hash as the search_cache table)"""
+    return hashlib.sha256(prompt.encode()).hexdigest()
+
+
+class AnthropicBackend:
+    """Live Claude API"""
+
+    name = 'anthropic'
+
+    def __init__(self, model: str, timeout: float = 30.0):
+        self.model = model
+        self.timeout = timeout
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            api_key = config.get_anthropic_api_key()
+            if not api_key:
+                raise Exception("ANTHROPIC_API_KEY not found in environment")
+
+            from anthropic import Anthropic
+            self._client = Anthropic(api_key=api_key, timeout=self.timeout)
+        return self._client
+
+    def complete(self, prompt: str, max_tokens: int, context: Optional[Dict[str, Any]] = None) -> str:
+        response = self._get_client().messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            temperature=0.0,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        return response.content[0].text
+
+
+class SyntheticBackend:
+    """
+    Deterministic stand-in that scores items from their RAG (embedding) similarity.
+    Latency is simulated as base + per-item cost, with jitter derived from the prompt
+    hash so repeated runs see identical timing.
+    """
+
+    name = 'synthetic'
+
+    def __init__(
+        self,
+        base_latency_ms: float = 800.0,
+        per_item_latency_ms: float = 40.0,
+        jitter_ms: float = 200.0,
+        score_floor: float = 0.2,
+        score_ceiling: float = 0.8
+    ):
+        self.base_latency_ms = base_latency_ms
+        self.per_item_latency_ms = per_item_latency_ms
+        self.jitter_ms = jitter_ms
+        self.score_floor = score_floor
+        self.score_ceiling = score_ceiling
+
+    def score(self, similarity: float) -> int:
+        """Map cosine similarity onto the 0-100 relevance scale"""
+        span = self.score_ceiling - self.score_floor
+        scaled = (float(similarity) - self.score_floor) / span
+        return int(round(max(0.0, min(1.0, scaled)) * 100))
+
+    def complete(self, prompt: str, max_tokens: int, context: Optional[Dict[str, Any]] = None) -> str:
+        if not context or 'items' not in context:
+            raise ValueError("Synthetic LLM backend needs a scoring context")
+
+        items = context['items']
+
+        # Deterministic jitter in [0, jitter_ms)
+        jitter = int(prompt_hash(prompt)[:8], 16) % max(1, int(self.jitter_ms)) if self.jitter_ms else 0
+        latency_ms = self.base_latency_ms + self.per_item_latency_ms * len(items) + jitter
+        time.sleep(latency_ms / 1000.0)
+
+        id_key = 'query_id' if context.get('task') == 'evaluate' else 'id'
+        scores = [{id_key: item_id, 'score': self.score(similarity)} for item_id, similarity in items]
+        scores.sort(key=lambda s: s['score'], reverse=True)
+        return json.dumps(scores)
+
+
+class RecordingBackend:
+    """Wraps another backend and appends every exchange to a JSONL recording"""
+
+    name = 'record'
+
+    def __init__(self, inner, path: str = DEFAULT_RECORDING_PATH):
+        self.inner = inner
+        self.path = path
+        self._lock = threading.Lock()
+
+    def complete(self, prompt: str, max_tokens: int, context: Optional[Dict[str, Any]] = None) -> str:
+        start = time.time()
+        text = self.inner.complete(prompt, max_tokens, context)
+        duration = time.time() - start
+
+        entry = {
+            'prompt_hash': prompt_hash(prompt),
+            'task': (context or {}).get('task'),
+            'prompt': prompt,
+            'response': text,
+            'duration_s': round(duration, 3)
+        }
+
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+        return text
+
+
+class ReplayBackend:
+    """
+    Serves responses from a recording made by RecordingBackend.
+    Sleeps for the recorded duration (scaled by speed) so benchmarks keep realistic
+    timing. Prompts missing from the recording go to `fallback`, or raise KeyError.
+    """
+
+    name = 'replay'
+
+    def __init__(self, path: str = DEFAULT_RECORDING_PATH, speed: float = 1.0, fallback=None):
+        self.path = path
+        self.speed = speed
+        self.fallback = fallback
+        self.hits = 0
+        self.misses = 0
+        self._recordings = self._load(path)
+
+    @staticmethod
+    def _load(path: str) -> Dict[str, Dict[str, Any]]:
+        recordings = {}
+        if not os.path.exists(path):
+            print(f"[LLM] Replay file not found: {path}")
+            return recordings
+
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                recordings[entry['prompt_hash']] = entry  # Latest recording wins
+
+        print(f"[LLM] Loaded {len(recordings)} recorded responses from {path}")
+        return recordings
+
+    def complete(self, prompt: str, max_tokens: int, context: Optional[Dict[str, Any]] = None) -> str:
+        entry = self._recordings.get(prompt_hash(prompt))
+        if entry is None:
+            self.misses += 1
+            if self.fallback is not None:
+                return self.fallback.complete(prompt, max_tokens, context)
+            raise KeyError(f"No recorded LLM response for prompt {prompt_hash(prompt)[:8]}...")
+
+        self.hits += 1
+        if self.speed > 0:
+            time.sleep(entry.get('duration_s', 0.0) / self.speed)
+        return entry['response']
+
+
+def create_backend(model: str, timeout: float = 30.0):
+    """Build the backend selected by LLM_BACKEND"""
+    mode = (config.get_config_value('LLM_BACKEND') or 'anthropic').strip().lower()
+    path = config.get_config_value('LLM_RECORDING_PATH') or DEFAULT_RECORDING_PATH
+
+    synthetic = SyntheticBackend(
+        base_latency_ms=config.get_float_config('LLM_SYNTHETIC_LATENCY_MS', 800.0),
+        per_item_latency_ms=config.get_float_config('LLM_SYNTHETIC_PER_ITEM_MS', 40.0),
+        jitter_ms=config.get_float_config('LLM_SYNTHETIC_JITTER_MS', 200.0)
+    )
+
+    if mode == 'synthetic':
+        backend = synthetic
+    elif mode == 'record':
+        backend = RecordingBackend(AnthropicBackend(model, timeout), path)
+    elif mode == 'replay':
+        # Unrecorded prompts fall back to synthetic scoring so runs never hit the network
+        backend = ReplayBackend(path, speed=config.get_float_config('LLM_REPLAY_SPEED', 1.0), fallback=synthetic)
+    else:
+        if mode != 'anthropic':
+            print(f"[LLM] Unknown LLM_BACKEND '{mode}', using anthropic")
+        backend = AnthropicBackend(model, timeout)
+
+    print(f"[LLM] Using '{backend.name}' backend")
+    return backend
@@ -0,0 +1,213 @@
+"""
+Circuit breaker for LLM calls made by the search pipeline.
+Tracks rolling latency and error rate; while open, calls are short-circuited so
+search falls straight back to RAG-only scoring, and the affected queries/posts
+are remembered so they can be re-scored by the LLM once the breaker closes.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional, Dict, Any, List, Tuple
+
+import config
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is short-circuited because the breaker is open"""
+    pass
+
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker (closed -> open -> half-open -> closed)"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int = 20,
+        min_calls: int = 5,
+        error_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 10.0,
+        slow_rate_threshold: float = 0.5,
+        open_seconds: float = 60.0
+    ):
+        """
+        Args:
+            name: Name used in log lines and health output
+            window_size: Number of recent calls kept in the rolling window
+            min_calls: Minimum calls in the window before the breaker can trip
+            error_rate_threshold: Fraction of failed calls that opens the breaker
+            slow_call_seconds: Calls taking longer than this count as slow
+            slow_rate_threshold: Fraction of slow calls that opens the breaker
+            open_seconds: How long to stay open before allowing a trial call
+        """
+        self.name = name
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate_threshold = slow_rate_threshold
+        self.open_seconds = open_seconds
+
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.short_circuited = 0
+        self.times_opened = 0
+
+        # Each entry: (duration_seconds, succeeded)
+        self._calls = deque(maxlen=window_size)
+        self._pending_rescore = set()
+        self._lock = threading.Lock()
+
+        # Called with the drained rescore list when the breaker closes again
+        self.on_close: Optional[Callable[[List[Tuple[str, int]]], None]] = None
+
+    def allow_request(self) -> bool:
+        """Decide whether a call may go through right now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.open_seconds:
+                # Cool-down elapsed: let exactly one trial call through
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+                print(f"[BREAKER] {self.name}: half-open, allowing trial call")
+
+            if self.state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+
+            self.short_circuited += 1
+            return False
+
+    def record_success(self, duration: float):
+        """Record a completed call (slow calls count against the breaker)"""
+        to_rescore = None
+        with self._lock:
+            slow = duration > self.slow_call_seconds
+            self._calls.append((duration, True))
+
+            if self.state == self.HALF_OPEN:
+                self.trial_in_flight = False
+                if slow:
+                    self._open(f"trial call slow ({duration:.1f}s)")
+                else:
+                    to_rescore = self._close()
+            elif self.state == self.CLOSED:
+                self._maybe_open()
+
+        if to_rescore:
+            self._fire_on_close(to_rescore)
+
+    def record_failure(self, duration: float):
+        """Record a failed call"""
+        with self._lock:
+            self._calls.append((duration, False))
+
+            if self.state == self.HALF_OPEN:
+                self.trial_in_flight = False
+                self._open("trial call failed")
+            elif self.state == self.CLOSED:
+                self._maybe_open()
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Run fn through the breaker, raising CircuitOpenError if short-circuited"""
+        if not self.allow_request():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        start = time.time()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure(time.time() - start)
+            raise
+
+        self.record_success(time.time() - start)
+        return result
+
+    def is_closed(self) -> bool:
+        """True if calls are currently flowing normally"""
+        return self.state == self.CLOSED
+
+    def mark_for_rescore(self, kind: str, item_id: int):
+        """Remember an item that was scored without the LLM ('query' or 'post')"""
+        with self._lock:
+            self._pending_rescore.add((kind, item_id))
+
+    def status(self) -> Dict[str, Any]:
+        """Snapshot of breaker state for /api/health"""
+        with self._lock:
+            calls = list(self._calls)
+            durations = sorted(d for d, _ in calls)
+            failures = sum(1 for _, ok in calls if not ok)
+            slow = sum(1 for d, ok in calls if ok and d > self.slow_call_seconds)
+
+            return {
+                'state': self.state,
+                'window_calls': len(calls),
+                'error_rate': round(failures / len(calls), 3) if calls else 0.0,
+                'slow_rate': round(slow / len(calls), 3) if calls else 0.0,
+                'p50_latency_s': round(durations[len(durations) // 2], 3) if durations else None,
+                'max_latency_s': round(durations[-1], 3) if durations else None,
+                'opened_at': self.opened_at,
+                'times_opened': self.times_opened,
+                'short_circuited': self.short_circuited,
+                'pending_rescore': len(self._pending_rescore)
+            }
+
+    # Internal helpers (caller holds self._lock)
+
+    def _maybe_open(self):
+        """Trip the breaker if the rolling window is unhealthy"""
+        if len(self._calls) < self.min_calls:
+            return
+
+        total = len(self._calls)
+        failures = sum(1 for _, ok in self._calls if not ok)
+        slow = sum(1 for d, ok in self._calls if ok and d > self.slow_call_seconds)
+
+        if failures / total >= self.error_rate_threshold:
+            self._open(f"error rate {failures}/{total}")
+        elif slow / total >= self.slow_rate_threshold:
+            self._open(f"slow call rate {slow}/{total}")
+
+    def _open(self, reason: str):
+        self.state = self.OPEN
+        self.opened_at = time.time()
+        self.times_opened += 1
+        print(f"[BREAKER] {self.name}: OPEN ({reason}) - falling back to RAG-only scoring")
+
+    def _close(self) -> List[Tuple[str, int]]:
+        self.state = self.CLOSED
+        self.opened_at = None
+        self._calls.clear()
+        pending = sorted(self._pending_rescore)
+        self._pending_rescore.clear()
+        print(f"[BREAKER] {self.name}: CLOSED - {len(pending)} items queued for LLM re-scoring")
+        return pending
+
+    def _fire_on_close(self, pending: List[Tuple[str, int]]):
+        if self.on_close is None:
+            return
+        try:
+            self.on_close(pending)
+        except Exception as e:
+            print(f"[BREAKER] {self.name}: on_close callback failed: {e}")
+
+
+# Global instance shared by all LLM call sites
+llm_breaker = CircuitBreaker(
+    'llm',
+    window_size=int(config.get_float_config('LLM_BREAKER_WINDOW', 20)),
+    min_calls=int(config.get_float_config('LLM_BREAKER_MIN_CALLS', 5)),
+    error_rate_threshold=config.get_float_config('LLM_BREAKER_ERROR_RATE', 0.5),
+    slow_call_seconds=config.get_float_config('LLM_BREAKER_SLOW_SECONDS', 10.0),
+    slow_rate_threshold=config.get_float_config('LLM_BREAKER_SLOW_RATE', 0.5),
+    open_seconds=config.get_float_config('LLM_BREAKER_OPEN_SECONDS', 60.0)
+)
@@ -0,0 +1,136 @@
+"""
+Coalescing scheduler for background post matching.
+Debounces match requests per post ID, keeps at most one in-flight run per post,
+discards superseded pending runs, and executes on a bounded worker pool.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Dict, Any
+
+
+class MatchScheduler:
+    """Per-post debounced job scheduler backed by a thread pool"""
+
+    def __init__(
+        self,
+        run_fn: Callable[..., None],
+        max_workers: int = 2,
+        debounce_seconds: float = 2.0,
+        merge_fn: Optional[Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]] = None
+    ):
+        """
+        Args:
+            run_fn: Called as run_fn(post_id, **kwargs) on a worker thread
+            max_workers: Size of the worker pool
+            debounce_seconds: Quiet period after the last request before a run starts
+            merge_fn: Combines (older_kwargs, newer_kwargs) when requests coalesce;
+                      defaults to keeping the newer kwargs
+        """
+        self.run_fn = run_fn
+        self.max_workers = max_workers
+        self.debounce_seconds = debounce_seconds
+        self.merge_fn = merge_fn or (lambda older, newer: newer)
+
+        self._pending = {}     # post_id -> {'kwargs': dict, 'due': float}
+        self._running = set()  # post_ids with a run in flight
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='match')
+        self._dispatcher = None
+        self._shutdown = False
+
+        # Metrics
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, post_id: int, **kwargs):
+        """Request a match run for post_id (coalesces with any pending request)"""
+        with self._cond:
+            if self._shutdown:
+                print(f"[SCHEDULER] Shut down, dropping match request for post {post_id}")
+                return
+
+            self.submitted += 1
+            due = time.time() + self.debounce_seconds
+            existing = self._pending.get(post_id)
+            if existing is not None:
+                # Superseded: fold into the pending request and restart the debounce window
+                existing['kwargs'] = self.merge_fn(existing['kwargs'], kwargs)
+                existing['due'] = due
+                self.coalesced += 1
+            else:
+                self._pending[post_id] = {'kwargs': kwargs, 'due': due}
+
+            self._ensure_dispatcher()
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        """Metrics snapshot for /api/health"""
+        with self._cond:
+            return {
+                'pending': len(self._pending),
+                'running': len(self._running),
+                'workers': self.max_workers,
+                'submitted': self.submitted,
+                'coalesced': self.coalesced,
+                'completed': self.completed,
+                'failed': self.failed
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop dispatching; pending (not yet started) runs are dropped"""
+        with self._cond:
+            self._shutdown = True
+            dropped = len(self._pending)
+            self._pending.clear()
+            self._cond.notify_all()
+        if dropped:
+            print(f"[SCHEDULER] Dropped {dropped} pending match runs on shutdown")
+        self._executor.shutdown(wait=wait)
+
+    # Internal
+
+    def _ensure_dispatcher(self):
+        """Start the dispatcher thread on first use (caller holds the lock)"""
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name='match-dispatcher', daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        with self._cond:
+            while not self._shutdown:
+                now = time.time()
+                next_due = None
+
+                for post_id, job in list(self._pending.items()):
+                    if post_id in self._running:
+                        continue  # Wait for the in-flight run to finish first
+                    if job['due'] <= now:
+                        del self._pending[post_id]
+                        self._running.add(post_id)
+                        self._executor.submit(self._run, post_id, job['kwargs'])
+                    elif next_due is None or job['due'] < next_due:
+                        next_due = job['due']
+
+                timeout = None if next_due is None else max(0.0, next_due - now)
+                self._cond.wait(timeout)
+
+    def _run(self, post_id: int, kwargs: Dict[str, Any]):
+        try:
+            self.run_fn(post_id, **kwargs)
+            succeeded = True
+        except Exception as e:
+            print(f"[SCHEDULER] Match run for post {post_id} failed: {e}")
+            succeeded = False
+
+        with self._cond:
+            self._running.discard(post_id)
+            if succeeded:
+                self.completed += 1
+            else:
+                self.failed += 1
+            # A request may have arrived while this run was in flight
+            self._cond.notify()
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Numbered schema migrations, each applied once and recorded in schema_migrations.
+
+Startup calls db.run_migrations(): one SELECT of the applied versions, and nothing
+else unless a migration is pending. Each pending migration runs in its own
+transaction together with its schema_migrations row, under an advisory lock so two
+processes starting at once don't both apply it. A failed migration is rolled back
+and stops the run (later ones may depend on it); it is retried on the next start.
+
+To add a migration, write a function taking a cursor and append it to MIGRATIONS
+with the next version number. Never renumber or edit an applied migration.
+
+Run directly to apply pending migrations, or with --status to list them:
+    python migrations.py [--status]
+"""
+
+import sys
+from typing import Callable, List, Tuple, Set
+
+import psycopg2
+from psycopg2 import errors
+
+# pg_advisory_xact_lock key held while a migration is applied
+_LOCK_KEY = 4630117
+
+
+# Migrations (each takes a cursor; must be safe on databases that predate the registry)
+
+def _search_cache(cur):
+    """search_cache table for LLM result caching"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS search_cache (
+            prompt_hash TEXT PRIMARY KEY,
+            model_name TEXT NOT NULL,
+            llm_results TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_search_cache_model
+        ON search_cache(model_name)
+    """)
+
+
+def _query_results(cur):
+    """query_results table for cached search results, plus posts.has_new_matches"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS query_results (
+            id SERIAL PRIMARY KEY,
+            query_id INTEGER REFERENCES posts(id) ON DELETE CASCADE,
+            post_id INTEGER REFERENCES posts(id) ON DELETE CASCADE,
+            relevance_score FLOAT NOT NULL,
+            matched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(query_id, post_id)
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_query_results_query_id
+        ON query_results(query_id)
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_query_results_score
+        ON query_results(query_id, relevance_score DESC)
+    """)
+    cur.execute("""
+        ALTER TABLE posts
+        ADD COLUMN IF NOT EXISTS has_new_matches BOOLEAN DEFAULT FALSE
+    """)
+
+
+def _query_views(cur):
+    """posts.last_match_added_at and the query_views table (was migrate_query_views.sql)"""
+    cur.execute("ALTER TABLE posts ADD COLUMN IF NOT EXISTS last_match_added_at TIMESTAMP")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS query_views (
+            id SERIAL PRIMARY KEY,
+            query_id INTEGER NOT NULL REFERENCES posts(id) ON DELETE CASCADE,
+            user_email VARCHAR(255) NOT NULL,
+            last_viewed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(query_id, user_email)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_query_views_query_user ON query_views(query_id, user_email)")
+
+
+def _last_activity(cur):
+    """users.last_activity, initialized from each user's latest post (was migrate_last_activity.py)"""
+    cur.execute("""
+        ALTER TABLE users
+        ADD COLUMN IF NOT EXISTS last_activity TIMESTAMP
+    """)
+    cur.execute("""
+        UPDATE users u
+        SET last_activity = (
+            SELECT MAX(p.created_at)
+            FROM posts p
+            WHERE p.user_id = u.id
+        )
+        WHERE EXISTS (
+            SELECT 1 FROM posts p WHERE p.user_id = u.id
+        ) AND last_activity IS NULL
+    """)
+
+
+def _profile_parent_constraint(cur):
+    """Let profile posts use parent_id = -1 (was fix_profile_constraint.py)"""
+    # A foreign key would reject -1 on every later insert, even one added NOT VALID,
+    # so parent_id keeps only the CHECK and children are deleted by a trigger
+    cur.execute("ALTER TABLE posts DROP CONSTRAINT IF EXISTS posts_parent_id_fkey")
+    cur.execute("ALTER TABLE posts DROP CONSTRAINT IF EXISTS posts_parent_id_check")
+    cur.execute("""
+        ALTER TABLE posts
+        ADD CONSTRAINT posts_parent_id_check
+        CHECK (parent_id IS NULL OR parent_id = -1 OR parent_id > 0)
+    """)
+    _delete_children_trigger(cur)
+
+
+def _delete_children_trigger(cur):
+    """Deleting a post deletes its children, and theirs (what ON DELETE CASCADE did)"""
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION posts_delete_children() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM posts WHERE parent_id = OLD.id;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    cur.execute("DROP TRIGGER IF EXISTS posts_delete_children ON posts")
+    cur.execute("""
+        CREATE TRIGGER posts_delete_children
+        AFTER DELETE ON posts
+        FOR EACH ROW EXECUTE FUNCTION posts_delete_children()
+    """)
+
+
+def _post_parents(cur):
+    """Posts without a parent become children of their author's profile post (was migrate_post_parents.py)"""
+    cur.execute("""
+        UPDATE posts p
+        SET parent_id = profile.id
+        FROM (
+            SELECT DISTINCT ON (user_id) user_id, id
+            FROM posts
+            WHERE parent_id = -1
+            ORDER BY user_id, id
+        ) profile
+        WHERE p.parent_id IS NULL AND p.user_id = profile.user_id
+    """)
+
+
+def _clip_offsets(cur):
+    """posts.clip_offset_x / clip_offset_y"""
+    cur.execute("""
+        ALTER TABLE posts
+        ADD COLUMN IF NOT EXISTS clip_offset_x REAL DEFAULT 0
+    """)
+    cur.execute("""
+        ALTER TABLE posts
+        ADD COLUMN IF NOT EXISTS clip_offset_y REAL DEFAULT 0
+    """)
+
+
+def _ancestor_chains(cur):
+    """users.ancestor_chain, populated for existing users"""
+    cur.execute("""
+        ALTER TABLE users
+        ADD COLUMN IF NOT EXISTS ancestor_chain INTEGER[]
+    """)
+
+    # Oldest first, so inviters are processed before the users they invited
+    cur.execute("""
+        SELECT id, invited_by, ancestor_chain
+        FROM users
+        ORDER BY created_at ASC NULLS FIRST, id ASC
+    """)
+    chains = {}
+    for user_id, invited_by, chain in cur.fetchall():
+        if chain is not None:
+            chains[user_id] = list(chain)
+            continue
+        if invited_by is None:
+            chain = [user_id]
+        elif chains.get(invited_by):
+            chain = [user_id] + chains[invited_by]
+        else:
+            # Inviter doesn't have a chain yet, just use self + inviter
+            chain = [user_id, invited_by]
+        chains[user_id] = chain
+        cur.execute("UPDATE users SET ancestor_chain = %s WHERE id = %s", (chain, user_id))
+
+
+def _rebuild_ancestor_chains(cur):
+    """
+    Recompute every user's ancestor_chain ([self, inviter, inviter's inviter, ...]) in one
+    statement: walk down from the roots (no inviter, or an inviter that no longer exists).
+    Users on an invite cycle are unreachable from a root and keep their current chain.
+    """
+    cur.execute("""
+        WITH RECURSIVE chains AS (
+            SELECT u.id, ARRAY[u.id] as chain
+            FROM users u
+            WHERE u.invited_by IS NULL
+               OR NOT EXISTS (SELECT 1 FROM users i WHERE i.id = u.invited_by)
+          UNION ALL
+            SELECT u.id, u.id || c.chain
+            FROM chains c
+            JOIN users u ON u.invited_by = c.id
+            WHERE u.id <> ALL(c.chain)
+        )
+        UPDATE users u
+        SET ancestor_chain = c.chain
+        FROM chains c
+        WHERE u.id = c.id AND u.ancestor_chain IS DISTINCT FROM c.chain
+    """)
+
+
+def _post_updated_at(cur):
+    """posts.updated_at (version stamp for ETags), initialized to created_at"""
+    cur.execute("""
+        ALTER TABLE posts
+        ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP
+    """)
+    cur.execute("""
+        UPDATE posts SET updated_at = created_at
+        WHERE updated_at IS NULL
+    """)
+    cur.execute("""
+        ALTER TABLE posts
+        ALTER COLUMN updated_at SET DEFAULT CURRENT_TIMESTAMP
+    """)
+
+
+def _feed_indexes(cur):
+    """Composite (created_at, id) indexes behind keyset-paginated feeds (see feed_cursor.py)"""
+    # /api/posts/recent
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_posts_created_at_id
+        ON posts(created_at DESC, id DESC)
+    """)
+    # /api/posts/<id>/children
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_posts_parent_created_at_id
+        ON posts(parent_id, created_at DESC, id DESC)
+    """)
+    # /api/posts/recent-tagged (by tag, and by tag for one author)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_posts_template_created_at_id
+        ON posts(template_name, created_at DESC, id DESC)
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_posts_user_created_at_id
+        ON posts(user_id, created_at DESC, id DESC)
+    """)
+
+
+def _child_count(cur):
+    """posts.child_count (maintained by the post write paths), backfilled from the real counts"""
+    cur.execute("""
+        ALTER TABLE posts
+        ADD COLUMN IF NOT EXISTS child_count INTEGER NOT NULL DEFAULT 0
+    """)
+    cur.execute("""
+        UPDATE posts p
+        SET child_count = c.actual
+        FROM (
+            SELECT parent_id, COUNT(*) as actual
+            FROM posts
+            WHERE parent_id > 0
+            GROUP BY parent_id
+        ) c
+        WHERE c.parent_id = p.id AND p.child_count <> c.actual
+    """)
+
+
+def _ancestor_chains_rebuild(cur):
+    """Index invitees by inviter, then repair chains the old per-user backfill left short"""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_invited_by ON users(invited_by)")
+    _rebuild_ancestor_chains(cur)
+
+
+# Indexes for the server's access paths beyond primary keys and unique constraints
+# (users.email is covered by its UNIQUE constraint). index_advisor.py replays the
+# query catalogue with and without these. Changing the set takes a new migration.
+MANAGED_INDEXES: List[Tuple[str, str, str]] = [
+    # (name, definition, what it serves)
+    ('idx_users_device_ids', 'ON users USING gin (device_ids)',
+     "get_user_by_device_id (device_ids @> ARRAY[...])"),
+    ('idx_users_profile_completed_at', 'ON users(profile_completed_at) WHERE profile_complete = TRUE',
+     "count_new_users poll, watermark seeding"),
+    ('idx_users_invited_by', 'ON users(invited_by)',
+     "ancestor chain recompute (walks invitees)"),
+    ('idx_posts_parent_created_at_id', 'ON posts(parent_id, created_at DESC, id DESC)',
+     "child listings and child_count reconciles (parent_id lookups)"),
+    ('idx_posts_template_created_at_id', 'ON posts(template_name, created_at DESC, id DESC)',
+     "tagged feeds, get_posts_by_template"),
+    ('idx_posts_post_created_at', "ON posts(created_at DESC) WHERE template_name = 'post'",
+     "count_new_posts poll, watermark seeding"),
+    ('idx_posts_query_id', "ON posts(id) WHERE template_name = 'query'",
+     "query matching (get_queries_matching_embedding, match scheduler)"),
+    ('idx_posts_profile_user', "ON posts(user_id) WHERE template_name = 'profile'",
+     "get_user_profile"),
+]
+
+
+def _managed_indexes(cur):
+    """Create MANAGED_INDEXES (several already exist on most databases; IF NOT EXISTS skips those)"""
+    for name, definition, _ in MANAGED_INDEXES:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} {definition}")
+
+
+def _drop_parent_fkey(cur):
+    """Drop the NOT VALID parent_id foreign key an earlier migration 5 re-added (it rejected parent_id = -1)"""
+    _profile_parent_constraint(cur)
+
+
+# (version, name, apply) in the order they are applied
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, 'search_cache', _search_cache),
+    (2, 'query_results', _query_results),
+    (3, 'query_views', _query_views),
+    (4, 'last_activity', _last_activity),
+    (5, 'profile_parent_constraint', _profile_parent_constraint),
+    (6, 'post_parents', _post_parents),
+    (7, 'clip_offsets', _clip_offsets),
+    (8, 'ancestor_chains', _ancestor_chains),
+    (9, 'post_updated_at', _post_updated_at),
+    (10, 'feed_indexes', _feed_indexes),
+    (11, 'child_count', _child_count),
+    (12, 'ancestor_chains_rebuild', _ancestor_chains_rebuild),
+    (13, 'managed_indexes', _managed_indexes),
+    (14, 'drop_parent_fkey', _drop_parent_fkey),
+]
+
+
+# Runner
+
+def applied_versions(conn) -> Set[int]:
+    """Versions recorded in schema_migrations (empty if the table doesn't exist yet)"""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT version FROM schema_migrations")
+            versions = {row[0] for row in cur.fetchall()}
+        conn.commit()
+        return versions
+    except errors.UndefinedTable:
+        conn.rollback()
+        return set()
+
+
+def pending(conn) -> List[Tuple[int, str, Callable]]:
+    applied = applied_versions(conn)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def apply_pending(conn) -> List[int]:
+    """
+    Apply every pending migration in order.
+
+    Returns:
+        Versions applied by this call. Raises (after rolling back) if one fails.
+    """
+    todo = pending(conn)
+    if not todo:
+        return []
+
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    conn.commit()
+
+    applied = []
+    for version, name, apply in todo:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_KEY,))
+                # Another process may have applied it while we waited for the lock
+                cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+                if cur.fetchone() is None:
+                    apply(cur)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (version, name)
+                    )
+                    applied.append(version)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise RuntimeError(f"Migration {version} ({name}) failed: {e}") from e
+        if version in applied:
+            print(f"Migration {version}: {name} applied")
+    return applied
+
+
+def main():
+    from db import db
+
+    conn = db.get_connection()
+    try:
+        if '--status' in sys.argv:
+            applied = applied_versions(conn)
+            for version, name, _ in MIGRATIONS:
+                state = "applied" if version in applied else "pending"
+                print(f"{version:3d}  {name:30s} {state}")
+            return 0
+
+        applied = apply_pending(conn)
+        if applied:
+            print(f"\nApplied {len(applied)} migrations.")
+        else:
+            print("Schema is up to date.")
+        return 0
+    except (RuntimeError, psycopg2.Error) as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        db.return_connection(conn)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
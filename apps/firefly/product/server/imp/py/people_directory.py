@@ -0,0 +1,180 @@
+"""
+Maintained people directory behind /api/users/recent.
+
+Holds one row per root-level post (profile rows as returned by get_recent_users:
+post fields, author, last_activity, child_count). The Database write paths refresh
+individual rows, so a request never rescans users/posts.
+
+Per-viewer ordering is proximity (invite-tree distance) ascending, then
+last_activity descending. Rows are produced by walking the shared InviteTree
+outward from the viewer, one distance level at a time, so a page only touches the
+users up to the level that fills it. Users not connected to the viewer get
+proximity 9999 and come last, by activity.
+"""
+
+import threading
+from typing import Callable, Optional, Dict, Any, List, Iterable
+
+from invite_tree import InviteTree, UNRELATED
+
+
+def _activity_key(row: Dict[str, Any]):
+    """last_activity descending, None last, post id as a stable tiebreak"""
+    last_activity = row.get('last_activity')
+    return (last_activity is None, -(last_activity.timestamp() if last_activity else 0), row['id'])
+
+
+class PeopleDirectory:
+    """In-memory directory rows, refreshed incrementally"""
+
+    def __init__(self, invite_tree: InviteTree):
+        """
+        Args:
+            invite_tree: Shared invite tree used for proximity (owned and loaded by Database)
+        """
+        self.invite_tree = invite_tree
+        self.loaded = False
+        self._entries = {}        # post_id -> row dict
+        self._by_user = {}        # user_id -> set of post_ids
+        self._activity_order = None  # Cached list of post_ids sorted by activity (None = stale)
+        self._lock = threading.RLock()
+
+        # Metrics
+        self.pages_served = 0
+        self.rows_refreshed = 0
+
+    # Loading and incremental updates
+
+    def load(self, loader: Callable[[], Iterable[Dict[str, Any]]]):
+        """
+        Replace everything with a full load.
+        loader() returns all directory rows; it runs under the directory lock so
+        refreshes can't interleave with the snapshot.
+        """
+        with self._lock:
+            rows = loader()
+            self._entries.clear()
+            self._by_user.clear()
+            for row in rows:
+                self._put(row)
+            self._activity_order = None
+            self.loaded = True
+
+    def invalidate(self):
+        """Force a full reload on next use"""
+        with self._lock:
+            self.loaded = False
+
+    def refresh(self, post_ids: Iterable[int], loader: Callable[[List[int]], Iterable[Dict[str, Any]]]):
+        """
+        Re-read rows for post_ids (created, edited, reparented, deleted, or gained/lost a child).
+        loader(post_ids) returns the current directory rows among them; ids it doesn't
+        return are no longer root-level posts and are dropped. No-op until loaded.
+        """
+        post_ids = sorted({post_id for post_id in post_ids if post_id is not None and post_id > 0})
+        if not post_ids:
+            return
+        with self._lock:
+            if not self.loaded:
+                return
+            rows = {row['id']: row for row in loader(post_ids)}
+            for post_id in post_ids:
+                self._remove(post_id)
+                if post_id in rows:
+                    self._put(rows[post_id])
+                    self.rows_refreshed += 1
+            self._activity_order = None
+
+    def has_row(self, post_id: int) -> bool:
+        with self._lock:
+            return post_id in self._entries
+
+    def touch_user(self, user_id: int, last_activity):
+        """User activity changed (e.g. they created a post)"""
+        with self._lock:
+            for post_id in self._by_user.get(user_id, ()):
+                self._entries[post_id]['last_activity'] = last_activity
+            self._activity_order = None
+
+    # Reads
+
+    def page(self, viewer_id: Optional[int] = None, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Rows ordered for a viewer, each copied with a 'proximity' field.
+
+        Args:
+            viewer_id: Current user (None: everyone is UNRELATED, so pure activity order)
+            limit: Page size (None for all rows)
+            offset: Rows to skip
+        """
+        with self._lock:
+            self.pages_served += 1
+            wanted = None if limit is None else offset + limit
+            ordered = []  # (proximity, row)
+            placed_users = set()
+
+            if viewer_id is not None:
+                # Walk outward from the viewer one distance level at a time
+                for distance, level in self.invite_tree.levels(viewer_id):
+                    if wanted is not None and len(ordered) >= wanted:
+                        break
+                    placed_users.update(level)
+                    rows = [self._entries[post_id] for user_id in level for post_id in self._by_user.get(user_id, ())]
+                    rows.sort(key=_activity_key)
+                    ordered.extend((distance, row) for row in rows)
+
+            # Anything not reached is unrelated (only needed if the page isn't full yet)
+            if wanted is None or len(ordered) < wanted:
+                for post_id in self._sorted_by_activity():
+                    row = self._entries[post_id]
+                    if row['user_id'] in placed_users:
+                        continue
+                    ordered.append((UNRELATED, row))
+                    if wanted is not None and len(ordered) >= wanted:
+                        break
+
+            return self._slice(ordered, offset, limit)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot for /api/health"""
+        with self._lock:
+            return {
+                'loaded': self.loaded,
+                'rows': len(self._entries),
+                'users': len(self._by_user),
+                'pages_served': self.pages_served,
+                'rows_refreshed': self.rows_refreshed
+            }
+
+    # Internal helpers (caller holds self._lock)
+
+    def _put(self, row: Dict[str, Any]):
+        row = dict(row)
+        self._entries[row['id']] = row
+        self._by_user.setdefault(row['user_id'], set()).add(row['id'])
+
+    def _remove(self, post_id: int) -> bool:
+        row = self._entries.pop(post_id, None)
+        if row is None:
+            return False
+        posts = self._by_user.get(row['user_id'])
+        if posts is not None:
+            posts.discard(post_id)
+            if not posts:
+                del self._by_user[row['user_id']]
+        return True
+
+    def _sorted_by_activity(self) -> List[int]:
+        if self._activity_order is None:
+            self._activity_order = [row['id'] for row in sorted(self._entries.values(), key=_activity_key)]
+        return self._activity_order
+
+    @staticmethod
+    def _slice(ordered, offset: int, limit: Optional[int]) -> List[Dict[str, Any]]:
+        end = None if limit is None else offset + limit
+        page = []
+        for proximity, row in ordered[offset:end]:
+            item = dict(row)
+            item['proximity'] = proximity
+            page.append(item)
+        return page
@@ -0,0 +1,142 @@
+"""
+Named server-side prepared statements for the hot queries.
+
+Each statement is registered once with $1..$n placeholders. The first time it runs on
+a pooled connection it is PREPAREd there; every later call on that connection is
+just EXECUTE name(...), so Postgres skips parsing and (once it settles on a generic
+plan) planning. Connections are tracked weakly, so a connection the pool closes
+takes its prepared set with it.
+
+Per-statement counters (executions, prepares, total/avg time) are reported in
+/api/health. With DB_PREPARED_STATEMENTS=0 the same statements are sent as plain
+SQL text, so the counters give a before/after comparison, and planning_times()
+reports Postgres's own planning time for both forms.
+"""
+
+import re
+import threading
+import time
+import weakref
+from typing import Dict, Any, Sequence, Tuple
+
+from psycopg2 import errors
+
+_PLACEHOLDER = re.compile(r'\$(\d+)')
+
+
+class _Statement:
+    """One registered statement plus its counters"""
+
+    def __init__(self, name: str, sql: str):
+        self.name = name
+        self.sql = sql
+        self.num_params = max((int(n) for n in _PLACEHOLDER.findall(sql)), default=0)
+        args = ', '.join(['%s'] * self.num_params)
+        self.execute_sql = f"EXECUTE {name} ({args})" if self.num_params else f"EXECUTE {name}"
+        # The same statement as plain text, for psycopg2's client-side interpolation
+        self.text_sql = _PLACEHOLDER.sub(lambda m: f"%(p{m.group(1)})s", sql.replace('%', '%%'))
+
+        # Metrics
+        self.executions = 0
+        self.prepares = 0
+        self.total_time = 0.0
+
+    def text_params(self, params: Sequence[Any]) -> Dict[str, Any]:
+        return {f"p{index}": value for index, value in enumerate(params, 1)}
+
+
+class StatementRegistry:
+    """Statements prepared lazily, once per connection, and executed by name"""
+
+    def __init__(self, enabled: bool = True):
+        """
+        Args:
+            enabled: False sends every statement as plain SQL (for comparison, or to rule it out)
+        """
+        self.enabled = enabled
+        self._statements = {}                         # name -> _Statement
+        self._prepared = weakref.WeakKeyDictionary()  # raw connection -> names prepared on it
+        self._lock = threading.Lock()
+
+    def register(self, name: str, sql: str):
+        """Register a statement written with $1..$n placeholders"""
+        if not re.fullmatch(r'[a-z_][a-z0-9_]*', name):
+            raise ValueError(f"Invalid statement name: {name!r}")
+        self._statements[name] = _Statement(name, sql)
+
+    def execute(self, cur, name: str, params: Sequence[Any] = ()):
+        """Run a registered statement on cur (fetch results from cur as usual)"""
+        statement = self._statements[name]
+        if len(params) != statement.num_params:
+            raise ValueError(f"{name} takes {statement.num_params} parameters, got {len(params)}")
+
+        started = time.perf_counter()
+        if not self.enabled:
+            cur.execute(statement.text_sql, statement.text_params(params))
+        else:
+            prepared = self._ensure_prepared(cur, statement)
+            try:
+                cur.execute(statement.execute_sql, params)
+            except errors.InvalidSqlStatementName:
+                # The session lost it (e.g. DISCARD ALL): prepare again on the next call
+                with self._lock:
+                    prepared.discard(name)
+                raise
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            statement.executions += 1
+            statement.total_time += elapsed
+
+    def text(self, name: str, params: Sequence[Any]) -> Tuple[str, Dict[str, Any]]:
+        """A registered statement as plain SQL plus psycopg2 parameters (for EXPLAIN, or to run it unprepared)"""
+        statement = self._statements[name]
+        return statement.text_sql, statement.text_params(params)
+
+    def planning_times(self, cur, name: str, params: Sequence[Any]) -> Tuple[float, float]:
+        """
+        Postgres planning time in ms for (plain SQL text, EXECUTE of the prepared statement),
+        from EXPLAIN without ANALYZE, so the statement itself never runs
+        """
+        statement = self._statements[name]
+        text_sql, text_params = self.text(name, params)
+        cur.execute("EXPLAIN (SUMMARY ON, FORMAT JSON) " + text_sql, text_params)
+        text_ms = cur.fetchone()[0][0]['Planning Time']
+
+        self._ensure_prepared(cur, statement)
+        cur.execute("EXPLAIN (SUMMARY ON, FORMAT JSON) " + statement.execute_sql, params)
+        prepared_ms = cur.fetchone()[0][0]['Planning Time']
+        return text_ms, prepared_ms
+
+    def stats(self) -> Dict[str, Any]:
+        """Metrics snapshot for /api/health"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'connections': len(self._prepared),
+                'statements': {
+                    name: {
+                        'executions': statement.executions,
+                        'prepares': statement.prepares,
+                        'total_ms': round(1000 * statement.total_time, 2),
+                        'avg_ms': round(1000 * statement.total_time / statement.executions, 3)
+                        if statement.executions else 0.0
+                    }
+                    for name, statement in self._statements.items()
+                }
+            }
+
+    # Internal helpers
+
+    def _ensure_prepared(self, cur, statement: _Statement) -> set:
+        """PREPARE the statement on cur's connection unless it already is; returns that connection's set"""
+        # A pooled connection is only used by one thread at a time, so only the dict needs the lock
+        with self._lock:
+            prepared = self._prepared.setdefault(cur.connection, set())
+            if statement.name in prepared:
+                return prepared
+        cur.execute(f"PREPARE {statement.name} AS {statement.sql}")
+        with self._lock:
+            prepared.add(statement.name)
+            statement.prepares += 1
+        return prepared
@@ -0,0 +1,153 @@
+"""
+Read-through cache for post and user rows.
+
+get_post_by_id, get_user_by_email, get_user_by_device_id and get_user_by_id
+run several times per request (and once per search candidate). Their rows are
+kept here in a bounded LRU with a short TTL. The Database methods that write
+those rows invalidate them, both immediately and again once the write commits.
+
+Every invalidation bumps a generation counter. A reader notes the generation
+before going to the database and only stores its row if nothing was invalidated
+in the meantime, so a slow read can't put back a row that a write just replaced.
+The TTL bounds staleness for writes made by other processes (scripts, other
+workers), which this process never hears about.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Hashable, Tuple
+
+# Keys: ('post', post_id), ('user_id', id), ('user_email', email), ('user_device', device_id)
+POST = 'post'
+USER_ID = 'user_id'
+USER_EMAIL = 'user_email'
+USER_DEVICE = 'user_device'
+
+
+class RowCache:
+    """Thread-safe LRU/TTL cache of row dicts, invalidated by post id and user id"""
+
+    def __init__(self, max_entries: int = 5000, ttl: float = 10.0):
+        """
+        Args:
+            max_entries: Rows kept before the least recently used are evicted (0 disables the cache)
+            ttl: Seconds a row is served before it is re-read
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation = 0
+        self._rows = OrderedDict()   # key -> (expires_at, row), least recently used first
+        self._owner = {}             # key -> user_id the row belongs to (user rows and post authors)
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.stale_stores = 0        # Reads discarded because an invalidation raced them
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, kind: str, key: Hashable) -> Tuple[Optional[Dict[str, Any]], int]:
+        """
+        Look up a row.
+
+        Returns:
+            (row copy or None on a miss, generation to pass to put() after loading)
+        """
+        cache_key = (kind, key)
+        with self._lock:
+            entry = self._rows.get(cache_key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._rows.move_to_end(cache_key)
+                self.hits += 1
+                return _copy_row(entry[1]), self.generation
+            if entry is not None:
+                self._drop(cache_key)
+            self.misses += 1
+            return None, self.generation
+
+    def put(self, kind: str, key: Hashable, row: Optional[Dict[str, Any]], generation: int):
+        """Store a row read from the database, unless an invalidation happened since get()"""
+        if row is None or self.max_entries <= 0:
+            return
+        cache_key = (kind, key)
+        owner = row.get('id') if kind != POST else row.get('user_id')
+        with self._lock:
+            if generation != self.generation:
+                self.stale_stores += 1
+                return
+            self._rows[cache_key] = (time.monotonic() + self.ttl, _copy_row(row))
+            self._rows.move_to_end(cache_key)
+            if owner is not None:
+                self._owner[cache_key] = owner
+            self.stores += 1
+            while len(self._rows) > self.max_entries:
+                self._drop(next(iter(self._rows)))
+                self.evictions += 1
+
+    def invalidate_posts(self, *post_ids: Optional[int]):
+        """Forget post rows (None ids are ignored)"""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            for post_id in post_ids:
+                if post_id is not None:
+                    self._drop((POST, post_id))
+
+    def invalidate_all_posts(self):
+        """Forget every post row (e.g. a delete cascaded to rows we can't list cheaply)"""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            for cache_key in [cache_key for cache_key in self._rows if cache_key[0] == POST]:
+                self._drop(cache_key)
+
+    def invalidate_user(self, user_id: Optional[int]):
+        """Forget every lookup of a user, and their posts (which carry author name/email)"""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            if user_id is None:
+                return
+            for cache_key in [cache_key for cache_key, owner in self._owner.items() if owner == user_id]:
+                self._drop(cache_key)
+            self._drop((USER_ID, user_id))
+
+    def clear(self):
+        """Forget everything"""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self._rows.clear()
+            self._owner.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Metrics snapshot for /api/health"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'rows': len(self._rows),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'generation': self.generation,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'stores': self.stores,
+                'stale_stores': self.stale_stores,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+    # Internal helpers (caller holds self._lock)
+
+    def _drop(self, cache_key):
+        self._rows.pop(cache_key, None)
+        self._owner.pop(cache_key, None)
+
+
+def _copy_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Callers may modify the rows they get back; keep the cached one intact"""
+    return {column: list(value) if isinstance(value, list) else value for column, value in row.items()}
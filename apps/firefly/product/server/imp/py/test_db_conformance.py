@@ -0,0 +1,479 @@
+"""
+Conformance tests: db.py (PostgreSQL) and db_sqlite.py must behave the same.
+
+Every test runs against each backend. SQLite always runs (a fresh file per test);
+Postgres runs when FIREFLY_TEST_DB_NAME names a scratch database (with pgvector)
+that has ../database/schema.sql loaded. The fixture applies pending migrations and
+truncates the tables before every test:
+
+    createdb firefly_test && psql -d firefly_test -f ../database/schema.sql
+    FIREFLY_TEST_DB_NAME=firefly_test python -m pytest test_db_conformance.py
+"""
+
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# Importing db_sqlite creates its global instance; keep that file out of the source tree
+os.environ.setdefault('SQLITE_PATH', os.path.join(tempfile.mkdtemp(), 'firefly.db'))
+
+import db_sqlite
+from invite_tree import UNRELATED
+
+_TABLES = "query_views, query_results, search_cache, posts, users"
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def db(request, tmp_path, monkeypatch):
+    # Write-behind flushes only when a test asks for one
+    monkeypatch.setenv('WRITE_BEHIND_FLUSH_MS', '60000')
+    if request.param == 'sqlite':
+        database = db_sqlite.Database(str(tmp_path / 'firefly.db'))
+        yield database
+        database.close_write_behind()
+        database.close_all_connections()
+        return
+
+    if not os.getenv('FIREFLY_TEST_DB_NAME'):
+        pytest.skip("FIREFLY_TEST_DB_NAME not set")
+    pytest.importorskip('psycopg2')
+    import db as db_postgres
+    database = db_postgres.Database({
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': os.getenv('DB_PORT', '5432'),
+        'database': os.environ['FIREFLY_TEST_DB_NAME'],
+        'user': os.getenv('DB_USER', 'firefly_user'),
+        'password': os.getenv('DB_PASSWORD', 'firefly_pass')
+    })
+    database.initialize_pool(retry_with_restart=False)
+    database.run_migrations()
+    conn = database.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"TRUNCATE {_TABLES} RESTART IDENTITY CASCADE")
+        conn.commit()
+    finally:
+        database.return_connection(conn)
+    yield database
+    database.close_write_behind()
+    database.close_all_connections()
+
+
+def _post(db, user_id, title='title', **kwargs):
+    return db.create_post(user_id, title, 'summary', 'body', 'UTC', **kwargs)
+
+
+# Users and devices
+
+def test_create_and_get_user(db):
+    user_id = db.create_user('a@example.com')
+    assert user_id is not None
+    assert db.create_user('a@example.com') is None
+
+    user = db.get_user_by_email('a@example.com')
+    assert user['id'] == user_id
+    assert user['device_ids'] == []
+    assert user['created_at'].tzinfo is not None
+    assert db.get_user_by_id(user_id)['email'] == 'a@example.com'
+    assert db.get_user_by_email('missing@example.com') is None
+
+
+def test_devices_are_added_once(db):
+    user_id = db.create_user('a@example.com')
+    assert db.add_device_to_user(user_id, 'device-1')
+    assert db.add_device_to_user(user_id, 'device-1')
+    assert db.add_device_to_user(user_id, 'device-2')
+
+    user = db.get_user_by_device_id('device-2')
+    assert user['id'] == user_id
+    assert user['device_ids'] == ['device-1', 'device-2']
+    assert user['profile_complete'] in (False, None)
+    assert db.get_user_by_device_id('device-3') is None
+
+
+def test_apns_tokens(db):
+    user_id = db.create_user('a@example.com')
+    db.create_user('b@example.com')
+    assert db.update_user_apns_token(user_id, 'token')
+    assert [u['id'] for u in db.get_all_users_with_push_tokens()] == [user_id]
+    assert db.get_user_by_id(user_id)['apns_device_token'] == 'token'
+
+
+# Invites and ancestor chains
+
+def _chain(db, user_id):
+    conn = db.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT ancestor_chain FROM users WHERE id = %s", (user_id,))
+            return list(cur.fetchone()[0] or [])
+    finally:
+        db.return_connection(conn)
+
+
+def test_invites_build_ancestor_chains(db):
+    root = db.create_user('root@example.com')
+    child = db.create_user_from_invite('child@example.com', 'Child', root)
+    grandchild = db.create_user_from_invite('grandchild@example.com', 'Grandchild', child)
+
+    assert _chain(db, child) == [child, root]
+    assert _chain(db, grandchild) == [grandchild, child, root]
+    assert db.get_proximity(root, grandchild) == 2
+    assert db.get_proximity(root, root) == 0
+
+
+def test_set_invited_by_moves_subtree(db):
+    root = db.create_user('root@example.com')
+    a = db.create_user_from_invite('a@example.com', 'A', root)
+    b = db.create_user_from_invite('b@example.com', 'B', root)
+    a1 = db.create_user_from_invite('a1@example.com', 'A1', a)
+
+    assert db.set_invited_by(a, b)
+    assert _chain(db, a) == [a, b, root]
+    assert _chain(db, a1) == [a1, a, b, root]
+    assert db.get_proximity(b, a1) == 2
+
+    # Moving a user under their own invitee would create a cycle
+    assert not db.set_invited_by(a, a1)
+    assert not db.set_invited_by(a, 999999)
+
+
+def test_set_invited_by_checks_cycles_without_chains(db):
+    root = db.create_user('root@example.com')
+    a = db.create_user_from_invite('a@example.com', 'A', root)
+    a1 = db.create_user_from_invite('a1@example.com', 'A1', a)
+    a2 = db.create_user_from_invite('a2@example.com', 'A2', a1)
+
+    # The check walks invited_by, so a missing (or stale) stored chain doesn't hide the cycle
+    conn = db.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE users SET ancestor_chain = NULL")
+        conn.commit()
+    finally:
+        db.return_connection(conn)
+
+    assert not db.set_invited_by(a, a2)
+    assert not db.set_invited_by(a, a)
+    assert db.set_invited_by(a2, root)
+    assert _chain(db, a2) == [a2, root]
+
+
+# Posts and child counts
+
+def test_create_post_and_children(db):
+    user_id = db.create_user('a@example.com')
+    parent = _post(db, user_id, 'parent')
+    child = _post(db, user_id, 'child', parent_id=parent)
+
+    post = db.get_post_by_id(parent)
+    assert post['title'] == 'parent'
+    assert post['child_count'] == 1
+    assert post['author_email'] == 'a@example.com'
+    assert post['created_at'].tzinfo is not None
+    assert [p['id'] for p in db.get_child_posts(parent)] == [child]
+    assert [p['id'] for p in db.get_posts_by_ids([child, 999999, parent])] == [child, parent]
+    assert {p['id'] for p in db.get_posts_by_user(user_id)} == {parent, child}
+
+
+def test_update_post_clamps_clip_offsets(db):
+    user_id = db.create_user('a@example.com')
+    post_id = _post(db, user_id)
+    assert db.update_post(post_id, title='new', clip_offset_x=5, clip_offset_y=-5)
+    assert not db.update_post(post_id)
+
+    post = db.get_post_by_id(post_id)
+    assert post['title'] == 'new'
+    assert (post['clip_offset_x'], post['clip_offset_y']) == (1.0, -1.0)
+
+
+def test_set_post_parent_and_child_count_check(db):
+    user_id = db.create_user('a@example.com')
+    first = _post(db, user_id)
+    second = _post(db, user_id)
+    child = _post(db, user_id, parent_id=first)
+
+    assert db.set_post_parent(child, second)
+    assert db.get_post_by_id(first)['child_count'] == 0
+    assert db.get_post_by_id(second)['child_count'] == 1
+    assert not db.set_post_parent(child, 999999)
+    assert db.check_child_counts() == []
+
+    conn = db.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE posts SET child_count = 7 WHERE id = %s", (first,))
+        conn.commit()
+    finally:
+        db.return_connection(conn)
+
+    assert db.check_child_counts(fix=True) == [{'id': first, 'stored': 7, 'actual': 0}]
+    assert db.check_child_counts() == []
+
+
+def test_delete_post_removes_children(db):
+    user_id = db.create_user('a@example.com')
+    parent = _post(db, user_id)
+    child = _post(db, user_id, parent_id=parent)
+    grandchild = _post(db, user_id, parent_id=child)
+
+    assert db.delete_post(child)
+    assert db.get_post_by_id(grandchild) is None
+    assert db.get_post_by_id(parent)['child_count'] == 0
+    assert not db.delete_post(child)
+
+
+# Feeds
+
+def test_recent_posts_keyset_pages(db):
+    user_id = db.create_user('a@example.com')
+    post_ids = [_post(db, user_id, f"post {n}") for n in range(5)]
+
+    first_page = db.get_recent_posts(limit=3)
+    assert [p['id'] for p in first_page] == post_ids[::-1][:3]
+    last = first_page[-1]
+    second_page = db.get_recent_posts(limit=3, before=(last['created_at'], last['id']))
+    assert [p['id'] for p in second_page] == post_ids[::-1][3:]
+
+
+def test_tagged_posts_filter_by_template_and_time(db):
+    user_id = db.create_user('a@example.com')
+    post_id = _post(db, user_id)
+    query_id = _post(db, user_id, template_name='query')
+
+    assert [p['id'] for p in db.get_recent_tagged_posts(['post'])] == [post_id]
+    queries = db.get_recent_tagged_posts(['query'], current_user_id=user_id)
+    assert [p['id'] for p in queries] == [query_id]
+    assert queries[0]['proximity'] == 0
+    assert queries[0]['plural_name'] == 'queries'
+
+    later = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+    assert db.get_recent_tagged_posts(['post'], after=later) == []
+    earlier = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+    assert [p['id'] for p in db.get_recent_tagged_posts(['post'], after=earlier)] == [post_id]
+
+
+def test_profiles_ordered_by_proximity(db):
+    root = db.create_user('root@example.com')
+    near = db.create_user_from_invite('near@example.com', 'Near', root)
+    far = db.create_user_from_invite('far@example.com', 'Far', near)
+    stranger = db.create_user('stranger@example.com')
+    for user_id in (stranger, far, near, root):
+        db.create_profile_post(user_id, 'name', 'mission', 'statement')
+
+    profiles = db.get_recent_tagged_posts(['profile'], current_user_id=root, limit=10)
+    assert [p['user_id'] for p in profiles] == [root, near, far, stranger]
+    assert [p['proximity'] for p in profiles] == [0, 1, 2, UNRELATED]
+    assert db.get_user_profile(near)['author_name'] == 'name'
+
+    users = db.get_recent_users(far)
+    assert [u['user_id'] for u in users] == [far, near, root, stranger]
+
+
+# Query results and badges
+
+def test_query_results_and_badges(db):
+    user_id = db.create_user('a@example.com')
+    query_id = _post(db, user_id, template_name='query')
+    first = _post(db, user_id)
+    second = _post(db, user_id)
+
+    assert db.get_has_new_matches_bulk('a@example.com', [query_id]) == {query_id: False}
+    assert db.insert_query_results_bulk([(query_id, first, 0.5), (query_id, second, 0.8), (query_id, first, 0.6)]) == 2
+    assert [(post_id, round(score, 3)) for post_id, score, _ in db.get_query_results(query_id)] == [(second, 0.8), (first, 0.6)]
+    assert db.get_query_scores_for_post(first) == pytest.approx({query_id: 0.6})
+    assert db.get_has_new_matches_bulk('a@example.com', [query_id]) == {query_id: True}
+
+    db.record_query_view('a@example.com', query_id)
+    assert db.get_has_new_matches_bulk('a@example.com', [query_id]) == {query_id: False}
+    db.badge_cache.clear()
+    assert db.get_has_new_matches_bulk('a@example.com', [query_id]) == {query_id: False}
+
+    db.delete_query_results_for_post(first, [query_id])
+    assert [row[0] for row in db.get_query_results(query_id)] == [second]
+    db.clear_query_results(query_id)
+    assert db.get_query_results(query_id) == []
+
+
+def test_search_by_embedding(db):
+    user_id = db.create_user('a@example.com')
+    near = _post(db, user_id, embedding=_embedding(1.0))
+    _post(db, user_id, embedding=_embedding(-1.0))
+    query_id = _post(db, user_id, template_name='query', embedding=_embedding(0.9))
+
+    results = db.search_posts_by_embedding(_embedding(1.0), limit=5, threshold=0.5)
+    assert [p['id'] for p in results] == [near, query_id]
+    assert results[0]['similarity'] == pytest.approx(1.0, abs=1e-4)
+    assert [q['id'] for q in db.get_queries_matching_embedding(_embedding(1.0))] == [query_id]
+
+
+def _embedding(first: float):
+    """A unit-ish vector in the embedding column's dimension"""
+    return [first] + [0.001] * 767
+
+
+# Version stamps
+
+def test_version_stamps_change_with_content(db):
+    user_id = db.create_user('a@example.com')
+    parent = _post(db, user_id)
+    query_id = _post(db, user_id, template_name='query')
+
+    post_version = db.get_post_version(parent)
+    children_version = db.get_children_version(parent)
+    assert db.get_post_version(999999) is None
+    assert children_version['last_modified'] is None
+
+    child = _post(db, user_id, parent_id=parent)
+    assert db.get_post_version(parent)['digest'] != post_version['digest']
+    assert db.get_children_version(parent)['digest'] != children_version['digest']
+    assert db.get_children_version(parent)['last_modified'] is not None
+
+    results_version = db.get_query_results_version(query_id)
+    db.insert_query_results_bulk([(query_id, child, 0.7)])
+    updated = db.get_query_results_version(query_id)
+    assert updated['count'] == results_version['count'] + 1
+    assert updated['digest'] != results_version['digest']
+
+
+# New-content watermarks
+
+def test_new_users_and_posts_since(db):
+    author = db.create_user('author@example.com')
+    reader = db.create_user('reader@example.com')
+    before = (datetime.now(timezone.utc) - timedelta(minutes=5)).isoformat()
+
+    assert not db.has_new_users_since(before)
+    assert db.mark_profile_complete(author)
+    assert db.has_new_users_since(before)
+    assert db.count_new_users_since(before) == 1
+
+    _post(db, author)
+    assert db.has_new_posts_since(before, 'reader@example.com')
+    assert not db.has_new_posts_since(before, 'author@example.com')
+    db.watermarks.invalidate()
+    db.seed_content_watermarks()
+    assert db.has_new_posts_since(before, 'reader@example.com')
+    assert reader is not None
+
+
+# Unit of work
+
+def test_unit_of_work_commits_once(db):
+    user_id = db.create_user('a@example.com')
+    with db.unit_of_work():
+        parent = _post(db, user_id)
+        _post(db, user_id, parent_id=parent)
+    assert db.get_post_by_id(parent)['child_count'] == 1
+
+
+def test_snapshot_unit_reads_one_snapshot_alongside_writers(db):
+    user_id = db.create_user('a@example.com')
+    post_id = _post(db, user_id, title='before')
+    updated = []
+
+    with db.unit_of_work(snapshot=True):
+        assert db.get_post_by_id(post_id)['title'] == 'before'
+        # A writer on another connection isn't held up by the open read unit...
+        writer = threading.Thread(target=lambda: updated.append(db.update_post(post_id, 'after', 'summary', 'body')))
+        writer.start()
+        writer.join(timeout=10)
+        assert updated == [True]
+        # ...and the unit keeps reading its own snapshot
+        assert db.get_post_by_id(post_id)['title'] == 'before'
+
+    assert db.get_post_by_id(post_id)['title'] == 'after'
+
+
+def test_unit_of_work_rolls_back(db):
+    user_id = db.create_user('a@example.com')
+    with pytest.raises(RuntimeError):
+        with db.unit_of_work():
+            _post(db, user_id, 'discarded')
+            raise RuntimeError("abort")
+    assert db.get_recent_posts() == []
+
+
+def test_failed_call_inside_unit_of_work_keeps_the_rest(db):
+    user_id = db.create_user('a@example.com')
+    with db.unit_of_work():
+        post_id = _post(db, user_id)
+        assert db.create_user('a@example.com') is None
+    assert db.get_post_by_id(post_id) is not None
+
+
+# Write-behind (query views and last_activity)
+
+def _stored_view(db, query_id, user_email):
+    conn = db.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT last_viewed_at FROM query_views WHERE query_id = %s AND user_email = %s",
+                        (query_id, user_email))
+            row = cur.fetchone()
+            return row[0] if row else None
+    finally:
+        db.return_connection(conn)
+
+
+def test_buffered_query_views_are_seen_then_flushed(db):
+    user_id = db.create_user('a@example.com')
+    query_id = _post(db, user_id, template_name='query')
+    deleted_id = _post(db, user_id, template_name='query')
+    db.insert_query_results_bulk([(query_id, _post(db, user_id), 0.5)])
+
+    db.record_query_view('a@example.com', query_id)
+    db.record_query_view('a@example.com', query_id)
+    db.record_query_view('a@example.com', deleted_id)
+    assert db.query_views.get((query_id, 'a@example.com')) is not None
+    db.badge_cache.clear()
+    assert db.get_has_new_matches_bulk('a@example.com', [query_id]) == {query_id: False}
+
+    db.delete_post(deleted_id)
+    db.query_views.flush()
+    assert db.query_views.get((query_id, 'a@example.com')) is None
+    assert _stored_view(db, query_id, 'a@example.com') is not None
+    assert _stored_view(db, deleted_id, 'a@example.com') is None
+    stats = db.query_views.stats()
+    assert (stats['pending'], stats['coalesced'], stats['rows_written']) == (0, 1, 2)
+
+
+def test_badge_turns_on_for_a_match_added_after_a_view(db):
+    user_id = db.create_user('a@example.com')
+    query_id = _post(db, user_id, template_name='query')
+    post_id = _post(db, user_id)
+
+    # View stamps (app clock) and match stamps (database clock) must be on one scale
+    db.record_query_view('a@example.com', query_id)
+    db.insert_query_results_bulk([(query_id, post_id, 0.5)])
+    assert db.get_has_new_matches_bulk('a@example.com', [query_id]) == {query_id: True}
+
+    db.query_views.flush()
+    db.badge_cache.clear()
+    assert db.get_has_new_matches_bulk('a@example.com', [query_id]) == {query_id: True}
+
+    db.record_query_view('a@example.com', query_id)
+    assert db.get_has_new_matches_bulk('a@example.com', [query_id]) == {query_id: False}
+    db.query_views.flush()
+    db.badge_cache.clear()
+    assert db.get_has_new_matches_bulk('a@example.com', [query_id]) == {query_id: False}
+
+
+def test_buffered_last_activity_is_seen_then_flushed(db):
+    user_id = db.create_user('a@example.com')
+    db.create_profile_post(user_id, 'name', 'mission', 'statement')
+    _post(db, user_id)
+    buffered = db.activity.get(user_id)
+    assert buffered is not None
+
+    profile = db.get_recent_tagged_posts(['profile'], current_user_id=user_id)[0]
+    assert profile['last_activity'] == buffered
+    assert db.get_recent_users(user_id)[0]['last_activity'] == buffered
+
+    db.close_write_behind()
+    assert db.activity.get(user_id) is None
+    profile = db.get_recent_tagged_posts(['profile'], current_user_id=user_id)[0]
+    assert profile['last_activity'] == buffered
@@ -0,0 +1,114 @@
+"""
+Request/job-scoped unit of work for the Database class.
+
+Inside `with db.unit_of_work():` every Database call made on the current thread
+runs on one pooled connection, inside one transaction that commits once, when the
+outermost block exits cleanly (or rolls back if it raises). The block owns the
+transaction. A nested unit_of_work joins the enclosing one.
+
+Existing Database methods keep their get_connection / commit / rollback /
+return_connection shape. Inside a unit of work, get_connection hands them a
+ScopedConnection: a savepoint on the shared connection. Their commit() releases
+the savepoint and their rollback() undoes only their own statements, so a method
+that catches its own error doesn't poison the rest of the request. In-memory
+write-through (caches, directory, events) is registered with Database._on_commit.
+It runs once the outer transaction has actually committed.
+"""
+
+from typing import Callable
+
+
+class UnitOfWork:
+    """One connection and transaction shared by everything on the current thread"""
+
+    def __init__(self, conn):
+        self.conn = conn            # Raw pooled connection
+        self.depth = 0              # Nested unit_of_work blocks currently open
+        self._savepoints = 0
+        self._after_commit = []     # Callables taking the committed connection
+        self.snapshot = False       # Reads share one snapshot (see Database.unit_of_work)
+
+    def after_commit(self, fn: Callable):
+        """Run fn(conn) after the outer transaction commits (dropped on rollback)"""
+        self._after_commit.append(fn)
+
+    def begin(self) -> 'ScopedConnection':
+        """Open a savepoint for one Database call (or a nested unit_of_work block)"""
+        self._savepoints += 1
+        name = f"uow_{self._savepoints}"
+        with self.conn.cursor() as cur:
+            cur.execute(f"SAVEPOINT {name}")
+        return ScopedConnection(self, name)
+
+    def commit(self):
+        """Commit the shared transaction, then run after-commit hooks"""
+        self.conn.commit()
+        hooks, self._after_commit = self._after_commit, []
+        for fn in hooks:
+            try:
+                fn(self.conn)
+            except Exception as e:
+                print(f"[DB] After-commit hook failed: {e}")
+
+    def rollback(self):
+        self._after_commit = []
+        self.conn.rollback()
+
+    def failed(self) -> bool:
+        """Did a statement fail, leaving the transaction unusable until rolled back? (Postgres only)"""
+        get_status = getattr(self.conn, 'get_transaction_status', None)
+        if get_status is None:
+            # sqlite3 (db_sqlite.py): a failed statement doesn't abort the transaction
+            return False
+        from psycopg2 import extensions
+        return get_status() == extensions.TRANSACTION_STATUS_INERROR
+
+    def pending_hooks(self) -> int:
+        return len(self._after_commit)
+
+    def truncate_hooks(self, count: int):
+        """Drop hooks registered after the first `count` (their savepoint was rolled back)"""
+        del self._after_commit[count:]
+
+
+class ScopedConnection:
+    """
+    Stand-in connection handed out inside a unit of work.
+    commit() releases its savepoint, rollback() rolls back to it; everything else
+    (cursor(), closed, ...) is delegated to the shared connection.
+    """
+
+    def __init__(self, uow: UnitOfWork, savepoint: str):
+        self.uow = uow
+        self.savepoint = savepoint
+        self.open = True
+        self._hooks_at_start = uow.pending_hooks()
+
+    def commit(self):
+        if self.open:
+            self._execute(f"RELEASE SAVEPOINT {self.savepoint}")
+            self.open = False
+
+    def rollback(self):
+        if self.open:
+            self._execute(f"ROLLBACK TO SAVEPOINT {self.savepoint}")
+            self._execute(f"RELEASE SAVEPOINT {self.savepoint}")
+            self.uow.truncate_hooks(self._hooks_at_start)
+            self.open = False
+
+    def release(self):
+        """
+        Called on return_connection: keep whatever the call did (read-only calls never
+        commit), unless it failed without rolling back, which would poison the transaction
+        """
+        if self.uow.failed():
+            self.rollback()
+        else:
+            self.commit()
+
+    def __getattr__(self, name):
+        return getattr(self.uow.conn, name)
+
+    def _execute(self, statement: str):
+        with self.uow.conn.cursor() as cur:
+            cur.execute(statement)
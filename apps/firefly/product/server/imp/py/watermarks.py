@@ -0,0 +1,172 @@
+"""
+In-memory "new content" watermarks for notification polling.
+Tracks the latest profile_completed_at and, per author, the latest created_at of
+their 'post'-template posts, so "anything new since T?" is a constant-time
+comparison instead of a COUNT(*) over users/posts.
+
+Every check returns True/False, or None when the watermarks can't answer
+(not seeded yet, unparseable timestamp, timezone mismatch) and the caller should
+ask the database instead.
+"""
+
+import threading
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+# Authors noted while unseeded before the notes are dropped (seeding keeps failing)
+_MAX_UNSEEDED_AUTHORS = 1000
+
+
+def parse_since(since: str) -> Optional[datetime]:
+    """Parse a client ISO8601 timestamp ('Z' suffix allowed); None if invalid"""
+    try:
+        return datetime.fromisoformat(since.strip().replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+
+
+def _comparable(since: datetime, watermark: datetime) -> Optional[datetime]:
+    """
+    Align `since` with the watermark the way Postgres would compare them.
+    A TIMESTAMP (naive) column ignores the zone of the literal, so an aware `since`
+    loses its tzinfo. A naive `since` against an aware column depends on the
+    session time zone, so it can't be answered here.
+    """
+    if watermark.tzinfo is None:
+        return since.replace(tzinfo=None)
+    if since.tzinfo is None:
+        return None
+    return since
+
+
+class ContentWatermarks:
+    """Latest profile completion and latest post per author"""
+
+    def __init__(self):
+        self.seeded = False
+        self.latest_profile_completed_at = None  # datetime | None
+        self._author_latest = {}                 # author email -> latest post created_at
+        self._top_authors = []                   # [(created_at, email)] newest two authors
+        self._unseeded_profile = None            # Latest profile completion seen while unseeded
+        self._unseeded_posts = {}                # author email -> latest post seen while unseeded
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.answered = 0
+        self.fallbacks = 0
+
+    def seed(self, latest_profile_completed_at: Optional[datetime], author_latest: List[Tuple[str, datetime]]):
+        """Replace all state with values loaded from the database"""
+        with self._lock:
+            self.latest_profile_completed_at = latest_profile_completed_at
+            self._author_latest = {email: created_at for email, created_at in author_latest if created_at is not None}
+            ranked = sorted(((ts, email) for email, ts in self._author_latest.items()), reverse=True)
+            self._top_authors = ranked[:2]
+            self.seeded = True
+
+            # Writes that raced with the seed query; replaying is harmless (values only grow)
+            if self._unseeded_profile is not None:
+                self._apply_profile_completed(self._unseeded_profile)
+            for email, created_at in self._unseeded_posts.items():
+                self._apply_post(email, created_at)
+            self._unseeded_profile = None
+            self._unseeded_posts = {}
+
+    def invalidate(self):
+        """Drop state (e.g. after a delete); the next check reseeds from the database"""
+        with self._lock:
+            self.seeded = False
+
+    def note_profile_completed(self, completed_at: Optional[datetime]):
+        """A user's profile was just completed"""
+        if completed_at is None:
+            return
+        with self._lock:
+            if not self.seeded:
+                if self._unseeded_profile is None or completed_at > self._unseeded_profile:
+                    self._unseeded_profile = completed_at
+                return
+            self._apply_profile_completed(completed_at)
+
+    def note_post(self, author_email: str, created_at: Optional[datetime]):
+        """A 'post'-template post was just created"""
+        if created_at is None or not author_email:
+            return
+        with self._lock:
+            if not self.seeded:
+                previous = self._unseeded_posts.get(author_email)
+                if previous is None or created_at > previous:
+                    if previous is None and len(self._unseeded_posts) >= _MAX_UNSEEDED_AUTHORS:
+                        # Seeding keeps failing: the seed that finally succeeds reads these from the database
+                        self._unseeded_posts.clear()
+                    self._unseeded_posts[author_email] = created_at
+                return
+            self._apply_post(author_email, created_at)
+
+    def has_new_users(self, since: str) -> Optional[bool]:
+        """Has any profile been completed after `since`?"""
+        with self._lock:
+            if not self.seeded:
+                return self._fallback()
+            if self.latest_profile_completed_at is None:
+                return self._answer(False)
+
+            parsed = parse_since(since)
+            parsed = _comparable(parsed, self.latest_profile_completed_at) if parsed else None
+            if parsed is None:
+                return self._fallback()
+            return self._answer(self.latest_profile_completed_at > parsed)
+
+    def has_new_posts(self, since: str, exclude_email: str) -> Optional[bool]:
+        """Has anyone other than exclude_email created a post after `since`?"""
+        with self._lock:
+            if not self.seeded:
+                return self._fallback()
+
+            # Newest author that isn't the caller (the top two always contain one if any exist)
+            latest = next((ts for ts, email in self._top_authors if email != exclude_email), None)
+            if latest is None:
+                return self._answer(False)
+
+            parsed = parse_since(since)
+            parsed = _comparable(parsed, latest) if parsed else None
+            if parsed is None:
+                return self._fallback()
+            return self._answer(latest > parsed)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot for /api/health"""
+        with self._lock:
+            return {
+                'seeded': self.seeded,
+                'latest_profile_completed_at': self.latest_profile_completed_at.isoformat()
+                                               if self.latest_profile_completed_at else None,
+                'authors': len(self._author_latest),
+                'answered': self.answered,
+                'fallbacks': self.fallbacks
+            }
+
+    # Internal helpers (caller holds self._lock)
+
+    def _apply_profile_completed(self, completed_at: datetime):
+        if self.latest_profile_completed_at is None or completed_at > self.latest_profile_completed_at:
+            self.latest_profile_completed_at = completed_at
+
+    def _apply_post(self, author_email: str, created_at: datetime):
+        previous = self._author_latest.get(author_email)
+        if previous is not None and previous >= created_at:
+            return
+        self._author_latest[author_email] = created_at
+
+        # Per-author values only grow, so the new top two come from the old top two plus this author
+        candidates = {email: ts for ts, email in self._top_authors}
+        candidates[author_email] = created_at
+        self._top_authors = sorted(((ts, email) for email, ts in candidates.items()), reverse=True)[:2]
+
+    def _answer(self, value: bool) -> bool:
+        self.answered += 1
+        return value
+
+    def _fallback(self) -> None:
+        self.fallbacks += 1
+        return None
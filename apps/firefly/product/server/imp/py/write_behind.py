@@ -0,0 +1,176 @@
+"""
+Write-behind buffer for high-frequency, low-value timestamp writes.
+
+record_query_view (every /api/search) and the author's last_activity bump (every
+post) used to be a statement and a commit each. Instead, each write is kept here as
+the latest timestamp per key. A background thread hands the whole batch to a flush
+function every WRITE_BEHIND_FLUSH_MS, or sooner once WRITE_BEHIND_MAX_ENTRIES keys
+are pending, and the flush function writes them in one statement.
+
+Readers that must see a write before it reaches the database (badges, feeds)
+overlay get() on what they read. A failed flush keeps its entries for the next
+attempt. close() stops the thread and flushes what is left, so call it on shutdown;
+it is also registered with atexit for scripts. With WRITE_BEHIND=0 every put()
+flushes immediately (write-through, for comparison).
+"""
+
+import atexit
+import threading
+import time
+from typing import Callable, Dict, Any, Hashable, List, Optional, Tuple
+from datetime import datetime
+
+
+class WriteBehindBuffer:
+    """Latest timestamp per key, written in batches by a background thread"""
+
+    def __init__(
+        self,
+        name: str,
+        flush_fn: Callable[[List[Tuple[Hashable, datetime]]], None],
+        flush_ms: float = 500,
+        max_entries: int = 500,
+        enabled: bool = True
+    ):
+        """
+        Args:
+            name: Label for logs and stats
+            flush_fn: Writes a batch of (key, timestamp) pairs; raising keeps them for the next flush
+            flush_ms: Longest a write waits in the buffer
+            max_entries: Pending keys that trigger an early flush
+            enabled: False writes every put() through immediately
+        """
+        self.name = name
+        self.flush_fn = flush_fn
+        self.flush_interval = flush_ms / 1000.0
+        self.max_entries = max_entries
+        self.enabled = enabled
+
+        self._pending = {}                # key -> latest timestamp not yet written
+        self._in_flight = {}              # batch being written (still visible to get())
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # One flush at a time
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+
+        # Metrics
+        self.puts = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+
+    def put(self, key: Hashable, timestamp: datetime):
+        """Record timestamp for key (an older timestamp than one pending is ignored)"""
+        with self._lock:
+            self.puts += 1
+            existing = self._pending.get(key)
+            if existing is not None:
+                self.coalesced += 1
+                if existing >= timestamp:
+                    return
+            self._pending[key] = timestamp
+            pending = len(self._pending)
+            if self.enabled and not self._closed:
+                self._ensure_thread()
+
+        if not self.enabled or self._closed:
+            self.flush()
+        elif pending >= self.max_entries:
+            self._wake.set()
+
+    def get(self, key: Hashable) -> Optional[datetime]:
+        """Timestamp for key that may not be in the database yet, else None"""
+        with self._lock:
+            pending = self._pending.get(key)
+            in_flight = self._in_flight.get(key)
+        if pending is None or in_flight is None:
+            return pending or in_flight
+        return max(pending, in_flight)
+
+    @staticmethod
+    def newest(stored: Optional[datetime], buffered: Optional[datetime]) -> Optional[datetime]:
+        """The later of a value read from the database and get()'s value"""
+        if stored is None or buffered is None:
+            return buffered or stored
+        return max(stored, buffered)
+
+    def flush(self) -> int:
+        """Write everything pending now; returns the number of keys written"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+                self._in_flight = batch
+
+            started = time.perf_counter()
+            try:
+                self.flush_fn(list(batch.items()))
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                    # Put the batch back under anything newer that arrived meanwhile
+                    for key, timestamp in batch.items():
+                        newer = self._pending.get(key)
+                        if newer is None or newer < timestamp:
+                            self._pending[key] = timestamp
+                    self._in_flight = {}
+                print(f"[WRITE-BEHIND] {self.name}: flush of {len(batch)} failed, will retry: {e}")
+                return 0
+
+            with self._lock:
+                self._in_flight = {}
+                self.flushes += 1
+                self.rows_written += len(batch)
+                self.last_flush_ms = round(1000 * (time.perf_counter() - started), 2)
+            return len(batch)
+
+    def close(self):
+        """Stop the background thread and flush what is pending (safe to call twice)"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        self._wake.set()
+        if thread is not None:
+            thread.join(timeout=5)
+        self.flush()
+        with self._lock:
+            dropped = len(self._pending)
+        if dropped:
+            print(f"[WRITE-BEHIND] {self.name}: {dropped} writes not flushed on shutdown")
+
+    def stats(self) -> Dict[str, Any]:
+        """Metrics snapshot for /api/health"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'pending': len(self._pending) + len(self._in_flight),
+                'puts': self.puts,
+                'coalesced': self.coalesced,
+                'flushes': self.flushes,
+                'rows_written': self.rows_written,
+                'errors': self.errors,
+                'last_flush_ms': self.last_flush_ms,
+                'flush_ms': round(1000 * self.flush_interval),
+                'max_entries': self.max_entries
+            }
+
+    # Internal
+
+    def _ensure_thread(self):
+        """Start the flush thread on first use (caller holds the lock)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name=f"write-behind-{self.name}", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._closed:
+                break
+            self.flush()